@@ -1,20 +1,31 @@
+import asyncio
 import platform
 import threading
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-import psutil
-
+from . import executor, mode, relays, runtime as default_runtime, sysinfo, tracing, tuning
+from .channel import open_channel
+from .control import ControlServer, install_launcher
+from .idle import IdleMonitor
 from .config import Config
-from .state import SessionState
+from .profiler import Profiler
+from .outbox import PRIORITY_CHAT, PRIORITY_CONTROL, PRIORITY_CRITICAL, PRIORITY_HEARTBEAT, Outbox
+from .sampler import ResourceSampler
+from .state import SessionState, load_snapshot, write_snapshot
+from .transport import BaseTransport, format_stats, get_transport
 from .worker_client import WorkerClient
-from .runtime import get_server_details, perform_system_shutdown, start_remote_access
+from .rustdesk_config import detection_timings
 
 try:
     sys.stdout.reconfigure(encoding='utf-8')
 except Exception:
     pass
 
+# How long a timed-out warm-up gets to unwind after being cancelled.
+WARMUP_UNWIND_SECONDS = 10.0
+
 TEXTS = {
     'en': {
         'start': "👋 **Runner Ready**\n\nRustDesk session will be prepared on this machine.\nSelect duration to start:",
@@ -22,10 +33,18 @@ TEXTS = {
         'active_text': "🖥️ **SESSION READY**\n\n📍 **Location:** {country} ({ip})\n⚙️ **Specs:** {cpu} Cores / {ram}GB RAM\n💻 **OS:** {os}\n\nRustDesk and SSH endpoint have been sent via bot backend.",
         'timeout': "🛑 Duration limit reached. Shutting down session.",
         'max_limit': "⚠️ **Max Limit!** Cannot exceed 6 Hours.",
-        'status_info': "📊 **System Status**\nCPU: {cpu}%\nRAM: {ram}%\nTime Left: {left}m",
+        'status_info': "📊 **System Status**\nCPU: {cpu}% (avg 1m/5m/15m: {cpu_1m}/{cpu_5m}/{cpu_15m}%)\nRAM: {ram}% | Swap: {swap}%\nDisk: R {disk_r} / W {disk_w} KB/s\nNet: ↓ {net_rx} / ↑ {net_tx} KB/s\nTime Left: {left}m",
         'not_started': "⏳ Session has not started yet. Choose a duration first.",
         'already_starting': "⏳ Session is already starting/running.",
         'error': "❌ Error: {error}",
+        'profile_auto': "🎚️ Auto profile: **{profile}** ({mbps} Mbit/s measured)",
+        'idle_warn': "💤 **No activity for {idle}m.** The session will shut down in {left}m unless someone connects or taps a button.",
+        'idle_resumed': "✅ Activity detected, idle shutdown cancelled.",
+        'idle_shutdown': "💤 Idle for {idle}m (limit {limit}m). Shutting down early and releasing {reclaimed}m of runner time.",
+        'local_control': "💻 Inside the session: `gibrunner status` · `gibrunner extend` · `gibrunner kill`",
+        'resumed': "♻️ **Agent restarted** — session resumed, {left}m left.",
+        'relay_info': "🛰️ **RustDesk server:** ID server `{server}` · relay `{relay}` · key `{key}`\nSet these under Network in your RustDesk client before connecting.",
+        'tuning_info': "🧠 Swap: {swap} ({swap_before} → {swap_now} MB){workspace} | agent oom_score_adj {oom}\nPressure avg60: mem {psi_mem_before}% → {psi_mem}% · io {psi_io_before}% → {psi_io}%\nDisk since setup: R {read_mb} / W {write_mb} MB",
     }
 }
 
@@ -58,11 +77,53 @@ def get_duration_menu():
 
 
 class RunnerAgentApp:
-    def __init__(self, cfg: Config):
+    def __init__(self, cfg: Config, runtime=None, transport: BaseTransport | None = None):
         self.cfg = cfg
+        # `runtime` provides start_remote_access/perform_system_shutdown; the
+        # benchmarks swap in a fake that never touches RustDesk or tmate.
+        self.runtime = runtime or default_runtime
         self.state = SessionState()
-        self.worker = WorkerClient(cfg.worker_url, cfg.runner_secret, cfg.chat_id, cfg.run_id)
-        self._session_thread = None
+        self.worker = WorkerClient(
+            cfg.worker_url, cfg.runner_secret, cfg.chat_id, cfg.run_id,
+            transport=transport or get_transport(cfg.http_pool_size),
+        )
+        self._session_task = None
+        self._shutdown_task = None
+        self._early_updates: list[dict] = []
+        # Bumped by every start_remote_access run (warm-up or fresh); late
+        # updates from an abandoned run carry an older number and are dropped.
+        self._startup_generation = 0
+        self._pending_branches: set[str] = set()
+        self._trace_sent = False
+        self._command_stats = {"received": 0, "dropped_stale": 0}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._wake: asyncio.Event | None = None
+        # Set once the session has started (or ended); idle_loop waits on it.
+        self._session_ready: asyncio.Event | None = None
+        self._stopped: asyncio.Event | None = None
+        self.outbox = Outbox(self.worker, max_items=cfg.outbox_max_items)
+        self.sampler = ResourceSampler(interval=cfg.sample_seconds)
+        self.idle = None
+        if cfg.idle_minutes > 0:
+            self.idle = IdleMonitor(cfg.idle_minutes * 60, cfg.idle_warn_minutes * 60, cfg.idle_cpu_percent)
+        self._stop_summary: dict | None = None
+        self._agent_startup: dict | None = None
+        self._relay_report: dict | None = None
+        self._tuning_report: dict | None = None
+        self.control: ControlServer | None = None
+        self.profiler: Profiler | None = None
+        if cfg.profiler:
+            self.profiler = Profiler(
+                cfg.profiler_dir, interval=cfg.profiler_interval_ms / 1000, trace_malloc=cfg.profiler_malloc,
+            )
+        self._launcher: str | None = None
+        self._warm_cancel = threading.Event()
+        self._warm_done = threading.Event()
+        self._warm_started: float | None = None
+        self._warm_info: dict | None = None
+        self.state.add_listener(self._on_state_change)
+        self.state.add_listener(self._persist_state)
 
     def is_web_mode(self) -> bool:
         # Web-only sessions use synthetic owner refs like "web:<user_id>".
@@ -70,23 +131,127 @@ class RunnerAgentApp:
         # be automatic instead of waiting for button commands.
         return str(self.cfg.chat_id or "").startswith("web:")
 
-    def safe_send(self, text, reply_markup=None):
+    def _loop_running(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+
+    def _on_loop_thread(self) -> bool:
         try:
-            self.worker.send_bot_message(text, reply_markup=reply_markup)
-        except Exception:
-            pass
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _submit(self, fn, *args) -> None:
+        # Everything that touches loop objects goes through here so the
+        # session thread, the poll executor and the loop itself can all call
+        # the same synchronous API.
+        if not self._loop_running():
+            fn(*args)
+        elif self._on_loop_thread():
+            fn(*args)
+        else:
+            self._loop.call_soon_threadsafe(fn, *args)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _start_background(self, fn):
+        if not self._loop_running():
+            thread = threading.Thread(target=fn, daemon=True)
+            thread.start()
+            return thread
+        if self._on_loop_thread():
+            return self._spawn(asyncio.to_thread(fn))
+        return asyncio.run_coroutine_threadsafe(asyncio.to_thread(fn), self._loop)
+
+    def _on_state_change(self) -> None:
+        if self._wake is None or not self._loop_running():
+            return
+        self._submit(self._wake.set)
+        if self.state.session_started or not self.state.active:
+            self._submit(self._session_ready.set)
+        if not self.state.active:
+            self._submit(self._stopped.set)
+
+    def _persist_state(self) -> None:
+        if self.cfg.state_path:
+            write_snapshot(self.cfg.state_path, self.state.snapshot(self.cfg.run_id))
+
+    async def resume_from_snapshot(self) -> bool:
+        # A restarted agent (crash, OOM kill, manual restart) picks the session
+        # back up from its last snapshot instead of provisioning again, as
+        # long as RustDesk is still serving the same ID.
+        if not self.cfg.state_path:
+            return False
+        started = time.monotonic()
+        snap = load_snapshot(self.cfg.state_path, self.cfg.run_id)
+        if snap is None:
+            return False
+        endpoints = snap.get("endpoints") or {}
+        if not snap.get("started") or not endpoints.get("rustdesk_id"):
+            print("Snapshot: startup never finished, starting fresh")
+            return False
+        # Probing RustDesk/tmate runs processes; keep it off the event loop.
+        alive = await asyncio.to_thread(self.runtime.check_remote_access, self.cfg.system_os, endpoints)
+        if not alive.get("rustdesk"):
+            print("Snapshot: RustDesk is not running anymore, starting fresh")
+            return False
+        if endpoints.get("tmate_ssh") and not alive.get("tmate"):
+            endpoints = {**endpoints, "tmate_ssh": None, "tmate_web": None}
+            snap = {**snap, "endpoints": endpoints, "endpoint_delivery": "pending"}
+        self._trace_sent = True
+        self.state.restore(snap)
+        if snap.get("endpoint_delivery") != "delivered":
+            self.send_endpoint_to_worker(self.state.endpoints())
+        self.safe_send(t(self.cfg, 'resumed').format(left=self.state.remaining_minutes()), reply_markup=get_control_menu())
+        print(
+            f"Snapshot: resumed in {(time.monotonic() - started) * 1000:.1f}ms "
+            f"(extensions={snap.get('extensions')} tmate={'up' if alive.get('tmate') else 'down'})"
+        )
+        return True
+
+    def _enqueue(self, kind, path, body, priority, replace=False, on_done=None) -> bool:
+        accepted = self.outbox.put(kind, path, body, priority=priority, replace=replace, on_done=on_done)
+        if accepted and not self._loop_running():
+            # No sender task without a loop; deliver inline for sync callers.
+            self.outbox.flush_sync()
+        return accepted
+
+    def safe_send(self, text, reply_markup=None):
+        self._enqueue("message", "/runner-message", self.worker.message_body(text, reply_markup), PRIORITY_CHAT)
 
     def register_session(self):
-        try:
-            self.worker.register_session()
-        except Exception:
-            pass
+        self._enqueue(
+            "register", "/register-session", self.worker.register_body(), PRIORITY_CONTROL,
+            on_done=self._on_registered,
+        )
+
+    def _on_registered(self, ok: bool) -> None:
+        # Interpreter launch -> first /register-session answered, per agent
+        # mode (full: requests+psutil, lite: http.client+/proc).
+        if self._agent_startup is not None or not ok:
+            return
+        age = sysinfo.process_age()
+        self._agent_startup = {**mode.describe(), "register_ms": None if age is None else round(age * 1000, 1)}
+        print(f"Agent startup: {self._agent_startup}")
 
     def stop_session_in_worker(self):
-        try:
-            self.worker.stop_session()
-        except Exception:
-            pass
+        summary = dict(self._stop_summary or {})
+        if self._relay_report:
+            summary["relay"] = self._relay_report
+        self._enqueue("stop", "/end-session", self.worker.stop_body(summary or None), PRIORITY_CRITICAL)
+
+    def send_heartbeat(self):
+        idle = self.idle.summary() if self.idle is not None and self.state.session_started else None
+        body = self.worker.heartbeat_body(metrics=self.sampler.summary(), idle=idle)
+        self._enqueue("heartbeat", "/heartbeat", body, PRIORITY_HEARTBEAT, replace=True)
+
+    def _on_endpoint_delivered(self, ok: bool) -> None:
+        self.state.set_endpoint_delivery("delivered" if ok else "failed")
+        if not ok:
+            self.safe_send(t(self.cfg, 'error').format(error="Failed to send endpoint to worker"))
 
     def send_endpoint_to_worker(self, endpoint_payload: dict):
         payload = {
@@ -96,7 +261,14 @@ class RunnerAgentApp:
             "tmate_ssh": endpoint_payload.get("tmate_ssh"),
             "tmate_web": endpoint_payload.get("tmate_web"),
         }
-        self.worker.send_session_endpoint(payload)
+        if endpoint_payload.get("rustdesk_server"):
+            # Only present for a self-hosted server; the default needs nothing.
+            payload["rustdesk_server"] = endpoint_payload["rustdesk_server"]
+        self.state.set_endpoint_delivery("pending")
+        self._enqueue(
+            "endpoint", "/session-endpoint", self.worker.endpoint_body(payload), PRIORITY_CRITICAL,
+            on_done=self._on_endpoint_delivered,
+        )
 
     def process_text(self, text: str):
         text = text.strip()
@@ -107,32 +279,30 @@ class RunnerAgentApp:
             return
         # No CRD/PIN flow anymore. Ignore plain text to avoid leaking secrets.
 
+    def _touch_idle(self, reason: str) -> None:
+        # Any chat command counts as someone being around.
+        if self.idle is not None and self.idle.touch(reason):
+            self.safe_send(t(self.cfg, 'idle_resumed'))
+
     def process_callback(self, data: str):
+        if data != "kill":
+            self._touch_idle("command")
         if data.startswith("time_"):
             mins = int(data.split("_")[1])
             if mins > self.cfg.max_duration_minutes:
                 self.safe_send(t(self.cfg, 'max_limit'))
                 return
             with self.state.lock:
-                if self.state.session_started or self._session_thread:
+                if self.state.session_started or self._session_task:
                     self.safe_send(t(self.cfg, 'already_starting'))
                     return
                 self.state.set_duration(mins)
             self.safe_send(t(self.cfg, 'starting'))
-            self._session_thread = threading.Thread(target=self.run_session_process, daemon=True)
-            self._session_thread.start()
+            self._session_task = self._start_background(self.run_session_process)
             return
 
         if data == "extend":
-            if self.state.start_time is None:
-                self.safe_send(t(self.cfg, 'not_started'))
-                return
-            with self.state.lock:
-                if self.state.duration + 30 > self.cfg.max_duration_minutes:
-                    self.safe_send(t(self.cfg, 'max_limit'))
-                else:
-                    self.state.extend(30)
-                    self.safe_send("✅ +30 Mins", reply_markup=get_control_menu())
+            self.extend_session()
             return
 
         if data == "info":
@@ -140,9 +310,10 @@ class RunnerAgentApp:
             if remaining is None:
                 self.safe_send(t(self.cfg, 'not_started'), reply_markup=get_control_menu())
                 return
-            cpu = psutil.cpu_percent()
-            ram = psutil.virtual_memory().percent
-            msg = t(self.cfg, 'status_info').format(cpu=cpu, ram=ram, left=max(0, remaining))
+            msg = t(self.cfg, 'status_info').format(left=max(0, remaining), **self.status_values())
+            tuning_text = self._tuning_text()
+            if tuning_text:
+                msg += "\n" + tuning_text
             self.safe_send(msg, reply_markup=get_control_menu())
             return
 
@@ -151,78 +322,574 @@ class RunnerAgentApp:
             self.perform_shutdown()
             return
 
+    def extend_session(self, source: str | None = None) -> str:
+        # Shared by the chat button and the local control socket; the chat
+        # message is how a local extend reaches the worker/bot.
+        if self.state.start_time is None:
+            self.safe_send(t(self.cfg, 'not_started'))
+            return "not_started"
+        with self.state.lock:
+            if self.state.duration + 30 > self.cfg.max_duration_minutes:
+                self.safe_send(t(self.cfg, 'max_limit'))
+                return "max_limit"
+            self.state.extend(30)
+        suffix = f" ({source})" if source else ""
+        self.safe_send(f"✅ +30 Mins{suffix}", reply_markup=get_control_menu())
+        return "extended"
+
+    def handle_control(self, request: dict):
+        # Runs on the loop thread; everything here is in-memory, anything
+        # for the worker goes through the outbox. The profile dump writes
+        # files and snapshots tracemalloc, so it is handed back as a coroutine.
+        cmd = request.get("cmd")
+        if cmd == "profile":
+            if self.profiler is None:
+                return {"ok": False, "error": "profiler is off (set AGENT_PROFILER=1)"}
+            return self._dump_profile("on demand")
+        if cmd != "kill":
+            self._touch_idle("local")
+        result = None
+        if cmd == "extend":
+            result = self.extend_session(source="from runner")
+        elif cmd == "kill":
+            self.safe_send("💀 Shutdown... (from runner)", reply_markup=None)
+            self.perform_shutdown()
+            result = "shutting_down"
+        with self.state.lock:
+            base = {
+                "ok": result in (None, "extended", "shutting_down"),
+                "remaining_minutes": self.state.remaining_minutes(),
+                "duration": self.state.duration,
+                "deadline": self.state.deadline(),
+            }
+        if result is not None:
+            return {**base, "result": result}
+        if cmd == "remaining":
+            return base
+        endpoints = self.state.endpoints()
+        with self.state.lock:
+            status = {
+                **base,
+                "active": self.state.active,
+                "started": self.state.session_started,
+                "warmup": self.state.warmup,
+                "extensions": self.state.extensions,
+                "rustdesk_id": endpoints.get("rustdesk_id"),
+                "tmate_ssh": endpoints.get("tmate_ssh"),
+                "tmate_web": endpoints.get("tmate_web"),
+            }
+        current = self.sampler.current()
+        status["metrics"] = {k: current.get(k) for k in ("cpu", "ram", "swap")} if current else {}
+        if self.idle is not None and self.state.session_started:
+            status["idle"] = self.idle.summary()
+        return status
+
+    async def _start_control(self) -> None:
+        if not self.cfg.control_socket:
+            return
+        server = ControlServer(self.cfg.control_socket, self.handle_control)
+        try:
+            await server.start()
+        except Exception as exc:
+            print(f"control socket unavailable: {exc}")
+            return
+        self.control = server
+        self._launcher = install_launcher(self.cfg.control_socket)
+
+    def status_values(self) -> dict:
+        if not self.sampler.has_data():
+            self.sampler.sample()
+        current = self.sampler.current()
+        aggs = self.sampler.aggregates()
+
+        def avg(window: str, name: str):
+            return aggs.get(window, {}).get(name, {}).get("avg", "-")
+
+        return {
+            "cpu": current.get("cpu", "-"),
+            "cpu_1m": avg("1m", "cpu"),
+            "cpu_5m": avg("5m", "cpu"),
+            "cpu_15m": avg("15m", "cpu"),
+            "ram": current.get("ram", "-"),
+            "swap": current.get("swap", "-"),
+            "disk_r": current.get("disk_read_kbps", "-"),
+            "disk_w": current.get("disk_write_kbps", "-"),
+            "net_rx": current.get("net_rx_kbps", "-"),
+            "net_tx": current.get("net_tx_kbps", "-"),
+        }
+
+    def _tuning_text(self) -> str | None:
+        # Numbers captured before swap/tmpfs setup against the live ones.
+        report = self._tuning_report
+        if not report or "before" not in report:
+            return None
+        before, now = report["before"], tuning.snapshot()
+        swap = report.get("swap") or {}
+        workspace = report.get("workspace") or {}
+        dash = lambda value: "-" if value is None else value
+        delta = lambda key: "-" if now.get(key) is None or before.get(key) is None else now[key] - before[key]
+        return t(self.cfg, 'tuning_info').format(
+            swap=f"{swap.get('kind', report.get('mode'))} {swap.get('state', '')}".strip(),
+            swap_before=dash(before.get("swap_total_mb")),
+            swap_now=dash(now.get("swap_total_mb")),
+            workspace=f" | tmpfs {workspace['path']}" if workspace.get("state") in ("mounted", "present") else "",
+            oom=dash(report.get("oom_score_adj")),
+            psi_mem_before=dash(before.get("psi_memory_some_avg60")),
+            psi_mem=dash(now.get("psi_memory_some_avg60")),
+            psi_io_before=dash(before.get("psi_io_some_avg60")),
+            psi_io=dash(now.get("psi_io_some_avg60")),
+            read_mb=delta("disk_read_mb"),
+            write_mb=delta("disk_write_mb"),
+        )
+
     def perform_shutdown(self):
+        self._cancel_warmup()
         self.state.stop()
+        if self._loop_running():
+            self._submit(self._begin_shutdown)
+            return
         self.stop_session_in_worker()
+        self._print_delivery_stats()
         time.sleep(2)
-        perform_system_shutdown(self.cfg.system_os)
+        self.runtime.perform_system_shutdown(self.cfg.system_os)
 
-    def run_session_process(self):
-        try:
-            endpoint_payload = start_remote_access(self.cfg.system_os, self.cfg.rustdesk_password)
-            self.state.mark_started()
-            self.state.set_endpoints(
-                endpoint_payload.get("rustdesk_id"),
-                endpoint_payload.get("rustdesk_password"),
-                endpoint_payload.get("tmate_ssh"),
-                endpoint_payload.get("tmate_web"),
-            )
+    async def _dump_profile(self, reason: str) -> dict:
+        return {"ok": True, **await asyncio.to_thread(self.profiler.dump, reason)}
+
+    def _print_delivery_stats(self) -> None:
+        print(f"Transport: {format_stats(self.worker.transport_stats())}")
+        print(f"Outbox: {self.outbox.metrics()}")
+        print(f"Updates: {self._command_stats}")
+        print(f"Commands: {executor.command_summary()}")
+        if self.profiler is not None:
             try:
-                self.send_endpoint_to_worker(endpoint_payload)
+                self.profiler.dump("shutdown")
             except Exception as exc:
-                self.safe_send(t(self.cfg, 'error').format(error=f"Failed to send endpoint to worker: {exc}"))
+                print(f"profiler dump failed: {exc}")
+
+    def _begin_shutdown(self) -> None:
+        if self._shutdown_task is None:
+            self._shutdown_task = self._spawn(self._shutdown_async())
+
+    async def _shutdown_async(self):
+        # Let queued chat (e.g. the kill/timeout notice) land before the worker
+        # closes the session; end-session itself outranks chat in the queue.
+        await self.outbox.flush(timeout=10)
+        self.stop_session_in_worker()
+        await self.outbox.flush(timeout=15)
+        self._print_delivery_stats()
+        await asyncio.to_thread(self.runtime.perform_system_shutdown, self.cfg.system_os)
+
+    def _start_warmup(self) -> None:
+        with self.state.lock:
+            if self.state.warmup != "none" or self.state.session_started or self._session_task:
+                return
+            self.state.set_warmup("running")
+        self._warm_started = time.monotonic()
+        generation = self._next_startup_generation()
+        self._start_background(lambda: self._warm_up(generation))
+
+    def _next_startup_generation(self) -> int:
+        with self.state.lock:
+            self._startup_generation += 1
+            self._early_updates = []
+            return self._startup_generation
+
+    def _warm_up(self, generation: int) -> None:
+        # Nothing in start_remote_access depends on the duration, so all of it
+        # runs while the user is still reading the menu. Late branches go
+        # through _on_startup_update, which holds them until the session
+        # starts.
+        tracing.reset_tracer()
+        tracing.import_phase_file(self.cfg.phases_file)
+        try:
+            with tracing.span("session.startup", os=self.cfg.system_os, speculative=True):
+                payload = self.runtime.start_remote_access(
+                    self.cfg.system_os, self.cfg.rustdesk_password,
+                    on_update=lambda update: self._on_startup_update(update, generation),
+                    profile=self.cfg.profile, cancel=self._warm_cancel,
+                )
+            status = "ready"
+        except Exception as exc:
+            payload = None
+            status = "cancelled" if self._warm_cancel.is_set() else "failed"
+            print(f"Warm-up {status}: {exc}")
+        with self.state.lock:
+            if self._warm_cancel.is_set():
+                payload, status = None, "cancelled"
+            self.state.set_warmup(status, payload)
+        if status == "cancelled":
+            # Before _warm_done: a fresh start waiting on it must not have
+            # its tmate session torn down underneath it.
+            self.runtime.cancel_remote_access(self.cfg.system_os)
+        self._warm_info = {"status": status, "warm_ms": round((time.monotonic() - self._warm_started) * 1000, 1)}
+        self._warm_done.set()
+        print(f"Warm-up: {self._warm_info}")
+
+    def _claim_warmup(self) -> dict | None:
+        # Runs on the session thread right after the duration pick: waits for
+        # a warm-up still in flight and takes its result. A failed warm-up
+        # returns None and the caller starts from scratch, as does one still
+        # running after warmup_wait_seconds, which is cancelled first.
+        if self.state.warmup == "none":
+            return None
+        chosen = time.monotonic()
+        if not self._warm_done.wait(self.cfg.warmup_wait_seconds):
+            print(f"Warm-up still running after {self.cfg.warmup_wait_seconds}s, cancelling")
+            self._warm_cancel.set()
+            self.safe_send(t(self.cfg, 'error').format(
+                error=f"remote access setup stalled for {self.cfg.warmup_wait_seconds}s, starting it again",
+            ))
+            # Cancelled commands die within a poll interval; give the warm-up
+            # a moment to unwind so the two startups do not overlap.
+            self._warm_done.wait(WARMUP_UNWIND_SECONDS)
+            self._warm_info = {**(self._warm_info or {}), "status": "timed out"}
+        result = self.state.take_warm_result() if self._warm_done.is_set() else None
+        info = self._warm_info or {}
+        waited = time.monotonic() - chosen
+        info.update(
+            wait_ms=round(waited * 1000, 1),
+            head_start_ms=round((chosen - self._warm_started) * 1000, 1),
+            used=result is not None,
+        )
+        print(f"Warm-up claimed: {info}")
+        return result
+
+    def _cancel_warmup(self) -> None:
+        with self.state.lock:
+            status = self.state.warmup
+            if status not in ("running", "ready") or self.state.session_started:
+                return
+            print(f"Warm-up cancelled ({status})")
+            self._warm_cancel.set()
+            if status == "ready":
+                # Finished but never claimed: nothing is in flight, so tear
+                # down here instead of in _warm_up.
+                self.state.set_warmup("cancelled")
+        if status == "ready":
+            self._start_background(lambda: self.runtime.cancel_remote_access(self.cfg.system_os))
 
-            country, ip, cpu, ram, os_ver = get_server_details()
-            msg_text = t(self.cfg, 'active_text').format(country=country, ip=ip, cpu=cpu, ram=ram, os=os_ver)
-            self.safe_send(msg_text, reply_markup=get_control_menu())
-            self.monitor_loop()
+    def run_session_process(self):
+        endpoint_payload = self._claim_warmup()
+        if not self.state.active:
+            return
+        if endpoint_payload is None:
+            tracing.reset_tracer()
+            tracing.import_phase_file(self.cfg.phases_file)
+        try:
+            if endpoint_payload is None:
+                # Whatever an abandoned warm-up still reports (tmate,
+                # server details) must not land on top of this run.
+                generation = self._next_startup_generation()
+                with tracing.span("session.startup", os=self.cfg.system_os):
+                    endpoint_payload = self.runtime.start_remote_access(
+                        self.cfg.system_os, self.cfg.rustdesk_password,
+                        on_update=lambda update: self._on_startup_update(update, generation),
+                        profile=self.cfg.profile,
+                    )
+            with self.state.lock:
+                self.state.mark_started()
+                self.state.set_endpoints(
+                    endpoint_payload.get("rustdesk_id"),
+                    endpoint_payload.get("rustdesk_password"),
+                    endpoint_payload.get("tmate_ssh"),
+                    endpoint_payload.get("tmate_web"),
+                )
+                self.state.set_rustdesk_server(endpoint_payload.get("rustdesk_server"))
+                self._pending_branches = set(endpoint_payload.get("pending") or [])
+                early, self._early_updates = self._early_updates, []
+            self.send_endpoint_to_worker(endpoint_payload)
+            self._report_profile(endpoint_payload.get("profile"))
+            self._relay_report = endpoint_payload.get("relay")
+            if "tuning" in endpoint_payload:
+                self._tuning_report = endpoint_payload["tuning"]
+            if "server_details" in endpoint_payload:
+                self._send_active_text(endpoint_payload["server_details"])
+            for update in early:
+                self._apply_startup_update(update)
+            self._maybe_send_trace()
         except Exception as exc:
             self.safe_send(t(self.cfg, 'error').format(error=str(exc)))
+            self._maybe_send_trace(force=True)
 
-    def monitor_loop(self):
-        while self.state.active:
-            remaining = self.state.remaining_minutes()
-            if remaining is not None and remaining <= 0:
-                self.safe_send(t(self.cfg, 'timeout'))
-                self.perform_shutdown()
-                break
-            time.sleep(30)
+    def _report_profile(self, report: dict | None) -> None:
+        if not report:
+            return
+        print(f"Profile: {report}")
+        if report.get("requested") == "auto":
+            mbps = report.get("mbps")
+            self.safe_send(t(self.cfg, 'profile_auto').format(profile=report.get("profile"), mbps="?" if mbps is None else mbps))
+
+    def _maybe_send_trace(self, force: bool = False) -> None:
+        # One timeline per session, sent once every deferred startup branch
+        # (tmate, ip/spec lookup) has reported back.
+        with self.state.lock:
+            if self._trace_sent or (self._pending_branches and not force):
+                return
+            self._trace_sent = True
+        payload = tracing.get_tracer().to_payload()
+        payload["rustdesk_detections"] = detection_timings()
+        if self._agent_startup is not None:
+            payload["agent_startup"] = self._agent_startup
+        if self._warm_info is not None:
+            payload["warmup"] = self._warm_info
+        if self._relay_report is not None:
+            payload["relay"] = self._relay_report
+        if self._tuning_report is not None:
+            payload["tuning"] = self._tuning_report
+        extra = {"run_id": self.cfg.run_id, "os": self.cfg.system_os}
+        tracing.get_tracer().write_json(self.cfg.trace_path, extra=extra)
+        self._enqueue("trace", "/session-trace", self.worker.trace_body(payload), PRIORITY_CONTROL)
+        print(f"Startup trace: total={payload['total_ms']}ms phases={payload['phases']}")
+
+    def _on_startup_update(self, update: dict, generation: int) -> None:
+        # Late results (tmate, ip/spec lookup) can land before
+        # run_session_process has recorded the RustDesk endpoint.
+        with self.state.lock:
+            if generation != self._startup_generation:
+                print(f"Dropping late {update.get('branch', 'startup')} update from an abandoned startup")
+                return
+            if not self.state.session_started:
+                self._early_updates.append(update)
+                return
+        self._apply_startup_update(update)
 
-    def poll_loop(self):
-        self.register_session()
-        if self.is_web_mode():
+    def _apply_startup_update(self, update: dict) -> None:
+        if "tmate_ssh" in update:
             with self.state.lock:
-                if not self.state.session_started and not self._session_thread:
-                    self.state.set_duration(min(self.cfg.requested_duration_minutes, self.cfg.max_duration_minutes))
-                    self._session_thread = threading.Thread(target=self.run_session_process, daemon=True)
-                    self._session_thread.start()
-        else:
-            self.safe_send(t(self.cfg, 'start'), reply_markup=get_duration_menu())
-        try:
-            self.worker.heartbeat(force=True)
-        except Exception:
-            pass
+                self.state.set_endpoints(
+                    self.state.rustdesk_id, self.state.rustdesk_password,
+                    update.get("tmate_ssh"), update.get("tmate_web"),
+                )
+                payload = self.state.endpoints()
+            if update.get("tmate_ssh"):
+                self.send_endpoint_to_worker(payload)
+        if "server_details" in update:
+            self._send_active_text(update["server_details"])
+        if "tuning" in update:
+            self._tuning_report = update["tuning"]
+        if "branch" in update:
+            with self.state.lock:
+                self._pending_branches.discard(update["branch"])
+            self._maybe_send_trace()
+
+    def _send_active_text(self, details) -> None:
+        country, ip, cpu, ram, os_ver = details
+        msg_text = t(self.cfg, 'active_text').format(country=country, ip=ip, cpu=cpu, ram=ram, os=os_ver)
+        with self.state.lock:
+            server = dict(self.state.rustdesk_server)
+        if server:
+            msg_text += "\n\n" + t(self.cfg, 'relay_info').format(
+                server=server.get("custom-rendezvous-server"), relay=server.get("relay-server"), key=server.get("key") or "-",
+            )
+        if self._launcher:
+            msg_text += "\n" + t(self.cfg, 'local_control')
+        self.safe_send(msg_text, reply_markup=get_control_menu())
 
+    async def deadline_loop(self):
+        # Sleeps until the exact deadline; extend/stop wake it through the
+        # SessionState listener so the new deadline applies immediately.
         while self.state.active:
+            self._wake.clear()
+            deadline = self.state.deadline()
+            if deadline is None:
+                await self._wake.wait()
+                continue
+            delay = deadline - time.time()
+            if delay <= 0:
+                self.safe_send(t(self.cfg, 'timeout'))
+                self.perform_shutdown()
+                return
             try:
-                self.worker.heartbeat(force=False)
-            except Exception:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
                 pass
 
+    async def idle_loop(self):
+        # Only runs the session's clock down early; the deadline still applies.
+        interval = self.cfg.idle_check_seconds
+        if self.state.active and not self.state.session_started:
+            await self._session_ready.wait()
+        if self.idle is None or not self.state.active:
+            return
+        self.idle.touch("session ready")
+        while self.state.active:
+            await asyncio.sleep(interval)
             try:
-                data = self.worker.poll_updates()
-                if data and "payload" in data:
-                    ctype = data.get("command_type")
-                    payload = data.get("payload") or ""
-                    log_payload = "***" if payload.isdigit() else payload
-                    print(f"Recv: {ctype} -> {log_payload}")
-                    if ctype == "text":
-                        self.process_text(payload)
-                    elif ctype == "callback":
-                        self.process_callback(payload)
-            except Exception:
-                pass
-            time.sleep(self.cfg.poll_seconds)
+                relay_port = relays.relay_port(self.state.rustdesk_server)
+                activity = await asyncio.to_thread(self.runtime.session_activity, self.cfg.system_os, relay_port)
+            except Exception as exc:
+                print(f"idle check failed: {exc}")
+                continue
+            activity["cpu"] = self.sampler.aggregates().get("1m", {}).get("cpu", {}).get("avg")
+            event = self.idle.observe(activity)
+            if event == "resumed":
+                self.safe_send(t(self.cfg, 'idle_resumed'))
+            elif event == "warn":
+                idle_m = int(self.idle.idle_for() // 60)
+                left = max(1, round((self.idle.idle_seconds - self.idle.idle_for()) / 60))
+                self.safe_send(t(self.cfg, 'idle_warn').format(idle=idle_m, left=left), reply_markup=get_control_menu())
+            elif event == "shutdown":
+                self._idle_shutdown()
+                return
+
+    def _idle_shutdown(self) -> None:
+        reclaimed = max(0, self.state.remaining_minutes() or 0)
+        summary = self.idle.summary()
+        self._stop_summary = {"reason": "idle", "reclaimed_minutes": reclaimed, "idle": summary}
+        print(f"Idle shutdown: {self._stop_summary}")
+        self.safe_send(t(self.cfg, 'idle_shutdown').format(
+            idle=int(summary["idle_s"] // 60), limit=summary["idle_minutes"], reclaimed=reclaimed,
+        ))
+        self.perform_shutdown()
+
+    async def heartbeat_loop(self):
+        interval = max(1, self.cfg.heartbeat_seconds)
+        next_at = time.monotonic()
+        while self.state.active:
+            self.send_heartbeat()
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+    async def poll_loop(self, poll_pool: ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        channel = await loop.run_in_executor(
+            poll_pool, open_channel, self.worker, self.cfg.command_channel, self.cfg.poll_seconds, self.cfg.long_poll_seconds,
+        )
+        print(f"Command channel: {channel.name}")
+        try:
+            while self.state.active:
+                # The channel does its own waiting: short polling sleeps
+                # poll_seconds, long-poll/SSE block until the worker pushes.
+                commands = await loop.run_in_executor(poll_pool, channel.next_commands)
+                keep = self.collapse_commands(commands)
+                for data in commands:
+                    if not self.state.active:
+                        break
+                    if any(data is k for k in keep):
+                        try:
+                            self.dispatch_command(data)
+                        except Exception:
+                            pass
+                    # Dropped commands are acked too; they were handled by
+                    # being superseded.
+                    channel.ack(data)
+        finally:
+            # Closing an SSE response waits for the poll thread's pending read
+            # (up to a ping interval); never do that on the loop thread.
+            threading.Thread(target=channel.close, name="channel-close", daemon=True).start()
+
+    def collapse_commands(self, commands: list[dict]) -> list[dict]:
+        # A batch is what the user tapped while we were away. Replaying it
+        # verbatim would answer every duplicate tap, so only the commands
+        # that can still change something are kept, in order.
+        self._command_stats["received"] += len(commands)
+        if len(commands) < 2:
+            return commands
+        with self.state.lock:
+            started = self.state.start_time is not None
+            duration = self.state.duration
+        extend_room = max(0, (self.cfg.max_duration_minutes - duration) // 30) if started else 0
+        kept: list[dict] = []
+        seen_start = limit_reported = False
+        last_info = None
+        for data in commands:
+            payload = data.get("payload") or ""
+            if data.get("command_type") == "callback":
+                if payload.startswith("time_"):
+                    # The first duration wins; later ones would only answer
+                    # "already starting".
+                    if seen_start:
+                        continue
+                    seen_start = True
+                    if not started:
+                        try:
+                            extend_room = max(0, (self.cfg.max_duration_minutes - int(payload.split("_")[1])) // 30)
+                            started = True
+                        except ValueError:
+                            pass
+                elif payload == "extend":
+                    # Keep the extends that fit, plus one to report the limit.
+                    if extend_room > 0:
+                        extend_room -= 1
+                    elif limit_reported:
+                        continue
+                    else:
+                        limit_reported = True
+                elif payload == "info":
+                    # One status reply, after everything else in the batch
+                    # has been applied.
+                    last_info = data
+                    continue
+                elif payload == "kill":
+                    kept.append(data)
+                    break
+            kept.append(data)
+        if last_info is not None and not any(d.get("payload") == "kill" for d in kept):
+            kept.append(last_info)
+        self._command_stats["dropped_stale"] += len(commands) - len(kept)
+        return kept
+
+    def dispatch_command(self, data: dict):
+        ctype = data.get("command_type")
+        payload = data.get("payload") or ""
+        log_payload = "***" if payload.isdigit() else payload
+        print(f"Recv: {ctype} -> {log_payload}")
+        if ctype == "text":
+            self.process_text(payload)
+        elif ctype == "callback":
+            self.process_callback(payload)
+
+    async def run_async(self):
+        self._loop = asyncio.get_running_loop()
+        if self.profiler is not None:
+            self.profiler.start()
+        self._wake = asyncio.Event()
+        self._session_ready = asyncio.Event()
+        self._stopped = asyncio.Event()
+        # Blocking channel reads get their own thread so a long-poll hold
+        # never starves the default executor used for sends and heartbeats.
+        poll_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="poll")
+        self._spawn(self.outbox.run())
+        self._spawn(self.sampler.run())
+        await self._start_control()
+
+        self.register_session()
+        if not await self.resume_from_snapshot():
+            if self.is_web_mode():
+                with self.state.lock:
+                    if not self.state.session_started and not self._session_task:
+                        self.state.set_duration(min(self.cfg.requested_duration_minutes, self.cfg.max_duration_minutes))
+                        self._session_task = self._start_background(self.run_session_process)
+            else:
+                self.safe_send(t(self.cfg, 'start'), reply_markup=get_duration_menu())
+                if self.cfg.warmup:
+                    self._start_warmup()
+
+        workers = [
+            self._spawn(self.heartbeat_loop()),
+            self._spawn(self.deadline_loop()),
+            self._spawn(self.idle_loop()),
+            self._spawn(self.poll_loop(poll_pool)),
+        ]
+        try:
+            if self.state.active:
+                await self._stopped.wait()
+        finally:
+            for task in workers:
+                task.cancel()
+            if self._shutdown_task is not None:
+                await asyncio.gather(self._shutdown_task, return_exceptions=True)
+            else:
+                await self.outbox.flush(timeout=10)
+            for task in list(self._tasks):
+                task.cancel()
+            if self.control is not None:
+                await self.control.close()
+            poll_pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        asyncio.run(self.run_async())
 
 
 def main():
@@ -230,7 +897,7 @@ def main():
     if not cfg.chat_id or not cfg.worker_url or not cfg.runner_secret:
         raise RuntimeError("Missing TG_CHATID, WORKER_URL, or SESSION_SECRET")
     app = RunnerAgentApp(cfg)
-    app.poll_loop()
+    app.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,35 @@
+import argparse
+import dataclasses
+import sys
+
+from ..app import RunnerAgentApp
+from ..config import Config
+from .fake_runtime import FakeRuntime
+
+
+def main(argv: list[str] | None = None) -> None:
+    # One benchmarked agent process: the real RunnerAgentApp configured from
+    # the environment (WORKER_URL, TG_CHATID, ...) with RustDesk and tmate
+    # replaced by FakeRuntime.
+    parser = argparse.ArgumentParser(prog="python -m runner_agent.bench.agent")
+    parser.add_argument("--heartbeat-seconds", type=int, default=60)
+    parser.add_argument("--poll-seconds", type=int, default=2)
+    parser.add_argument("--rustdesk-seconds", type=float, default=0.5)
+    parser.add_argument("--tmate-seconds", type=float, default=1.0)
+    parser.add_argument("--details-seconds", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    cfg = dataclasses.replace(
+        Config.from_env(),
+        heartbeat_seconds=args.heartbeat_seconds,
+        poll_seconds=args.poll_seconds,
+    )
+    if not cfg.chat_id or not cfg.worker_url:
+        raise SystemExit("Missing TG_CHATID or WORKER_URL")
+    runtime = FakeRuntime(args.rustdesk_seconds, args.tmate_seconds, args.details_seconds)
+    RunnerAgentApp(cfg, runtime=runtime).run()
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
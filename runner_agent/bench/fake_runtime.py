@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Callable
+
+
+class FakeRuntime:
+    # Drop-in for runner_agent.runtime inside RunnerAgentApp: RustDesk and
+    # tmate are simulated with fixed delays and follow the real pipeline's
+    # contract (RustDesk on the critical path, tmate and server details
+    # delivered later through on_update).
+    def __init__(
+        self,
+        rustdesk_seconds: float = 0.5,
+        tmate_seconds: float = 1.0,
+        details_seconds: float = 0.2,
+        fail_rustdesk: bool = False,
+        alive: bool = True,
+        peers: int = 0,
+    ):
+        self.rustdesk_seconds = rustdesk_seconds
+        self.tmate_seconds = tmate_seconds
+        self.details_seconds = details_seconds
+        self.fail_rustdesk = fail_rustdesk
+        self.alive = alive
+        self.peers = peers
+        self.shutdowns = 0
+        self.starts = 0
+        self.cancels = 0
+        self._lock = threading.Lock()
+
+    def get_server_details(self):
+        return "Benchland", "127.0.0.1", 2, 7.0, "Linux bench"
+
+    def start_remote_access(
+        self,
+        system_os: str,
+        rustdesk_password: str,
+        on_update: Callable[[dict], None] | None = None,
+        profile: str = "balanced",
+        cancel: threading.Event | None = None,
+    ):
+        with self._lock:
+            self.starts += 1
+        start = time.monotonic()
+        result = {
+            "rustdesk_id": "100200300",
+            "rustdesk_password": rustdesk_password,
+            "tmate_ssh": None,
+            "tmate_web": None,
+            # "auto" is reported as its fallback; the fake has no link to measure.
+            "profile": {"requested": profile, "profile": "balanced" if profile == "auto" else profile, "mbps": None},
+            "relay": {"chosen": None, "candidates": []},
+            "rustdesk_server": {},
+            "pending": [],
+        }
+        branches = [
+            ("server_details", self.details_seconds, lambda: {"server_details": self.get_server_details()}),
+            ("tmate", self.tmate_seconds, lambda: {"tmate_ssh": "ssh bench@localhost", "tmate_web": "https://tmate.invalid/bench"}),
+        ]
+        if cancel is not None:
+            if cancel.wait(self.rustdesk_seconds):
+                raise RuntimeError("startup cancelled")
+        else:
+            time.sleep(self.rustdesk_seconds)
+        if self.fail_rustdesk:
+            raise RuntimeError("RustDesk ID not found")
+        elapsed = time.monotonic() - start
+        for branch, seconds, make in branches:
+            if seconds <= elapsed or on_update is None:
+                result.update(make())
+                continue
+            result["pending"].append(branch)
+            timer = threading.Timer(seconds - elapsed, self._deliver, args=(on_update, branch, make))
+            timer.daemon = True
+            timer.start()
+        return result
+
+    def cancel_remote_access(self, system_os: str) -> None:
+        with self._lock:
+            self.cancels += 1
+
+    def check_remote_access(self, system_os: str, endpoints: dict) -> dict:
+        return {"rustdesk": self.alive, "tmate": self.alive and bool(endpoints.get("tmate_ssh"))}
+
+    def session_activity(self, system_os: str, relay_port: int = 21117) -> dict:
+        return {"rustdesk_peers": self.peers, "tmate_clients": 0, "input_idle_s": None}
+
+    @staticmethod
+    def _deliver(on_update, branch: str, make) -> None:
+        on_update({"branch": branch, **make()})
+
+    def perform_system_shutdown(self, system_os: str):
+        with self._lock:
+            self.shutdowns += 1
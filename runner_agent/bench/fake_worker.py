@@ -0,0 +1,362 @@
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+POST_PATHS = (
+    "/heartbeat",
+    "/runner-message",
+    "/runner-messages",
+    "/session-endpoint",
+    "/session-trace",
+    "/register-session",
+    "/end-session",
+)
+
+
+class _QuietServer(ThreadingHTTPServer):
+    # Agents are killed mid-request on purpose (crash/restart and cold-start
+    # runs); a dropped client is not a worker error.
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+
+@dataclass
+class Received:
+    path: str
+    body: dict
+    at: float
+    chat_id: str | None = None
+
+
+@dataclass
+class FakeWorkerConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    channels: tuple[str, ...] = ("sse", "longpoll")
+    features: tuple[str, ...] = ("batch",)
+    max_hold_seconds: int = 25
+    sse_ping_seconds: float = 15.0
+    # Paths that never get injected errors (e.g. keep /get-updates clean
+    # while testing delivery retries).
+    error_exempt: tuple[str, ...] = ()
+    seed: int | None = None
+    # Fleet runs only need the listeners; keeping every body would grow
+    # without bound.
+    keep_received: bool = True
+
+
+@dataclass
+class _Chat:
+    commands: deque = field(default_factory=deque)
+    cond: threading.Condition = field(default_factory=threading.Condition)
+    next_seq: int = 1
+
+
+class FakeWorker:
+    # In-process stand-in for the worker API with configurable latency and
+    # error injection. Commands are queued per chat_id with push_command().
+    def __init__(self, config: FakeWorkerConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeWorkerConfig()
+        self._rng = random.Random(self.config.seed)
+        self._chats: dict[str, _Chat] = defaultdict(_Chat)
+        self._chats_lock = threading.Lock()
+        self._received: list[Received] = []
+        self._received_cond = threading.Condition()
+        self._listeners: list = []
+        # Keyed by (chat_id, path); heartbeats only carry run_id, which is
+        # mapped back to its chat at /register-session.
+        self._counts: dict[tuple[str | None, str], int] = defaultdict(int)
+        self._errors: dict[tuple[str | None, str], int] = defaultdict(int)
+        self._run_chats: dict[str, str] = {}
+        self._seen_keys: set[str] = set()
+        self._stats_lock = threading.Lock()
+        self._closing = threading.Event()
+        self.server = _QuietServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeWorker":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-worker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._closing.set()
+        with self._chats_lock:
+            chats = list(self._chats.values())
+        for chat in chats:
+            with chat.cond:
+                chat.cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeWorker":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _chat(self, chat_id: str) -> _Chat:
+        with self._chats_lock:
+            return self._chats[chat_id]
+
+    def push_command(self, chat_id: str, command_type: str, payload: str) -> float:
+        chat = self._chat(chat_id)
+        pushed_at = time.monotonic()
+        with chat.cond:
+            chat.commands.append({"seq": chat.next_seq, "command_type": command_type, "payload": payload})
+            chat.next_seq += 1
+            chat.cond.notify_all()
+        return pushed_at
+
+    def _take_commands(self, chat_id: str, wait: float, ack: int | None = None, after: int | None = None) -> list[dict]:
+        # Legacy clients (no ack) get commands removed on delivery. Acking
+        # clients get everything after `ack`, which stays queued until a
+        # later ack covers it. `after` only skips what one stream has already
+        # written: that is not an ack, the client may never have read it.
+        chat = self._chat(chat_id)
+        deadline = time.monotonic() + wait
+        with chat.cond:
+            while True:
+                if ack is not None:
+                    while chat.commands and chat.commands[0]["seq"] <= ack:
+                        chat.commands.popleft()
+                commands = [c for c in chat.commands if after is None or c["seq"] > after]
+                if commands or self._closing.is_set():
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                chat.cond.wait(remaining)
+            if ack is None:
+                chat.commands.clear()
+        return commands
+
+    def add_listener(self, callback) -> None:
+        # Called on the handler thread with every Received record.
+        self._listeners.append(callback)
+
+    def _record(self, path: str, body: dict, chat_id: str | None) -> None:
+        record = Received(path, body, time.monotonic(), chat_id)
+        if self.config.keep_received:
+            with self._received_cond:
+                self._received.append(record)
+                self._received_cond.notify_all()
+        for callback in list(self._listeners):
+            try:
+                callback(record)
+            except Exception:
+                pass
+
+    def received(self, path: str | None = None, chat_id: str | None = None) -> list[Received]:
+        with self._received_cond:
+            return [
+                r for r in self._received
+                if (path is None or r.path == path) and (chat_id is None or r.chat_id == chat_id)
+            ]
+
+    def wait_for(self, predicate, timeout: float = 10.0, since: float = 0.0) -> Received | None:
+        deadline = time.monotonic() + timeout
+        with self._received_cond:
+            while True:
+                for r in self._received:
+                    if r.at >= since and predicate(r):
+                        return r
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._received_cond.wait(remaining)
+
+    def _chat_for(self, body: dict) -> str | None:
+        if body.get("chat_id") is not None:
+            chat_id = str(body["chat_id"])
+            if body.get("run_id"):
+                with self._stats_lock:
+                    self._run_chats[str(body["run_id"])] = chat_id
+            return chat_id
+        with self._stats_lock:
+            return self._run_chats.get(str(body.get("run_id")))
+
+    def _count(self, path: str, chat_id: str | None, error: bool = False) -> None:
+        with self._stats_lock:
+            if error:
+                self._errors[(chat_id, path)] += 1
+            else:
+                self._counts[(chat_id, path)] += 1
+
+    @staticmethod
+    def _by_path(table: dict, chat_id: str | None) -> dict[str, int]:
+        result: dict[str, int] = defaultdict(int)
+        for (chat, path), count in table.items():
+            if chat_id is None or chat == chat_id:
+                result[path] += count
+        return dict(result)
+
+    def counts(self, chat_id: str | None = None) -> dict[str, int]:
+        with self._stats_lock:
+            return self._by_path(self._counts, chat_id)
+
+    def errors(self, chat_id: str | None = None) -> dict[str, int]:
+        with self._stats_lock:
+            return self._by_path(self._errors, chat_id)
+
+    def total_requests(self, chat_id: str | None = None) -> int:
+        return sum(self.counts(chat_id).values())
+
+    def reset_counts(self) -> None:
+        with self._stats_lock:
+            self._counts.clear()
+            self._errors.clear()
+
+    def _handler_class(self):
+        worker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this,
+            # Nagle + delayed ACK adds ~40 ms to every response.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, obj, status: int = 200) -> None:
+                data = json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _inject(self, path: str, chat_id: str | None) -> bool:
+                cfg = worker.config
+                delay = cfg.latency_ms + (worker._rng.uniform(0, cfg.jitter_ms) if cfg.jitter_ms else 0.0)
+                if delay:
+                    time.sleep(delay / 1000)
+                if path in cfg.error_exempt or not cfg.error_rate:
+                    return False
+                if worker._rng.random() < cfg.error_rate:
+                    worker._count(path, chat_id, error=True)
+                    self._send_json({"error": "injected"}, cfg.error_status)
+                    return True
+                return False
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                path = parts.path
+                chat_id = (query.get("chat_id") or [""])[0]
+                worker._count(path, chat_id)
+                if self._inject(path, chat_id):
+                    return
+                if path == "/capabilities":
+                    self._send_json({
+                        "channels": list(worker.config.channels),
+                        "features": list(worker.config.features),
+                        "max_hold_seconds": worker.config.max_hold_seconds,
+                    })
+                elif path == "/get-updates":
+                    wait = 0.0
+                    if "longpoll" in worker.config.channels:
+                        try:
+                            wait = min(float((query.get("wait") or ["0"])[0]), worker.config.max_hold_seconds)
+                        except ValueError:
+                            wait = 0.0
+                    try:
+                        ack = int(query["ack"][0]) if "ack" in query else None
+                    except ValueError:
+                        ack = None
+                    commands = worker._take_commands(chat_id, wait, ack)
+                    if not commands:
+                        self._send_json({})
+                    elif len(commands) == 1:
+                        self._send_json(commands[0])
+                    else:
+                        self._send_json({"commands": commands})
+                elif path == "/updates-stream" and "sse" in worker.config.channels:
+                    try:
+                        cursor = int(self.headers.get("Last-Event-ID") or 0)
+                    except ValueError:
+                        cursor = 0
+                    self._stream(chat_id, cursor)
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def _stream(self, chat_id: str, cursor: int) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def chunk(text: str) -> None:
+                    data = text.encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+
+                # A written event counts as delivered for this stream; anything
+                # lost with the connection is re-sent after Last-Event-ID.
+                ack = cursor
+                try:
+                    while not worker._closing.is_set():
+                        commands = worker._take_commands(chat_id, worker.config.sse_ping_seconds, ack, after=cursor)
+                        if worker._closing.is_set():
+                            break
+                        if not commands:
+                            chunk(": ping\n\n")
+                            continue
+                        last = commands[-1]["seq"]
+                        chunk(f"id: {last}\ndata: {json.dumps({'commands': commands})}\n\n")
+                        cursor = last
+                except OSError:
+                    pass
+
+            def do_POST(self):
+                parts = urlsplit(self.path)
+                path = parts.path
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    body = None
+                chat_id = worker._chat_for(body) if isinstance(body, dict) else None
+                worker._count(path, chat_id)
+                if self._inject(path, chat_id):
+                    return
+                if path not in POST_PATHS:
+                    self._send_json({"error": "not found"}, 404)
+                    return
+                if not isinstance(body, dict):
+                    self._send_json({"error": "bad json"}, 400)
+                    return
+                key = self.headers.get("Idempotency-Key")
+                with worker._stats_lock:
+                    duplicate = bool(key) and key in worker._seen_keys
+                    if key:
+                        worker._seen_keys.add(key)
+                if duplicate:
+                    self._send_json({"ok": True, "duplicate": True})
+                    return
+                if path == "/runner-messages":
+                    for message in body.get("messages") or []:
+                        worker._record("/runner-message", message, chat_id)
+                else:
+                    worker._record(path, body, chat_id)
+                self._send_json({"ok": True})
+
+        return Handler
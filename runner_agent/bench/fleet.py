@@ -0,0 +1,469 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from urllib.parse import urlsplit
+
+import psutil
+
+from ..app import RunnerAgentApp
+from ..config import Config
+from ..transport import HttpTransport
+from .fake_runtime import FakeRuntime
+from .fake_worker import FakeWorker, FakeWorkerConfig, Received
+from .suite import SECRET, _git_commit
+
+# Weights for what a user does during a session, and how the session ends.
+COMMAND_MIX = {"info": 0.55, "extend": 0.25, "menu": 0.20}
+LIFECYCLE_MIX = {"kill": 0.5, "timeout": 0.3, "run": 0.2}
+REPLY_TIMEOUT = 30.0
+MAX_SAMPLES = 50_000
+
+
+@dataclass
+class FleetOptions:
+    agents: int = 100
+    duration_seconds: float = 60.0
+    ramp_seconds: float = 10.0
+    channel: str = "auto"
+    poll_seconds: int = 2
+    heartbeat_seconds: int = 60
+    long_poll_seconds: int = 25
+    think_seconds: float = 4.0
+    session_seconds: float = 30.0
+    web_fraction: float = 0.0
+    rustdesk_seconds: float = 0.5
+    tmate_seconds: float = 1.0
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 1
+    command_mix: dict = field(default_factory=lambda: dict(COMMAND_MIX))
+    lifecycle_mix: dict = field(default_factory=lambda: dict(LIFECYCLE_MIX))
+
+
+class LatencyLog:
+    # Client-side latencies for every request of every virtual agent,
+    # reservoir-sampled per endpoint so long runs stay bounded.
+    def __init__(self, seed: int):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._samples: dict[str, list[float]] = defaultdict(list)
+        self._seen: Counter = Counter()
+        self._errors: Counter = Counter()
+
+    def record(self, name: str, elapsed_ms: float, ok: bool) -> None:
+        with self._lock:
+            self._seen[name] += 1
+            if not ok:
+                self._errors[name] += 1
+            samples = self._samples[name]
+            if len(samples) < MAX_SAMPLES:
+                samples.append(elapsed_ms)
+            else:
+                slot = self._rng.randrange(self._seen[name])
+                if slot < MAX_SAMPLES:
+                    samples[slot] = elapsed_ms
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "count": self._seen[name],
+                    "errors": self._errors[name],
+                    "error_rate": round(self._errors[name] / self._seen[name], 4),
+                    **_percentiles(self._samples[name]),
+                }
+                for name in sorted(self._seen)
+            }
+
+
+class FleetTransport(HttpTransport):
+    # Each virtual agent gets its own small pool, like a real runner would.
+    def __init__(self, log: LatencyLog, pool_size: int = 2):
+        super().__init__(pool_size)
+        self.log = log
+
+    def request(self, method: str, url: str, endpoint: str | None = None, **kwargs):
+        name = endpoint or urlsplit(url).path or "/"
+        if "wait=" in url or kwargs.get("stream"):
+            # Held requests measure the hold, not the worker; keep them apart.
+            name += " (held)"
+        start = time.perf_counter()
+        ok = False
+        try:
+            resp = super().request(method, url, endpoint=endpoint, **kwargs)
+            ok = resp.status_code < 500 and resp.status_code != 429
+            return resp
+        finally:
+            self.log.record(name, (time.perf_counter() - start) * 1000, ok)
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(ordered[-1], 2)}
+
+
+def _choose(rng: random.Random, weights: dict) -> str:
+    names = list(weights)
+    return rng.choices(names, weights=[weights[n] for n in names])[0]
+
+
+def _text_starts(prefix: str):
+    return lambda r: r.path == "/runner-message" and str(r.body.get("text", "")).startswith(prefix)
+
+
+def _path_is(path: str):
+    return lambda r: r.path == path
+
+
+# What the worker sees once the agent has handled each command.
+REPLIES = {
+    "info": _text_starts("📊"),
+    "extend": lambda r: _text_starts("✅")(r) or _text_starts("⚠️")(r),
+    "menu": _text_starts("🎛️"),
+    "kill": _path_is("/end-session"),
+    "time_60": _path_is("/session-endpoint"),
+}
+COMMANDS = {
+    "info": ("callback", "info"),
+    "extend": ("callback", "extend"),
+    "menu": ("text", "/menu"),
+    "kill": ("callback", "kill"),
+    "time_60": ("callback", "time_60"),
+}
+
+
+class VirtualAgent:
+    def __init__(self, index: int, sim: "FleetSimulator"):
+        self.sim = sim
+        opts = sim.opts
+        self.rng = random.Random(opts.seed * 100_003 + index)
+        self.web = self.rng.random() < opts.web_fraction
+        chat_id = f"web:fleet-{index}" if self.web else f"fleet-{index}"
+        run_id = str(7_000_000 + index)
+        cfg = Config(
+            chat_id=chat_id,
+            worker_url=sim.worker.url,
+            user_lang="en",
+            system_os="Linux",
+            run_id=run_id,
+            rustdesk_password="fleet123",
+            runner_secret=SECRET,
+            requested_duration_minutes=60,
+            heartbeat_seconds=opts.heartbeat_seconds,
+            poll_seconds=opts.poll_seconds,
+            command_channel=opts.channel,
+            long_poll_seconds=opts.long_poll_seconds,
+            trace_path=os.path.join(sim.trace_dir, f"{run_id}.json"),
+            state_path=os.path.join(sim.trace_dir, f"{run_id}.state.json"),
+            control_socket=None,
+            # Sampling is per process in real life; one psutil pass per agent
+            # per minute keeps the simulator itself out of the numbers.
+            sample_seconds=60.0,
+        )
+        self.chat_id = chat_id
+        self.lifecycle = _choose(self.rng, opts.lifecycle_mix)
+        self.app = RunnerAgentApp(
+            cfg,
+            runtime=FakeRuntime(opts.rustdesk_seconds, opts.tmate_seconds, details_seconds=0.2),
+            transport=FleetTransport(sim.latency),
+        )
+        self._waiters: list[tuple] = []
+        self.outcome = "pending"
+
+    def on_record(self, record: Received) -> None:
+        # Loop thread only.
+        for waiter in list(self._waiters):
+            predicate, future, pushed_at = waiter
+            if record.at >= pushed_at and predicate(record) and not future.done():
+                future.set_result(record)
+                self._waiters.remove(waiter)
+
+    async def expect(self, name: str, pushed_at: float, predicate) -> float | None:
+        future = asyncio.get_running_loop().create_future()
+        waiter = (predicate, future, pushed_at)
+        self._waiters.append(waiter)
+        try:
+            record = await asyncio.wait_for(future, timeout=REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self.sim.lost[name] += 1
+            return None
+        rtt = (record.at - pushed_at) * 1000
+        self.sim.rtts[name].append(rtt)
+        return rtt
+
+    async def command(self, name: str) -> float | None:
+        ctype, payload = COMMANDS[name]
+        pushed_at = time.monotonic()
+        self.sim.commands[name] += 1
+        # Register the waiter before the command exists so a fast reply
+        # cannot slip past it.
+        waiter = asyncio.ensure_future(self.expect(name, pushed_at, REPLIES[name]))
+        await asyncio.sleep(0)
+        self.sim.worker.push_command(self.chat_id, ctype, payload)
+        return await waiter
+
+    def _expire_in(self, seconds: float) -> None:
+        # Move the start time back so the deadline lands `seconds` from now,
+        # then wake the agent's deadline timer the same way extend does.
+        state = self.app.state
+        with state.lock:
+            state.start_time = time.time() + seconds - state.duration * 60
+        state._notify()
+
+    async def drive(self, stop_at: float) -> None:
+        opts = self.sim.opts
+        await asyncio.sleep(self.rng.uniform(0, opts.ramp_seconds))
+        run_task = asyncio.ensure_future(self.app.run_async())
+        try:
+            if self.web:
+                # Web mode starts on its own; time registration -> endpoint.
+                started = time.monotonic()
+                await self.expect("web_start", started, REPLIES["time_60"])
+            else:
+                await asyncio.sleep(self.rng.uniform(0.5, opts.think_seconds))
+                await self.command("time_60")
+            session_end = min(stop_at, time.monotonic() + self.rng.expovariate(1 / opts.session_seconds))
+            while time.monotonic() < session_end and self.app.state.active:
+                await asyncio.sleep(min(self.rng.expovariate(1 / opts.think_seconds), max(0.0, session_end - time.monotonic())))
+                if time.monotonic() >= session_end:
+                    break
+                await self.command(_choose(self.rng, opts.command_mix))
+            if time.monotonic() >= stop_at or self.lifecycle == "run":
+                await asyncio.sleep(max(0.0, stop_at - time.monotonic()))
+                self.outcome = "run"
+            elif self.lifecycle == "kill":
+                await self.command("kill")
+                self.outcome = "kill"
+            else:
+                expire_at = time.monotonic() + 1.0
+                waiter = asyncio.ensure_future(self.expect("timeout", expire_at, REPLIES["kill"]))
+                await asyncio.sleep(0)
+                self._expire_in(1.0)
+                await waiter
+                self.outcome = "timeout"
+        except Exception as exc:
+            self.outcome = f"error: {exc}"
+        finally:
+            if self.app.state.active:
+                self.app.state.stop()
+            try:
+                await asyncio.wait_for(run_task, timeout=30)
+            except Exception:
+                run_task.cancel()
+
+
+class FleetSimulator:
+    def __init__(self, opts: FleetOptions):
+        self.opts = opts
+        self.worker = FakeWorker(FakeWorkerConfig(
+            latency_ms=opts.latency_ms,
+            jitter_ms=opts.jitter_ms,
+            error_rate=opts.error_rate,
+            max_hold_seconds=max(1, opts.long_poll_seconds),
+            seed=opts.seed,
+            keep_received=False,
+        ))
+        self.latency = LatencyLog(opts.seed)
+        self.rtts: dict[str, list[float]] = defaultdict(list)
+        self.lost: Counter = Counter()
+        self.commands: Counter = Counter()
+        self.trace_dir = tempfile.mkdtemp(prefix="gibrunner-fleet-")
+        self.agents: dict[str, VirtualAgent] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _on_record(self, record: Received) -> None:
+        agent = self.agents.get(record.chat_id or "")
+        if agent is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(agent.on_record, record)
+
+    async def _run(self) -> dict:
+        opts = self.opts
+        self._loop = asyncio.get_running_loop()
+        # Every agent's sends and session threads share the default executor.
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=min(1024, opts.agents * 2 + 8)))
+        self.worker.add_listener(self._on_record)
+        self.worker.start()
+        proc = psutil.Process()
+        cpu_start = sum(proc.cpu_times()[:2])
+        started = time.monotonic()
+        for index in range(opts.agents):
+            agent = VirtualAgent(index, self)
+            self.agents[agent.chat_id] = agent
+        stop_at = started + opts.duration_seconds
+        peak = {"threads": 0, "rss_mb": 0.0}
+
+        async def watch():
+            while True:
+                peak["threads"] = max(peak["threads"], threading.active_count())
+                peak["rss_mb"] = max(peak["rss_mb"], proc.memory_info().rss / 1024 / 1024)
+                await asyncio.sleep(1)
+
+        watcher = asyncio.ensure_future(watch())
+        await asyncio.gather(*(agent.drive(stop_at) for agent in self.agents.values()))
+        watcher.cancel()
+        elapsed = time.monotonic() - started
+        cpu_used = sum(proc.cpu_times()[:2]) - cpu_start
+        self.worker.stop()
+        return self._report(elapsed, cpu_used, peak)
+
+    def _report(self, elapsed: float, cpu_used: float, peak: dict) -> dict:
+        counts = self.worker.counts()
+        errors = self.worker.errors()
+        total = sum(counts.values())
+        outbox = Counter()
+        for agent in self.agents.values():
+            metrics = agent.app.outbox.metrics()
+            for key in ("enqueued", "delivered", "failed", "dropped", "retries", "batches"):
+                outbox[key] += metrics.get(key, 0)
+        return {
+            "meta": {
+                "started_at": round(time.time() - elapsed, 3),
+                "elapsed_s": round(elapsed, 1),
+                "python": sys.version.split()[0],
+                "cpu_count": os.cpu_count(),
+                "git_commit": _git_commit(),
+                "options": asdict(self.opts),
+            },
+            "agents": {
+                "count": len(self.agents),
+                "web_mode": sum(1 for a in self.agents.values() if a.web),
+                "lifecycles": dict(Counter(a.lifecycle for a in self.agents.values())),
+                "outcomes": dict(Counter(a.outcome for a in self.agents.values())),
+            },
+            "worker": {
+                "requests": total,
+                "requests_per_second": round(total / elapsed, 2),
+                "requests_per_agent_hour": round(total * 3600 / elapsed / max(1, len(self.agents)), 1),
+                "by_path_per_second": {p: round(c / elapsed, 2) for p, c in sorted(counts.items())},
+                "errors_injected": dict(sorted(errors.items())),
+                "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+            },
+            "client_latency_ms": self.latency.report(),
+            "command_rtt_ms": {
+                name: {**_percentiles(values), "samples": len(values), "sent": self.commands[name], "lost": self.lost[name]}
+                for name, values in sorted(self.rtts.items())
+            },
+            "lost_replies": dict(self.lost),
+            "outbox": dict(outbox),
+            "process": {
+                "cpu_percent": round(cpu_used * 100 / elapsed, 1),
+                "peak_threads": peak["threads"],
+                "peak_rss_mb": round(peak["rss_mb"], 1),
+                "note": "single process: includes the stand-in worker",
+            },
+        }
+
+    def run(self) -> dict:
+        return asyncio.run(self._run())
+
+
+def format_report(report: dict) -> str:
+    w = report["worker"]
+    lines = [
+        f"agents={report['agents']['count']} outcomes={report['agents']['outcomes']}",
+        f"worker: {w['requests']} requests, {w['requests_per_second']} req/s, "
+        f"{w['requests_per_agent_hour']} req/agent-hour, error rate {w['error_rate']}",
+    ]
+    for name, st in report["client_latency_ms"].items():
+        lines.append(f"  {name:28} n={st['count']} err={st['errors']} p50={st['p50']} p90={st['p90']} p99={st['p99']}ms")
+    for name, st in report["command_rtt_ms"].items():
+        lines.append(f"  rtt {name:24} n={st['samples']} lost={st['lost']} p50={st['p50']} p99={st['p99']}ms")
+    p = report["process"]
+    lines.append(f"process: cpu={p['cpu_percent']}% threads={p['peak_threads']} rss={p['peak_rss_mb']}MB")
+    return "\n".join(lines)
+
+
+def _parse_mix(text: str | None, default: dict) -> dict:
+    if not text:
+        return dict(default)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in default:
+            raise ValueError(f"unknown entry {name.strip()!r} (expected one of {', '.join(default)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m runner_agent.bench.fleet")
+    parser.add_argument("--agents", "-n", type=int, default=FleetOptions.agents)
+    parser.add_argument("--duration", type=float, default=FleetOptions.duration_seconds, help="seconds")
+    parser.add_argument("--ramp", type=float, default=FleetOptions.ramp_seconds, help="spread agent starts over this many seconds")
+    parser.add_argument("--channel", default="auto", choices=("auto", "poll", "longpoll", "sse"))
+    parser.add_argument("--poll-seconds", type=int, default=FleetOptions.poll_seconds)
+    parser.add_argument("--heartbeat-seconds", type=int, default=FleetOptions.heartbeat_seconds)
+    parser.add_argument("--long-poll-seconds", type=int, default=FleetOptions.long_poll_seconds)
+    parser.add_argument("--think-seconds", type=float, default=FleetOptions.think_seconds, help="mean gap between user commands")
+    parser.add_argument("--session-seconds", type=float, default=FleetOptions.session_seconds, help="mean active time before kill/timeout")
+    parser.add_argument("--web-fraction", type=float, default=0.0)
+    parser.add_argument("--command-mix", help="e.g. info=0.6,extend=0.2,menu=0.2")
+    parser.add_argument("--lifecycle-mix", help="e.g. kill=0.5,timeout=0.3,run=0.2")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", "-o", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--verbose", action="store_true", help="show agent output")
+    args = parser.parse_args(argv)
+    try:
+        command_mix = _parse_mix(args.command_mix, COMMAND_MIX)
+        lifecycle_mix = _parse_mix(args.lifecycle_mix, LIFECYCLE_MIX)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    opts = FleetOptions(
+        agents=max(1, args.agents),
+        duration_seconds=args.duration,
+        ramp_seconds=args.ramp,
+        channel=args.channel,
+        poll_seconds=args.poll_seconds,
+        heartbeat_seconds=args.heartbeat_seconds,
+        long_poll_seconds=args.long_poll_seconds,
+        think_seconds=args.think_seconds,
+        session_seconds=args.session_seconds,
+        web_fraction=args.web_fraction,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        command_mix=command_mix,
+        lifecycle_mix=lifecycle_mix,
+    )
+    sim = FleetSimulator(opts)
+    if args.verbose:
+        report = sim.run()
+    else:
+        # Hundreds of agents printing "Recv: ..." would dominate the run.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = sim.run()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(format_report(report), file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler
+
+from .. import relays
+from .fake_worker import _QuietServer
+
+
+@dataclass
+class StandIn:
+    # Local hbbs/hbbr stand-in: two TCP listeners that accept and hang up,
+    # plus an HTTP probe endpoint streaming bytes at `mbps`. `down` leaves
+    # the ports closed so connects are refused. Loopback handshakes all take
+    # a fraction of a millisecond, so these exercise reachability and the
+    # throughput filter; RTT ordering needs real hosts.
+    name: str
+    mbps: float | None = None
+    down: bool = False
+
+    def start(self) -> "StandIn":
+        self._stop = threading.Event()
+        self._sockets = []
+        self.ports = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("127.0.0.1", 0))
+            self.ports.append(sock.getsockname()[1])
+            if self.down:
+                sock.close()
+                continue
+            sock.listen(64)
+            self._sockets.append(sock)
+            threading.Thread(target=self._accept, args=(sock,), daemon=True).start()
+        self.http = None
+        if self.mbps is not None and not self.down:
+            self.http = _QuietServer(("127.0.0.1", 0), self._handler_class())
+            threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        return self
+
+    def _accept(self, sock: socket.socket) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            conn.close()
+
+    def _handler_class(self):
+        rate = self.mbps * 1_000_000 / 8
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.end_headers()
+                chunk = b"\0" * 64 * 1024
+                start = time.monotonic()
+                sent = 0
+                try:
+                    while sent < 4_000_000:
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                        ahead = sent / rate - (time.monotonic() - start)
+                        if ahead > 0:
+                            time.sleep(ahead)
+                except (ConnectionError, OSError):
+                    pass
+
+        return Handler
+
+    def spec(self) -> str:
+        entry = f"127.0.0.1:{self.ports[0]};relay=127.0.0.1:{self.ports[1]};key={self.name}"
+        if self.http is not None:
+            entry += f";probe=http://127.0.0.1:{self.http.server_address[1]}/probe"
+        return entry
+
+    def stop(self) -> None:
+        self._stop.set()
+        for sock in self._sockets:
+            sock.close()
+        if self.http is not None:
+            self.http.shutdown()
+            self.http.server_close()
+
+
+def run(fast: int, slow: int, down: int, slow_mbps: float, fast_mbps: float) -> dict:
+    stand_ins = (
+        [StandIn(f"down-{i}", down=True) for i in range(down)]
+        + [StandIn(f"slow-{i}", mbps=slow_mbps) for i in range(slow)]
+        + [StandIn(f"fast-{i}", mbps=fast_mbps) for i in range(fast)]
+    )
+    for s in stand_ins:
+        s.start()
+    try:
+        # Goes through the same RUSTDESK_SERVERS parsing the agent uses.
+        servers = relays.parse_servers(",".join(s.spec() for s in stand_ins))
+        start = time.monotonic()
+        best, report = relays.resolve(servers)
+        elapsed = time.monotonic() - start
+    finally:
+        for s in stand_ins:
+            s.stop()
+    names = {server.name: s.name for server, s in zip(servers, stand_ins)}
+    chosen = names.get(best.name) if best else None
+    if fast:
+        ok = chosen is not None and chosen.startswith("fast-")
+    elif slow:
+        ok = chosen is not None and chosen.startswith("slow-")
+    else:
+        ok = chosen is None
+    return {
+        "chosen": chosen,
+        "ok": ok,
+        "probe_ms": round(elapsed * 1000, 1),
+        "options": relays.rustdesk_options(best) if best else {},
+        "candidates": [{**r, "stand_in": names.get(r["server"])} for r in report.get("candidates", [])],
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    # Checks the probe/selection path end to end without the internet:
+    # python -m runner_agent.bench.relays --fast 2 --slow 2 --down 1
+    parser = argparse.ArgumentParser(prog="python -m runner_agent.bench.relays")
+    parser.add_argument("--fast", type=int, default=1)
+    parser.add_argument("--slow", type=int, default=1)
+    parser.add_argument("--down", type=int, default=1)
+    parser.add_argument("--fast-mbps", type=float, default=200.0)
+    parser.add_argument("--slow-mbps", type=float, default=2.0)
+    args = parser.parse_args(argv)
+    result = run(args.fast, args.slow, args.down, args.slow_mbps, args.fast_mbps)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
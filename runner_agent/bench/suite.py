@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+import psutil
+
+from .fake_worker import FakeWorker, FakeWorkerConfig
+
+CHANNELS = ("poll", "longpoll", "sse")
+AGENT_MODES = ("full", "lite")
+SECRET = "bench-secret"
+
+
+@dataclass
+class BenchOptions:
+    channels: tuple[str, ...] = CHANNELS
+    rtt_samples: int = 20
+    idle_seconds: float = 60.0
+    heartbeat_seconds: int = 60
+    poll_seconds: int = 2
+    long_poll_seconds: int = 25
+    rustdesk_seconds: float = 0.5
+    tmate_seconds: float = 1.0
+    details_seconds: float = 0.2
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    seed: int | None = 1
+    agent_mode: str = "auto"
+    startup_samples: int = 5
+    # Time the simulated user spends on the duration menu; the agent's
+    # speculative warm-up runs during it.
+    think_seconds: float = 0.0
+    warmup: bool = True
+    verbose: bool = False
+
+
+def _percentiles(values: list[float]) -> dict[str, float | None]:
+    if not values:
+        return {"p50": None, "p95": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "max": round(ordered[-1], 2),
+        "mean": round(sum(ordered) / len(ordered), 2),
+    }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class AgentProcess:
+    # The agent runs in its own interpreter so CPU time and RSS belong to the
+    # agent alone, not to the fake worker serving it.
+    def __init__(
+        self, worker: FakeWorker, opts: BenchOptions, channel: str, chat_id: str, run_id: str, agent_mode: str | None = None,
+    ):
+        self.chat_id = chat_id
+        env = {
+            **os.environ,
+            "TG_CHATID": chat_id,
+            "WORKER_URL": worker.url,
+            "SESSION_SECRET": SECRET,
+            "GITHUB_RUN_ID": run_id,
+            "COMMAND_CHANNEL": channel,
+            "LONG_POLL_SECONDS": str(opts.long_poll_seconds),
+            "TRACE_PATH": os.path.join(tempfile.gettempdir(), f"gibrunner-bench-{run_id}.json"),
+            "STATE_PATH": os.path.join(tempfile.gettempdir(), f"gibrunner-bench-{run_id}.state.json"),
+            "PYTHONUNBUFFERED": "1",
+            "AGENT_MODE": agent_mode or opts.agent_mode,
+            # Parallel agents would fight over one socket and the launcher.
+            "CONTROL_SOCKET": "",
+            "WARMUP": "1" if opts.warmup else "0",
+        }
+        env.pop("GIBRUNNER_PHASES", None)
+        cmd = [
+            sys.executable, "-m", "runner_agent.bench.agent",
+            "--heartbeat-seconds", str(opts.heartbeat_seconds),
+            "--poll-seconds", str(opts.poll_seconds),
+            "--rustdesk-seconds", str(opts.rustdesk_seconds),
+            "--tmate-seconds", str(opts.tmate_seconds),
+            "--details-seconds", str(opts.details_seconds),
+        ]
+        out = None if opts.verbose else subprocess.DEVNULL
+        self.started = time.monotonic()
+        self.proc = subprocess.Popen(cmd, env=env, stdout=out, stderr=out, cwd=_package_root())
+        self.ps = psutil.Process(self.proc.pid)
+
+    def cpu_seconds(self) -> float:
+        times = self.ps.cpu_times()
+        return times.user + times.system
+
+    def rss_mb(self) -> float:
+        return round(self.ps.memory_info().rss / 1024 / 1024, 1)
+
+    def stop(self, grace: float = 3.0) -> None:
+        # A poll thread parked in a long-poll can keep the interpreter alive
+        # after the app returns; the measurements are done by then.
+        try:
+            self.proc.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+def _package_root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _is_text(prefix: str):
+    return lambda r: str(r.body.get("text", "")).startswith(prefix)
+
+
+def bench_channel(worker: FakeWorker, opts: BenchOptions, channel: str, index: int) -> dict:
+    chat_id = f"bench-{index}-{channel}"
+    run_id = f"{int(time.time())}{index}"
+    agent = AgentProcess(worker, opts, channel, chat_id, run_id)
+    result: dict = {"channel": channel, "chat_id": chat_id}
+    try:
+        mine = lambda path: (lambda r: r.chat_id == chat_id and r.path == path)
+
+        # Cold start: interpreter + imports + first /register-session.
+        reg = worker.wait_for(mine("/register-session"), timeout=30)
+        result["agent_ready_ms"] = _ms(reg.at - agent.started) if reg else None
+        result["rss_after_start_mb"] = agent.rss_mb()
+
+        # Simulated session startup: duration picked -> first endpoint
+        # (RustDesk) -> endpoint carrying tmate.
+        time.sleep(opts.think_seconds)
+        pushed = worker.push_command(chat_id, "callback", "time_60")
+        first = worker.wait_for(mine("/session-endpoint"), timeout=30, since=pushed)
+        full = worker.wait_for(
+            lambda r: mine("/session-endpoint")(r) and r.body.get("tmate_ssh"), timeout=30, since=pushed,
+        )
+        result["startup"] = {
+            "first_endpoint_ms": _ms(first.at - pushed) if first else None,
+            "full_endpoint_ms": _ms(full.at - pushed) if full else None,
+            "simulated_rustdesk_ms": _ms(opts.rustdesk_seconds),
+            "simulated_tmate_ms": _ms(opts.tmate_seconds),
+            "think_ms": _ms(opts.think_seconds),
+            "warmup": opts.warmup,
+            "overhead_ms": _ms(first.at - pushed - opts.rustdesk_seconds) if first else None,
+        }
+        time.sleep(max(0.5, opts.details_seconds))
+
+        # Command round trip: worker queues "info" -> agent receives it,
+        # runs process_callback, replies -> reply lands at the worker.
+        rtts = []
+        failures = 0
+        for _ in range(opts.rtt_samples):
+            pushed = worker.push_command(chat_id, "callback", "info")
+            reply = worker.wait_for(
+                lambda r: mine("/runner-message")(r) and _is_text("📊")(r), timeout=15, since=pushed,
+            )
+            if reply is None:
+                failures += 1
+                continue
+            rtts.append((reply.at - pushed) * 1000)
+            time.sleep(0.05)
+        result["command_rtt_ms"] = {**_percentiles(rtts), "samples": len(rtts), "failures": failures}
+
+        # Idle cost: nothing queued, count what the agent sends and burns.
+        time.sleep(1.0)
+        before = worker.counts(chat_id)
+        cpu_before = agent.cpu_seconds()
+        idle_start = time.monotonic()
+        time.sleep(opts.idle_seconds)
+        elapsed = time.monotonic() - idle_start
+        cpu_used = agent.cpu_seconds() - cpu_before
+        after = worker.counts(chat_id)
+        by_path = {path: after.get(path, 0) - before.get(path, 0) for path in after}
+        by_path = {path: count for path, count in by_path.items() if count}
+        total = sum(by_path.values())
+        result["idle"] = {
+            "seconds": round(elapsed, 1),
+            "requests": total,
+            "requests_per_hour": round(total * 3600 / elapsed, 1),
+            "by_path_per_hour": {path: round(count * 3600 / elapsed, 1) for path, count in sorted(by_path.items())},
+            "cpu_percent": round(cpu_used * 100 / elapsed, 2),
+            "cpu_seconds_per_hour": round(cpu_used * 3600 / elapsed, 1),
+            "rss_mb": agent.rss_mb(),
+        }
+
+        pushed = worker.push_command(chat_id, "callback", "kill")
+        end = worker.wait_for(mine("/end-session"), timeout=30, since=pushed)
+        result["kill_to_end_session_ms"] = _ms(end.at - pushed) if end else None
+        result["cpu_seconds_total"] = round(agent.cpu_seconds(), 2)
+        result["errors_injected"] = worker.errors(chat_id)
+    finally:
+        agent.stop()
+    return result
+
+
+def bench_startup(worker: FakeWorker, opts: BenchOptions) -> dict:
+    # Interpreter launch -> first /register-session at the worker, for each
+    # agent mode. Runs one agent at a time so the modes don't share CPU.
+    results = {}
+    for agent_mode in AGENT_MODES:
+        samples = []
+        for i in range(opts.startup_samples):
+            chat_id = f"bench-startup-{agent_mode}-{i}"
+            agent = AgentProcess(worker, opts, "poll", chat_id, f"{int(time.time())}{i}9", agent_mode=agent_mode)
+            try:
+                reg = worker.wait_for(lambda r: r.chat_id == chat_id and r.path == "/register-session", timeout=30)
+                if reg is not None:
+                    samples.append((reg.at - agent.started) * 1000)
+            finally:
+                agent.stop(grace=0)
+        results[agent_mode] = {**_percentiles(samples), "samples": len(samples)}
+    return results
+
+
+def run_suite(opts: BenchOptions) -> dict:
+    worker_cfg = FakeWorkerConfig(
+        latency_ms=opts.latency_ms,
+        jitter_ms=opts.jitter_ms,
+        error_rate=opts.error_rate,
+        max_hold_seconds=max(opts.long_poll_seconds, 1),
+        seed=opts.seed,
+    )
+    started = time.time()
+    with FakeWorker(worker_cfg) as worker:
+        # Channels run side by side, each agent with its own chat_id, so the
+        # whole suite takes one idle window instead of one per channel.
+        with ThreadPoolExecutor(max_workers=len(opts.channels)) as pool:
+            futures = [pool.submit(bench_channel, worker, opts, ch, i) for i, ch in enumerate(opts.channels)]
+            results = []
+            for ch, future in zip(opts.channels, futures):
+                try:
+                    results.append(future.result())
+                except Exception as exc:
+                    results.append({"channel": ch, "error": str(exc)})
+        startup = bench_startup(worker, opts) if opts.startup_samples > 0 else {}
+    return {
+        "meta": {
+            "started_at": round(started, 3),
+            "duration_s": round(time.time() - started, 1),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "git_commit": _git_commit(),
+            "options": asdict(opts),
+        },
+        "results": {r["channel"]: r for r in results},
+        "startup_by_mode": startup,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5, cwd=_package_root(),
+        )
+    except Exception:
+        return None
+    return proc.stdout.strip() or None
+
+
+def format_report(report: dict) -> str:
+    lines = []
+    for channel, r in report["results"].items():
+        if "error" in r:
+            lines.append(f"{channel:9} error: {r['error']}")
+            continue
+        rtt = r["command_rtt_ms"]
+        idle = r["idle"]
+        startup = r["startup"]
+        lines.append(
+            f"{channel:9} ready={r['agent_ready_ms']}ms startup={startup['first_endpoint_ms']}/{startup['full_endpoint_ms']}ms "
+            f"rtt p50={rtt['p50']} p95={rtt['p95']}ms idle={idle['requests_per_hour']} req/h "
+            f"cpu={idle['cpu_percent']}% rss={idle['rss_mb']}MB"
+        )
+    for agent_mode, r in report.get("startup_by_mode", {}).items():
+        lines.append(f"startup {agent_mode:5} register p50={r['p50']}ms p95={r['p95']}ms (n={r['samples']})")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m runner_agent.bench")
+    parser.add_argument("--output", "-o", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--channels", default=",".join(CHANNELS))
+    parser.add_argument("--rtt-samples", type=int, default=BenchOptions.rtt_samples)
+    parser.add_argument("--idle-seconds", type=float, default=BenchOptions.idle_seconds)
+    parser.add_argument("--heartbeat-seconds", type=int, default=BenchOptions.heartbeat_seconds)
+    parser.add_argument("--poll-seconds", type=int, default=BenchOptions.poll_seconds)
+    parser.add_argument("--long-poll-seconds", type=int, default=BenchOptions.long_poll_seconds)
+    parser.add_argument("--rustdesk-seconds", type=float, default=BenchOptions.rustdesk_seconds)
+    parser.add_argument("--tmate-seconds", type=float, default=BenchOptions.tmate_seconds)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--agent-mode", default="auto", choices=("auto", *AGENT_MODES), help="AGENT_MODE for the channel runs")
+    parser.add_argument("--startup-samples", type=int, default=BenchOptions.startup_samples, help="cold starts per agent mode (0 skips)")
+    parser.add_argument("--think-seconds", type=float, default=BenchOptions.think_seconds, help="delay before picking a duration")
+    parser.add_argument("--no-warmup", action="store_true", help="disable the speculative startup (WARMUP=0)")
+    parser.add_argument("--verbose", action="store_true", help="show agent output")
+    args = parser.parse_args(argv)
+
+    channels = tuple(c.strip() for c in args.channels.split(",") if c.strip())
+    unknown = [c for c in channels if c not in CHANNELS]
+    if unknown:
+        parser.error(f"unknown channel(s): {', '.join(unknown)}")
+    opts = BenchOptions(
+        channels=channels,
+        rtt_samples=args.rtt_samples,
+        idle_seconds=args.idle_seconds,
+        heartbeat_seconds=args.heartbeat_seconds,
+        poll_seconds=args.poll_seconds,
+        long_poll_seconds=args.long_poll_seconds,
+        rustdesk_seconds=args.rustdesk_seconds,
+        tmate_seconds=args.tmate_seconds,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        agent_mode=args.agent_mode,
+        startup_samples=args.startup_samples,
+        think_seconds=args.think_seconds,
+        warmup=not args.no_warmup,
+        verbose=args.verbose,
+    )
+    report = run_suite(opts)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(format_report(report), file=sys.stderr)
+    else:
+        print(text)
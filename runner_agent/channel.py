@@ -0,0 +1,235 @@
+import json
+import time
+
+from .worker_client import WorkerClient
+
+
+def normalize_updates(data) -> list[dict]:
+    # Workers answer either with the legacy single command
+    # ({"command_type": ..., "payload": ...}) or a list under "commands".
+    if not data:
+        return []
+    if isinstance(data, list):
+        items = data
+    elif isinstance(data, dict) and isinstance(data.get("commands"), list):
+        items = data["commands"]
+    elif isinstance(data, dict) and "payload" in data:
+        items = [data]
+    else:
+        return []
+    return [item for item in items if isinstance(item, dict) and "payload" in item]
+
+
+def command_seq(item: dict) -> int | None:
+    try:
+        return int(item["seq"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class CommandCursor:
+    # Batch protocol: commands carry a per-chat "seq"; the agent acks the
+    # highest seq it has handled on its next request (ack= / Last-Event-ID)
+    # and the worker re-sends anything newer. Redelivered commands are
+    # dropped here. Legacy commands without seq pass straight through.
+    def __init__(self):
+        self.last_seq: int | None = None
+        self.duplicates = 0
+
+    def fresh(self, commands: list[dict]) -> list[dict]:
+        if not any(command_seq(c) is not None for c in commands):
+            return commands
+        ordered = sorted(commands, key=lambda c: (command_seq(c) is None, command_seq(c) or 0))
+        result = []
+        seen = set()
+        for item in ordered:
+            seq = command_seq(item)
+            if seq is not None and ((self.last_seq is not None and seq <= self.last_seq) or seq in seen):
+                self.duplicates += 1
+                continue
+            seen.add(seq)
+            result.append(item)
+        return result
+
+    def done(self, item: dict) -> None:
+        seq = command_seq(item)
+        if seq is not None and (self.last_seq is None or seq > self.last_seq):
+            self.last_seq = seq
+
+
+class ShortPollChannel:
+    name = "poll"
+
+    def __init__(self, worker: WorkerClient, poll_seconds: int, cursor: CommandCursor | None = None):
+        self.worker = worker
+        self.poll_seconds = poll_seconds
+        self.cursor = cursor or CommandCursor()
+
+    def next_commands(self) -> list[dict]:
+        try:
+            commands = normalize_updates(self.worker.poll_updates(ack=self.cursor.last_seq))
+        except Exception:
+            commands = []
+        if not commands:
+            time.sleep(self.poll_seconds)
+        return commands
+
+    def close(self) -> None:
+        pass
+
+
+class LongPollChannel:
+    name = "longpoll"
+
+    def __init__(self, worker: WorkerClient, hold_seconds: int, poll_seconds: int, cursor: CommandCursor | None = None):
+        self.worker = worker
+        self.hold_seconds = hold_seconds
+        self.poll_seconds = poll_seconds
+        self.cursor = cursor or CommandCursor()
+
+    def next_commands(self) -> list[dict]:
+        start = time.monotonic()
+        commands = normalize_updates(self.worker.poll_updates(wait=self.hold_seconds, ack=self.cursor.last_seq))
+        if not commands and time.monotonic() - start < min(1.0, self.hold_seconds / 10):
+            # An empty answer that came back immediately means the worker did
+            # not hold the request; don't turn that into a busy loop.
+            time.sleep(self.poll_seconds)
+        return commands
+
+    def close(self) -> None:
+        pass
+
+
+class SSEChannel:
+    name = "sse"
+
+    def __init__(self, worker: WorkerClient, hold_seconds: int, cursor: CommandCursor | None = None):
+        self.worker = worker
+        self.hold_seconds = hold_seconds
+        self.cursor = cursor or CommandCursor()
+        self._resp = None
+        self._lines = None
+
+    def _connect(self) -> None:
+        # The worker is expected to send a comment line at least every
+        # hold_seconds; a silent stream past that is treated as dead.
+        # Reconnects resume after the last handled command.
+        self._resp = self.worker.open_update_stream(self.hold_seconds + 10, last_event_id=self.cursor.last_seq)
+        if self._resp is None:
+            raise RuntimeError("update stream unavailable")
+        self._lines = self._resp.iter_lines(decode_unicode=True)
+
+    def next_commands(self) -> list[dict]:
+        if self._lines is None:
+            self._connect()
+        data_lines = []
+        try:
+            for line in self._lines:
+                if line is None:
+                    continue
+                if line == "":
+                    if data_lines:
+                        break
+                    continue
+                if line.startswith(":"):
+                    # Keep-alive comment: hand control back so the caller can
+                    # run its periodic work (heartbeats) between events.
+                    if not data_lines:
+                        return []
+                    continue
+                if line.startswith("data:"):
+                    data_lines.append(line[5:].lstrip())
+                # "id:" lines need no handling: every command carries its seq.
+            else:
+                raise RuntimeError("update stream closed")
+        except Exception:
+            self.close()
+            raise
+        try:
+            return normalize_updates(json.loads("\n".join(data_lines)))
+        except Exception:
+            return []
+
+    def close(self) -> None:
+        if self._resp is not None:
+            try:
+                self._resp.close()
+            except Exception:
+                pass
+        self._resp = None
+        self._lines = None
+
+
+class NegotiatedChannel:
+    # Uses the best channel the worker advertised and steps down to the next
+    # one after repeated failures; short polling is always the last resort.
+    max_failures = 3
+
+    def __init__(self, channels: list, cursor: CommandCursor | None = None):
+        self.channels = channels
+        self.cursor = cursor or CommandCursor()
+        self._failures = 0
+
+    @property
+    def active(self):
+        return self.channels[0]
+
+    @property
+    def name(self) -> str:
+        return self.active.name
+
+    def next_commands(self) -> list[dict]:
+        try:
+            commands = self.active.next_commands()
+            self._failures = 0
+            return self.cursor.fresh(commands)
+        except Exception as exc:
+            self._failures += 1
+            if self._failures >= self.max_failures and len(self.channels) > 1:
+                print(f"Command channel {self.active.name} failed ({exc}); falling back")
+                self.active.close()
+                self.channels.pop(0)
+                self._failures = 0
+            else:
+                time.sleep(min(2 ** self._failures, 30))
+            return []
+
+    def ack(self, item: dict) -> None:
+        self.cursor.done(item)
+
+    def close(self) -> None:
+        for channel in self.channels:
+            channel.close()
+
+
+CHANNEL_ORDER = ("sse", "longpoll", "poll")
+
+
+def open_channel(worker: WorkerClient, mode: str, poll_seconds: int, hold_seconds: int) -> NegotiatedChannel:
+    mode = (mode or "auto").lower()
+    if mode == "poll":
+        offered = set()
+    else:
+        try:
+            caps = worker.capabilities()
+        except Exception:
+            caps = {}
+        offered = set(caps.get("channels") or [])
+        try:
+            hold_seconds = min(hold_seconds, int(caps.get("max_hold_seconds") or hold_seconds))
+        except Exception:
+            pass
+        if mode in CHANNEL_ORDER:
+            offered &= {mode}
+
+    # One cursor for every fallback level, so a step down neither replays
+    # nor skips commands.
+    cursor = CommandCursor()
+    channels = []
+    for name in CHANNEL_ORDER:
+        if name == "sse" and name in offered:
+            channels.append(SSEChannel(worker, hold_seconds, cursor))
+        elif name == "longpoll" and name in offered:
+            channels.append(LongPollChannel(worker, hold_seconds, poll_seconds, cursor))
+    channels.append(ShortPollChannel(worker, poll_seconds, cursor))
+    return NegotiatedChannel(channels, cursor)
@@ -2,8 +2,11 @@ import os
 import platform
 import secrets
 import string
+import tempfile
 from dataclasses import dataclass
 
+from .profiles import DEFAULT_PROFILE, normalize_profile
+
 
 def _gen_password(length: int = 12) -> str:
     alphabet = string.ascii_letters + string.digits
@@ -38,6 +41,38 @@ class Config:
     heartbeat_seconds: int = 60
     poll_seconds: int = 2
     max_duration_minutes: int = 360
+    http_pool_size: int = 4
+    command_channel: str = "auto"
+    long_poll_seconds: int = 25
+    outbox_max_items: int = 200
+    trace_path: str = os.path.join(tempfile.gettempdir(), "gibrunner-trace.json")
+    phases_file: str | None = None
+    sample_seconds: float = 5.0
+    # Empty/None disables session snapshots (and resuming after a restart).
+    state_path: str | None = os.path.join(tempfile.gettempdir(), "gibrunner-state.json")
+    # low-bandwidth | balanced | high-fidelity | auto
+    profile: str = DEFAULT_PROFILE
+    # Idle shutdown is opt-in (0 disables it); the warning goes out
+    # idle_warn_minutes early. A 1-minute CPU average at or above
+    # idle_cpu_percent counts as activity (a build left running in tmate),
+    # 0 ignores CPU.
+    idle_minutes: int = 0
+    idle_warn_minutes: int = 5
+    idle_cpu_percent: float = 10.0
+    idle_check_seconds: int = 30
+    # Empty/None disables the runner-local control socket.
+    control_socket: str | None = os.path.join(tempfile.gettempdir(), "gibrunner.sock")
+    # Telegram mode: start RustDesk/tmate while the duration menu is open.
+    # After the pick, a warm-up still running after warmup_wait_seconds is
+    # cancelled and the startup begins again from scratch.
+    warmup: bool = True
+    warmup_wait_seconds: int = 180
+    # AGENT_PROFILER=1: stack sampling + tracemalloc, dumped at shutdown or
+    # via `gibrunner profile`.
+    profiler: bool = False
+    profiler_dir: str = tempfile.gettempdir()
+    profiler_interval_ms: int = 20
+    profiler_malloc: bool = True
 
     @classmethod
     def from_env(cls) -> "Config":
@@ -47,6 +82,42 @@ class Config:
         except Exception:
             requested_duration = 360
         requested_duration = max(60, min(360, requested_duration))
+        try:
+            http_pool_size = max(1, int(os.getenv('HTTP_POOL_SIZE', '4') or '4'))
+        except Exception:
+            http_pool_size = 4
+        try:
+            long_poll_seconds = max(5, min(55, int(os.getenv('LONG_POLL_SECONDS', '25') or '25')))
+        except Exception:
+            long_poll_seconds = 25
+        try:
+            sample_seconds = max(1.0, float(os.getenv('SAMPLE_SECONDS', '5') or '5'))
+        except Exception:
+            sample_seconds = 5.0
+        try:
+            idle_minutes = max(0, int(os.getenv('IDLE_MINUTES', '0') or '0'))
+        except Exception:
+            idle_minutes = 0
+        try:
+            idle_warn_minutes = max(0, int(os.getenv('IDLE_WARN_MINUTES', '5') or '5'))
+        except Exception:
+            idle_warn_minutes = 5
+        try:
+            idle_cpu_percent = max(0.0, float(os.getenv('IDLE_CPU_PERCENT', '10') or '10'))
+        except Exception:
+            idle_cpu_percent = 10.0
+        try:
+            idle_check_seconds = max(5, int(os.getenv('IDLE_CHECK_SECONDS', '30') or '30'))
+        except Exception:
+            idle_check_seconds = 30
+        try:
+            warmup_wait_seconds = max(10, int(os.getenv('WARMUP_WAIT_SECONDS', '180') or '180'))
+        except Exception:
+            warmup_wait_seconds = 180
+        try:
+            profiler_interval_ms = max(1, int(os.getenv('AGENT_PROFILER_INTERVAL_MS', '20') or '20'))
+        except Exception:
+            profiler_interval_ms = 20
         return cls(
             chat_id=os.getenv('TG_CHATID', ''),
             worker_url=os.getenv('WORKER_URL', ''),
@@ -56,4 +127,23 @@ class Config:
             rustdesk_password=normalize_rustdesk_password(system_os, os.getenv('RUSTDESK_PASSWORD')),
             runner_secret=os.getenv('SESSION_SECRET', ''),
             requested_duration_minutes=requested_duration,
+            http_pool_size=http_pool_size,
+            command_channel=os.getenv('COMMAND_CHANNEL', 'auto').lower(),
+            long_poll_seconds=long_poll_seconds,
+            trace_path=os.getenv('TRACE_PATH') or os.path.join(tempfile.gettempdir(), "gibrunner-trace.json"),
+            phases_file=os.getenv('GIBRUNNER_PHASES') or None,
+            sample_seconds=sample_seconds,
+            profile=normalize_profile(os.getenv('PERFORMANCE_PROFILE')),
+            idle_minutes=idle_minutes,
+            idle_warn_minutes=idle_warn_minutes,
+            idle_cpu_percent=idle_cpu_percent,
+            idle_check_seconds=idle_check_seconds,
+            warmup=os.getenv('WARMUP', '1').lower() not in ('0', 'false', 'no', 'off'),
+            warmup_wait_seconds=warmup_wait_seconds,
+            profiler=os.getenv('AGENT_PROFILER', '').lower() in ('1', 'true', 'yes', 'on'),
+            profiler_dir=os.getenv('AGENT_PROFILER_DIR') or tempfile.gettempdir(),
+            profiler_interval_ms=profiler_interval_ms,
+            profiler_malloc=os.getenv('AGENT_PROFILER_MALLOC', '1').lower() not in ('0', 'false', 'no', 'off'),
+            control_socket=os.getenv('CONTROL_SOCKET', os.path.join(tempfile.gettempdir(), "gibrunner.sock")) or None,
+            state_path=os.getenv('STATE_PATH', os.path.join(tempfile.gettempdir(), "gibrunner-state.json")) or None,
         )
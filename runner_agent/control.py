@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import secrets
+import socket
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable
+
+# Local control API for people already inside the session (tmate shell or
+# the RustDesk desktop): one JSON request per connection, one JSON reply.
+# Linux listens on a user-only Unix socket; Windows, where asyncio has no
+# Unix server, on 127.0.0.1 with a random token kept in a user-only file.
+
+COMMANDS = ("status", "remaining", "extend", "kill", "profile")
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "gibrunner.sock")
+MAX_REQUEST_BYTES = 4096
+
+
+def default_address() -> str:
+    return os.getenv("CONTROL_SOCKET") or DEFAULT_SOCKET
+
+
+def _token_file(address: str) -> str:
+    return address + ".json"
+
+
+class ControlServer:
+    def __init__(self, address: str, handler: Callable[[dict], dict | Awaitable[dict]]):
+        self.address = address
+        self.handler = handler
+        self.requests = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._token: str | None = None
+
+    async def start(self) -> None:
+        if hasattr(socket, "AF_UNIX") and sys.platform != "win32":
+            if os.path.exists(self.address):
+                # Left behind by an agent that did not exit cleanly.
+                os.unlink(self.address)
+            old_umask = os.umask(0o177)
+            try:
+                self._server = await asyncio.start_unix_server(self._serve, path=self.address)
+            finally:
+                os.umask(old_umask)
+            print(f"Control socket: {self.address}")
+            return
+        self._token = secrets.token_urlsafe(24)
+        self._server = await asyncio.start_server(self._serve, host="127.0.0.1", port=0)
+        port = self._server.sockets[0].getsockname()[1]
+        path = _token_file(self.address)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump({"port": port, "token": self._token}, fh)
+        print(f"Control port: 127.0.0.1:{port} ({path})")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            reply = await self._dispatch(line[:MAX_REQUEST_BYTES])
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+            await writer.drain()
+        except Exception as exc:
+            print(f"control request failed: {exc}")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line or b"{}")
+        except ValueError:
+            return {"ok": False, "error": "bad request"}
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "bad request"}
+        if self._token is not None and not secrets.compare_digest(str(request.get("token", "")), self._token):
+            return {"ok": False, "error": "forbidden"}
+        if request.get("cmd") not in COMMANDS:
+            return {"ok": False, "error": f"unknown command, use one of: {', '.join(COMMANDS)}"}
+        self.requests += 1
+        try:
+            # Handlers answer in place; slow commands return an awaitable so
+            # the loop keeps running while they finish.
+            reply = self.handler(request)
+            if inspect.isawaitable(reply):
+                reply = await reply
+            return reply
+        except Exception as exc:
+            return {"ok": False, "error": str(exc)}
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._server.wait_closed(), timeout=2)
+        except Exception:
+            pass
+        path = self.address if self._token is None else _token_file(self.address)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        self._server = None
+
+
+def install_launcher(address: str) -> str | None:
+    # `gibrunner <cmd>` for the tmate shell and the desktop terminal; the
+    # runner image has ~/.local/bin on PATH.
+    if sys.platform == "win32":
+        return None
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.path.expanduser("~/.local/bin/gibrunner")
+    script = (
+        "#!/bin/sh\n"
+        f"CONTROL_SOCKET=\"${{CONTROL_SOCKET:-{address}}}\" PYTHONPATH=\"{root}${{PYTHONPATH:+:$PYTHONPATH}}\" "
+        f"exec \"{sys.executable}\" -m runner_agent.control \"$@\"\n"
+    )
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(script)
+        os.chmod(path, 0o755)
+    except OSError as exc:
+        print(f"control launcher not installed: {exc}")
+        return None
+    return path
+
+
+def request(cmd: str, address: str | None = None, timeout: float = 5.0) -> dict:
+    address = address or default_address()
+    body = {"cmd": cmd}
+    if hasattr(socket, "AF_UNIX") and sys.platform != "win32":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        target = address
+    else:
+        with open(_token_file(address), encoding="utf-8") as fh:
+            info = json.load(fh)
+        body["token"] = info["token"]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        target = ("127.0.0.1", int(info["port"]))
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(target)
+        sock.sendall(json.dumps(body).encode("utf-8") + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data or b"{}")
+
+
+def _format(cmd: str, reply: dict) -> str:
+    if not reply.get("ok"):
+        return f"error: {reply.get('error') or reply.get('result') or 'failed'}"
+    left = reply.get("remaining_minutes")
+    if cmd == "remaining":
+        return f"{left} min left" if left is not None else "session not started"
+    if cmd == "extend":
+        return f"extended: {left} min left (total {reply.get('duration')} min)"
+    if cmd == "kill":
+        return "shutting down"
+    if cmd == "profile":
+        shares = ", ".join(f"{name} {pct}%" for name, pct in (reply.get("wall_share_percent") or {}).items())
+        return (
+            f"{reply.get('samples')} samples over {reply.get('seconds')}s "
+            f"(agent cpu {reply.get('cpu_percent')}%, profiler {reply.get('overhead_percent')}%)\n"
+            f"by category: {shares}\nstacks: {reply.get('folded')}\nallocations: {reply.get('allocations')}"
+        )
+    lines = [f"session: {'running' if reply.get('started') else 'starting' if reply.get('duration') else 'waiting'}"]
+    if not reply.get("started") and reply.get("warmup") not in (None, "none"):
+        lines[0] += f" (warm-up {reply['warmup']})"
+    if left is not None:
+        lines.append(f"time left: {left} min of {reply.get('duration')} (extended {reply.get('extensions')}x)")
+    if reply.get("rustdesk_id"):
+        lines.append(f"rustdesk id: {reply['rustdesk_id']}")
+    if reply.get("tmate_ssh"):
+        lines.append(f"tmate: {reply['tmate_ssh']}")
+    metrics = reply.get("metrics") or {}
+    if metrics:
+        lines.append(f"cpu {metrics.get('cpu')}% ram {metrics.get('ram')}% swap {metrics.get('swap')}%")
+    idle = reply.get("idle")
+    if idle:
+        lines.append(f"idle {idle.get('idle_s')}s of {idle.get('idle_minutes')}m allowed")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="gibrunner", description="Control the running session from inside the runner.")
+    parser.add_argument("cmd", choices=COMMANDS)
+    parser.add_argument("--socket", default=None, help=f"control socket (default: $CONTROL_SOCKET or {DEFAULT_SOCKET})")
+    parser.add_argument("--json", action="store_true", help="print the raw reply")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    try:
+        reply = request(args.cmd, args.socket)
+    except (OSError, ValueError) as exc:
+        print(f"agent not reachable: {exc}", file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps({**reply, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}, indent=2))
+    else:
+        print(_format(args.cmd, reply))
+    return 0 if reply.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
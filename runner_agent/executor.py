@@ -0,0 +1,220 @@
+import contextvars
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+TIMEOUT_RC = 124
+NOT_FOUND_RC = 127
+CANCELLED_RC = 125
+
+
+@dataclass
+class CommandRecord:
+    label: str
+    duration: float
+    returncode: int
+    retries: int
+    timed_out: bool
+    started_at: float
+    started_mono: float
+
+
+_records: deque[CommandRecord] = deque(maxlen=500)
+_summary: dict[str, dict] = {}
+_lock = threading.Lock()
+_listeners: list[Callable[[CommandRecord], None]] = []
+# Set for speculative work (the pre-duration warm-up): once the event fires,
+# running commands are killed and new ones are refused. Thread pools pick it
+# up through tracing.bind, which copies the submitting context.
+_cancel: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar("executor_cancel", default=None)
+# oom_score_adj written into every child before exec. The agent protects
+# itself from the OOM killer (tuning.apply); the desktop and whatever the
+# user runs must not inherit that. None leaves the inherited score alone.
+_child_oom_score_adj: int | None = None
+
+
+@contextmanager
+def cancel_scope(event: threading.Event | None):
+    token = _cancel.set(event)
+    try:
+        yield
+    finally:
+        _cancel.reset(token)
+
+
+def cancelled() -> bool:
+    event = _cancel.get()
+    return event is not None and event.is_set()
+
+
+def set_child_oom_score_adj(score: int | None) -> None:
+    global _child_oom_score_adj
+    _child_oom_score_adj = score
+
+
+def _child_setup() -> Callable[[], None] | None:
+    score = _child_oom_score_adj
+    if score is None:
+        return None
+
+    def reset() -> None:
+        # Raising the score needs no privileges; lowering it back does.
+        try:
+            with open("/proc/self/oom_score_adj", "w") as fh:
+                fh.write(str(score))
+        except OSError:
+            pass
+
+    return reset
+
+
+def add_listener(callback: Callable[[CommandRecord], None]) -> None:
+    with _lock:
+        _listeners.append(callback)
+
+
+def default_label(cmd) -> str:
+    # Never log the full argv: RustDesk passwords are passed as arguments.
+    if isinstance(cmd, str):
+        return cmd.split()[0] if cmd.split() else cmd
+    parts = list(cmd)
+    if parts[:2] == ["sudo", "-n"]:
+        parts = parts[2:]
+    if not parts:
+        return "?"
+    name = os.path.basename(str(parts[0]))
+    flag = next((str(p) for p in parts[1:] if str(p).startswith("-") and str(p) != "-S"), "")
+    return f"{name} {flag}".strip()
+
+
+def _record(record: CommandRecord) -> None:
+    with _lock:
+        _records.append(record)
+        entry = _summary.setdefault(record.label, {"count": 0, "failures": 0, "timeouts": 0, "retries": 0, "total_s": 0.0, "max_s": 0.0})
+        entry["count"] += 1
+        entry["retries"] += record.retries
+        entry["total_s"] += record.duration
+        entry["max_s"] = max(entry["max_s"], record.duration)
+        if record.returncode != 0:
+            entry["failures"] += 1
+        if record.timed_out:
+            entry["timeouts"] += 1
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(record)
+        except Exception:
+            pass
+
+
+def command_records() -> list[dict]:
+    with _lock:
+        return [asdict(r) for r in _records]
+
+
+def command_summary() -> dict[str, dict]:
+    with _lock:
+        return {
+            label: {**entry, "total_s": round(entry["total_s"], 3), "max_s": round(entry["max_s"], 3)}
+            for label, entry in sorted(_summary.items())
+        }
+
+
+def _run_cancellable(cmd, shell: bool, timeout: float, env: dict | None, cancel: threading.Event) -> tuple[subprocess.CompletedProcess, bool]:
+    try:
+        proc = subprocess.Popen(
+            cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env,
+            preexec_fn=_child_setup(),
+        )
+    except OSError as exc:
+        return subprocess.CompletedProcess(cmd, NOT_FOUND_RC, "", str(exc)), False
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            out, err = proc.communicate(timeout=min(0.25, max(0.01, deadline - time.monotonic())))
+            return subprocess.CompletedProcess(cmd, proc.returncode, out, err), False
+        except subprocess.TimeoutExpired:
+            pass
+        if cancel.is_set() or time.monotonic() >= deadline:
+            proc.kill()
+            out, _ = proc.communicate()
+            if cancel.is_set():
+                return subprocess.CompletedProcess(cmd, CANCELLED_RC, out or "", "cancelled"), False
+            return subprocess.CompletedProcess(cmd, TIMEOUT_RC, out or "", f"timed out after {timeout}s"), True
+
+
+def _run_once(cmd, shell: bool, timeout: float, env: dict | None) -> tuple[subprocess.CompletedProcess, bool]:
+    cancel = _cancel.get()
+    if cancel is not None:
+        return _run_cancellable(cmd, shell, timeout, env, cancel)
+    try:
+        proc = subprocess.run(
+            cmd, shell=shell, capture_output=True, text=True, timeout=timeout, env=env,
+            preexec_fn=_child_setup(),
+        )
+        return proc, False
+    except subprocess.TimeoutExpired as exc:
+        out = exc.stdout.decode(errors="replace") if isinstance(exc.stdout, bytes) else (exc.stdout or "")
+        return subprocess.CompletedProcess(cmd, TIMEOUT_RC, out, f"timed out after {timeout}s"), True
+    except OSError as exc:
+        # Missing binary, no exec permission, ENOEXEC...: all "could not run".
+        return subprocess.CompletedProcess(cmd, NOT_FOUND_RC, "", str(exc)), False
+
+
+def run(
+    cmd,
+    timeout: float = 20,
+    label: str | None = None,
+    retries: int = 0,
+    retry_delay: float = 0.5,
+    max_retry_delay: float = 2.0,
+    ok: Callable[[subprocess.CompletedProcess], bool] | None = None,
+    shell: bool = False,
+    env: dict | None = None,
+) -> subprocess.CompletedProcess:
+    # Every external command in the runtime goes through here: it always has a
+    # timeout, never raises for timeouts or unrunnable binaries (rc 124/127), and
+    # is recorded with duration, exit code and retry count. Inside a
+    # cancel_scope a cancelled command comes back with rc 125.
+    ok = ok or (lambda p: p.returncode == 0)
+    label = label or default_label(cmd)
+    started_at = time.time()
+    start = time.monotonic()
+    attempt = 0
+    delay = retry_delay
+    while True:
+        if cancelled():
+            proc, timed_out = subprocess.CompletedProcess(cmd, CANCELLED_RC, "", "cancelled"), False
+            break
+        proc, timed_out = _run_once(cmd, shell, timeout, env)
+        if ok(proc) or attempt >= retries:
+            break
+        attempt += 1
+        time.sleep(delay)
+        delay = min(max_retry_delay, delay * 2)
+    _record(CommandRecord(label, time.monotonic() - start, proc.returncode, attempt, timed_out, started_at, start))
+    return proc
+
+
+def spawn(cmd, label: str | None = None, **kwargs) -> subprocess.Popen | None:
+    label = label or default_label(cmd)
+    kwargs.setdefault("stdout", subprocess.DEVNULL)
+    kwargs.setdefault("stderr", subprocess.DEVNULL)
+    kwargs.setdefault("preexec_fn", _child_setup())
+    start = time.monotonic()
+    if cancelled():
+        _record(CommandRecord(f"spawn {label}", 0.0, CANCELLED_RC, 0, False, time.time(), start))
+        return None
+    try:
+        proc = subprocess.Popen(cmd, **kwargs)
+        rc = 0
+    except OSError as exc:
+        print(f"{label} spawn failed: {exc}")
+        proc, rc = None, NOT_FOUND_RC
+    _record(CommandRecord(f"spawn {label}", time.monotonic() - start, rc, 0, False, time.time(), start))
+    return proc
@@ -0,0 +1,83 @@
+import threading
+import time
+
+
+class IdleMonitor:
+    # Decides when an unused session should be released. Activity is fed in
+    # from runtime.session_activity (RustDesk peers, tmate clients, X input
+    # idle time) plus the sampler's CPU average and any command from the chat.
+    def __init__(self, idle_seconds: float, warn_seconds: float, cpu_percent: float = 0.0):
+        self.idle_seconds = max(60.0, idle_seconds)
+        self.warn_seconds = max(0.0, min(warn_seconds, self.idle_seconds - 30))
+        self.cpu_percent = max(0.0, cpu_percent)
+        self._lock = threading.Lock()
+        self._last_active = time.monotonic()
+        self._last_reason = "session start"
+        self._warned = False
+        self.warnings = 0
+        self.last_activity: dict = {}
+
+    def thresholds(self) -> dict:
+        return {
+            "idle_minutes": round(self.idle_seconds / 60, 1),
+            "warn_minutes": round(self.warn_seconds / 60, 1),
+            "cpu_percent": self.cpu_percent or None,
+        }
+
+    def touch(self, reason: str, now: float | None = None) -> bool:
+        # Returns True when this cleared a pending warning.
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_active = max(self._last_active, now)
+            self._last_reason = reason
+            cleared, self._warned = self._warned, False
+        return cleared
+
+    def idle_for(self, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return max(0.0, now - self._last_active)
+
+    def _active_reason(self, activity: dict, now: float) -> tuple[str | None, float]:
+        if activity.get("rustdesk_peers"):
+            return "rustdesk peer", now
+        if activity.get("tmate_clients"):
+            return "tmate client", now
+        input_idle = activity.get("input_idle_s")
+        if input_idle is not None and now - input_idle > self._last_active:
+            return "input", now - input_idle
+        cpu = activity.get("cpu")
+        if self.cpu_percent and cpu is not None and cpu >= self.cpu_percent:
+            return "cpu", now
+        return None, now
+
+    def observe(self, activity: dict, now: float | None = None) -> str | None:
+        # Returns "resumed" (activity after a warning), "warn", "shutdown" or
+        # None; each warning is only returned once per idle stretch.
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.last_activity = dict(activity)
+            reason, at = self._active_reason(activity, now)
+        if reason is not None:
+            return "resumed" if self.touch(reason, at) else None
+        idle = self.idle_for(now)
+        with self._lock:
+            if idle >= self.idle_seconds:
+                return "shutdown"
+            if not self._warned and idle >= self.idle_seconds - self.warn_seconds:
+                self._warned = True
+                self.warnings += 1
+                return "warn"
+        return None
+
+    def summary(self, now: float | None = None) -> dict:
+        with self._lock:
+            last_reason = self._last_reason
+            activity = dict(self.last_activity)
+        return {
+            **self.thresholds(),
+            "idle_s": round(self.idle_for(now), 1),
+            "last_activity": last_reason,
+            "warnings": self.warnings,
+            "signals": activity,
+        }
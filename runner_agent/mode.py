@@ -0,0 +1,41 @@
+import importlib.util
+import os
+
+# AGENT_MODE picks the agent's third-party footprint:
+#   full - requests transport, psutil metrics (the original setup)
+#   lite - bare interpreter: http.client transport, /proc metrics
+#   auto - full where requests/psutil are importable, lite pieces otherwise
+AGENT_MODES = ("auto", "full", "lite")
+
+
+def agent_mode() -> str:
+    value = (os.getenv("AGENT_MODE") or "auto").strip().lower()
+    return value if value in AGENT_MODES else "auto"
+
+
+def available(module: str) -> bool:
+    # find_spec does not import the module, so asking is cheap.
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def http_backend() -> str:
+    mode = agent_mode()
+    if mode == "lite" or not available("requests"):
+        return "stdlib"
+    return "requests"
+
+
+def metrics_backend() -> str:
+    mode = agent_mode()
+    if os.path.exists("/proc/stat") and (mode == "lite" or not available("psutil")):
+        return "proc"
+    if available("psutil"):
+        return "psutil"
+    return "proc" if os.path.exists("/proc/stat") else "none"
+
+
+def describe() -> dict:
+    return {"mode": agent_mode(), "http": http_backend(), "metrics": metrics_backend()}
@@ -0,0 +1,340 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+from .worker_client import DeliveryError, WorkerClient
+
+PRIORITY_CRITICAL = 0
+PRIORITY_CONTROL = 1
+PRIORITY_CHAT = 2
+PRIORITY_HEARTBEAT = 3
+
+# Attempts before an item is given up on. Endpoint/stop payloads carry the
+# user's credentials and session teardown, so they keep retrying far longer.
+MAX_ATTEMPTS = {
+    PRIORITY_CRITICAL: 12,
+    PRIORITY_CONTROL: 8,
+    PRIORITY_CHAT: 5,
+    PRIORITY_HEARTBEAT: 1,
+}
+
+# Longest a burst of messages is held for batching, in coalesce windows.
+MAX_COALESCE_WINDOWS = 4
+
+
+@dataclass(order=True)
+class OutboundItem:
+    priority: int
+    seq: int
+    kind: str = field(compare=False)
+    path: str = field(compare=False)
+    body: dict = field(compare=False)
+    idempotency_key: str = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+    not_before: float = field(default=0.0, compare=False)
+    done: bool = field(default=False, compare=False)
+    on_done: Callable[[bool], None] | None = field(default=None, compare=False, repr=False)
+
+
+class Outbox:
+    def __init__(
+        self,
+        worker: WorkerClient,
+        max_items: int = 200,
+        coalesce_seconds: float = 0.05,
+        max_batch: int = 20,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.worker = worker
+        self.max_items = max(1, max_items)
+        self.coalesce_seconds = coalesce_seconds
+        self.max_batch = max(1, max_batch)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._heap: list[OutboundItem] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._event: asyncio.Event | None = None
+        self._in_flight = 0
+        self._last_message_at = float("-inf")
+        self._burst = False
+        self._latencies: deque[float] = deque(maxlen=256)
+        self._counters = {
+            "enqueued": 0,
+            "delivered": 0,
+            "failed": 0,
+            "dropped": 0,
+            "retries": 0,
+            "batches": 0,
+        }
+
+    def put(
+        self,
+        kind: str,
+        path: str,
+        body: dict | None,
+        priority: int = PRIORITY_CHAT,
+        replace: bool = False,
+        on_done: Callable[[bool], None] | None = None,
+    ) -> bool:
+        if body is None:
+            return False
+        item = OutboundItem(
+            priority=priority,
+            seq=next(self._seq),
+            kind=kind,
+            path=path,
+            body=body,
+            idempotency_key=uuid.uuid4().hex,
+            enqueued_at=time.monotonic(),
+            on_done=on_done,
+        )
+        dropped: list[OutboundItem] = []
+        rejected = False
+        with self._lock:
+            if replace:
+                # Only the newest pending item of this kind matters (heartbeats).
+                kept = [it for it in self._heap if it.kind != kind]
+                if len(kept) != len(self._heap):
+                    self._counters["dropped"] += len(self._heap) - len(kept)
+                    dropped = [it for it in self._heap if it.kind == kind]
+                    self._heap = kept
+                    heapq.heapify(self._heap)
+            if len(self._heap) >= self.max_items:
+                # Back-pressure: make room by evicting the least important,
+                # newest item; if that is the incoming one, reject it instead.
+                # Critical items are never rejected, but once nothing else is
+                # left the oldest one goes: a newer endpoint/stop supersedes it.
+                victim = max(self._heap)
+                if victim.priority <= priority and priority != PRIORITY_CRITICAL:
+                    victim, rejected = item, True
+                elif victim.priority <= priority:
+                    victim = min(self._heap)
+                if not rejected:
+                    self._heap.remove(victim)
+                    heapq.heapify(self._heap)
+                self._counters["dropped"] += 1
+                dropped.append(victim)
+            if not rejected:
+                heapq.heappush(self._heap, item)
+                self._counters["enqueued"] += 1
+                if kind == "message":
+                    self._burst = item.enqueued_at - self._last_message_at < self.coalesce_seconds
+                    self._last_message_at = item.enqueued_at
+        # Whoever waits on a dropped item hears about it (endpoint delivery
+        # state, the user's error message) instead of waiting forever.
+        for victim in dropped:
+            self._finish(victim, False, counted=False)
+        if rejected:
+            return False
+        self._wake()
+        return True
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._heap) + self._in_flight
+
+    def metrics(self) -> dict:
+        with self._lock:
+            depth_by_priority: dict[int, int] = {}
+            for item in self._heap:
+                depth_by_priority[item.priority] = depth_by_priority.get(item.priority, 0) + 1
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+            in_flight = self._in_flight
+        return {
+            "depth": sum(depth_by_priority.values()) + in_flight,
+            "depth_by_priority": depth_by_priority,
+            **counters,
+            "latency_ms": _percentiles(latencies),
+        }
+
+    def _wake(self) -> None:
+        loop, event = self._loop, self._event
+        if loop is None or event is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass
+
+    def _take_ready(self, now: float) -> list[OutboundItem]:
+        # Items wait behind an earlier item of the same priority that is backing
+        # off, so chat messages are never delivered out of order.
+        with self._lock:
+            blocked: set[int] = set()
+            ready: list[OutboundItem] = []
+            for item in sorted(self._heap):
+                if item.priority in blocked:
+                    continue
+                if item.not_before > now:
+                    blocked.add(item.priority)
+                    continue
+                if ready and not (item.kind == "message" and ready[-1].kind == "message"):
+                    break
+                ready.append(item)
+                if len(ready) >= self.max_batch or item.kind != "message":
+                    break
+            for item in ready:
+                self._heap.remove(item)
+            heapq.heapify(self._heap)
+            self._in_flight += len(ready)
+            return ready
+
+    def _next_wakeup(self, now: float) -> float | None:
+        # Only the head of each priority class can be sent next, so a backing
+        # off head decides when that class is due.
+        with self._lock:
+            heads: dict[int, OutboundItem] = {}
+            for item in self._heap:
+                head = heads.get(item.priority)
+                if head is None or item.seq < head.seq:
+                    heads[item.priority] = item
+            if not heads:
+                return None
+            return max(0.0, min(head.not_before for head in heads.values()) - now)
+
+    def _coalesce_delay(self, now: float) -> float:
+        # A lone message goes out at once; only while messages keep arriving
+        # back-to-back is the batch held open until they pause.
+        with self._lock:
+            if not self._burst or not self.coalesce_seconds:
+                return 0.0
+            ready = sum(1 for item in self._heap if item.kind == "message" and item.not_before <= now)
+            if ready >= self.max_batch:
+                return 0.0
+            return max(0.0, self._last_message_at + self.coalesce_seconds - now)
+
+    def send_pending(self) -> None:
+        # One delivery round; failures go back on the queue with backoff.
+        ready = self._take_ready(time.monotonic())
+        if not ready:
+            return
+        current = ready
+        try:
+            if len(ready) > 1 and self.worker.supports("batch"):
+                messages = [{**item.body, "idempotency_key": item.idempotency_key} for item in ready]
+                self.worker.send_message_batch(messages, idempotency_key=_batch_key(ready))
+                with self._lock:
+                    self._counters["batches"] += 1
+                for item in ready:
+                    self._finish(item, True)
+            else:
+                for item in ready:
+                    current = [item]
+                    self.worker.post_json(item.path, item.body, idempotency_key=item.idempotency_key)
+                    self._finish(item, True)
+        except DeliveryError as exc:
+            self._retry(current, exc)
+            untried = [item for item in ready if not item.done and item not in current]
+            with self._lock:
+                for item in untried:
+                    heapq.heappush(self._heap, item)
+        finally:
+            with self._lock:
+                self._in_flight -= len(ready)
+
+    def _finish(self, item: OutboundItem, ok: bool, counted: bool = True) -> None:
+        # counted=False for items already counted as dropped.
+        if item.done:
+            return
+        item.done = True
+        with self._lock:
+            if ok:
+                self._counters["delivered"] += 1
+                self._latencies.append((time.monotonic() - item.enqueued_at) * 1000)
+            elif counted:
+                self._counters["failed"] += 1
+        if item.on_done is not None:
+            try:
+                item.on_done(ok)
+            except Exception:
+                pass
+
+    def _retry(self, items: list[OutboundItem], exc: DeliveryError) -> None:
+        now = time.monotonic()
+        for item in items:
+            item.attempts += 1
+            if not exc.retryable or item.attempts >= MAX_ATTEMPTS.get(item.priority, 5):
+                print(f"Outbox: giving up on {item.kind} after {item.attempts} attempt(s): {exc}")
+                self._finish(item, False)
+                continue
+            delay = min(self.max_backoff, self.base_backoff * (2 ** (item.attempts - 1)))
+            item.not_before = now + delay
+            with self._lock:
+                heapq.heappush(self._heap, item)
+                self._counters["retries"] += 1
+
+    def flush_sync(self, timeout: float = 10.0) -> bool:
+        # For callers without a running loop: deliver inline, honouring backoff.
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.send_pending()
+            wait = self._next_wakeup(time.monotonic())
+            if wait is None:
+                return True
+            time.sleep(min(wait, max(0.0, deadline - time.monotonic())))
+        return self.depth() == 0
+
+    async def flush(self, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.depth() and time.monotonic() < deadline:
+            self._wake()
+            await asyncio.sleep(0.02)
+        return self.depth() == 0
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        try:
+            while True:
+                wait = self._next_wakeup(time.monotonic())
+                if wait is None or wait > 0:
+                    try:
+                        await asyncio.wait_for(self._event.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._event.clear()
+                # A steady trickle must not hold the batch forever.
+                hold_until = time.monotonic() + MAX_COALESCE_WINDOWS * self.coalesce_seconds
+                while True:
+                    now = time.monotonic()
+                    delay = min(self._coalesce_delay(now), hold_until - now)
+                    if delay <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._event.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._event.clear()
+                await asyncio.to_thread(self.send_pending)
+        finally:
+            self._loop = None
+            self._event = None
+
+
+def _batch_key(items: list[OutboundItem]) -> str:
+    # A retried batch can hold a different set of messages; keying it on the
+    # whole set keeps a deduplicating worker from dropping the new ones.
+    keys = "".join(sorted(item.idempotency_key for item in items))
+    return hashlib.sha256(keys.encode()).hexdigest()[:32]
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+
+    def pick(q: float) -> float:
+        return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "max": round(values[-1], 1)}
@@ -0,0 +1,202 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Opt-in (AGENT_PROFILER=1) wall-clock sampler for the agent's own threads.
+# Every tick records each thread's Python stack, so threads parked in a
+# subprocess wait or a socket read show up as much as busy ones; the folded
+# output loads straight into flamegraph.pl / speedscope. tracemalloc runs
+# alongside and is snapshotted periodically for the allocation report.
+
+# Checked leaf-first: the innermost matching frame decides the bucket.
+CATEGORIES = (
+    ("subprocess wait", ("subprocess.py",)),
+    ("json", ("json/decoder.py", "json/encoder.py", "json/__init__.py")),
+    ("metrics", ("psutil", "sysinfo.py", "sampler.py")),
+    ("network io", ("ssl.py", "socket.py", "http/client.py", "urllib3", "requests")),
+    ("event loop", ("selectors.py", "asyncio/base_events.py")),
+    ("thread wait", ("threading.py", "concurrent/futures", "queue.py")),
+)
+# The label cache holds code objects alive; generated code (dataclass
+# methods, exec'd templates) keeps adding new ones, so it is reset when full.
+MAX_LABELS = 4096
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename.replace("\\", "/")
+    parts = filename.rsplit("/", 2)
+    short = "/".join(parts[-2:]) if len(parts) > 1 else filename
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _category(stack: list) -> str:
+    for code in reversed(stack):
+        filename = code.co_filename.replace("\\", "/")
+        for name, needles in CATEGORIES:
+            if any(needle in filename for needle in needles):
+                return name
+    return "agent code"
+
+
+class Profiler:
+    def __init__(
+        self,
+        out_dir: str,
+        interval: float = 0.02,
+        trace_malloc: bool = True,
+        malloc_frames: int = 10,
+        snapshot_seconds: float = 60.0,
+    ):
+        self.out_dir = out_dir
+        self.interval = max(0.001, interval)
+        self.trace_malloc = trace_malloc
+        self.malloc_frames = malloc_frames
+        self.snapshot_seconds = snapshot_seconds
+        self.samples = 0
+        self.ticks = 0
+        self._stacks: Counter = Counter()
+        self._categories: Counter = Counter()
+        self._threads: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._baseline = None
+        self._latest = None
+        self._started = 0.0
+        self._cpu_start = 0.0
+        self._overhead = 0.0
+        self._labels: dict = {}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start(self.malloc_frames)
+        self._started = time.monotonic()
+        self._cpu_start = time.process_time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        print(f"Profiler: sampling every {self.interval * 1000:.0f}ms, tracemalloc={'on' if self.trace_malloc else 'off'}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        next_snapshot = time.monotonic() + min(5.0, self.snapshot_seconds)
+        while not self._stop.wait(self.interval):
+            tick_start = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                self.ticks += 1
+                for ident, frame in frames.items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(frame.f_code)
+                        frame = frame.f_back
+                    stack.reverse()
+                    thread = names.get(ident, f"thread-{ident}")
+                    labels = []
+                    for code in stack:
+                        label = self._labels.get(code)
+                        if label is None:
+                            if len(self._labels) >= MAX_LABELS:
+                                self._labels.clear()
+                            label = self._labels[code] = _frame_label(code)
+                        labels.append(label)
+                    key = ";".join([thread, *labels])
+                    self._stacks[key] += 1
+                    self._categories[_category(stack)] += 1
+                    self._threads[thread] += 1
+                    self.samples += 1
+            # Frames keep their locals alive; do not hold them between ticks.
+            frames = frame = None
+            if self.trace_malloc and tracemalloc.is_tracing() and time.monotonic() >= next_snapshot:
+                self._snapshot()
+                next_snapshot = time.monotonic() + self.snapshot_seconds
+            self._overhead += time.perf_counter() - tick_start
+
+    def _snapshot(self) -> None:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        with self._lock:
+            if self._baseline is None:
+                self._baseline = snapshot
+            self._latest = snapshot
+
+    def write_folded(self, path: str) -> int:
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        with open(path, "w", encoding="utf-8") as fh:
+            for key, count in stacks:
+                fh.write(f"{key} {count}\n")
+        return len(stacks)
+
+    def allocation_report(self, limit: int = 25) -> tuple[str, list[dict]]:
+        if not self.trace_malloc or not tracemalloc.is_tracing():
+            return "tracemalloc disabled\n", []
+        self._snapshot()
+        with self._lock:
+            baseline, latest = self._baseline, self._latest
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"traced now {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB",
+            "",
+            f"top {limit} allocation sites (live):",
+        ]
+        top = []
+        for stat in latest.statistics("lineno")[:limit]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size / 1024:9.1f} KiB {stat.count:7d} blocks  {frame.filename}:{frame.lineno}")
+            top.append({"site": f"{frame.filename}:{frame.lineno}", "kib": round(stat.size / 1024, 1), "blocks": stat.count})
+        if baseline is not None and baseline is not latest:
+            lines += ["", f"top {limit} growth since first snapshot:"]
+            for stat in latest.compare_to(baseline, "lineno")[:limit]:
+                frame = stat.traceback[0]
+                lines.append(f"  {stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} blocks  {frame.filename}:{frame.lineno}")
+        lines += ["", "largest live traceback:"]
+        biggest = latest.statistics("traceback")[:1]
+        for stat in biggest:
+            lines += [f"  {line}" for line in stat.traceback.format()]
+        return "\n".join(lines) + "\n", top
+
+    def dump(self, reason: str) -> dict:
+        os.makedirs(self.out_dir, exist_ok=True)
+        folded = os.path.join(self.out_dir, "gibrunner-profile.folded")
+        alloc = os.path.join(self.out_dir, "gibrunner-alloc.txt")
+        unique = self.write_folded(folded)
+        report, top = self.allocation_report()
+        with open(alloc, "w", encoding="utf-8") as fh:
+            fh.write(report)
+        elapsed = max(1e-6, time.monotonic() - self._started)
+        with self._lock:
+            samples = self.samples
+            categories = {name: round(count * 100 / samples, 1) for name, count in self._categories.most_common()} if samples else {}
+            threads = dict(self._threads.most_common())
+            ticks = self.ticks
+        summary = {
+            "reason": reason,
+            "folded": folded,
+            "allocations": alloc,
+            "seconds": round(elapsed, 1),
+            "ticks": ticks,
+            "samples": samples,
+            "unique_stacks": unique,
+            "cpu_percent": round((time.process_time() - self._cpu_start) * 100 / elapsed, 2),
+            "overhead_percent": round(self._overhead * 100 / elapsed, 2),
+            "wall_share_percent": categories,
+            "thread_samples": threads,
+            "top_allocations": top[:5],
+        }
+        print(f"Profiler ({reason}): {summary['samples']} samples -> {folded}, {alloc}; by category {categories}")
+        return summary
@@ -0,0 +1,134 @@
+import os
+import time
+from dataclasses import asdict, dataclass
+
+from . import tracing
+from .transport import get_transport
+
+PROFILE_NAMES = ("low-bandwidth", "balanced", "high-fidelity", "auto")
+DEFAULT_PROFILE = "balanced"
+# A public download endpoint that serves N bytes; override with PROFILE_PROBE_URL.
+DEFAULT_PROBE_URL = "https://speed.cloudflare.com/__down?bytes=4000000"
+
+
+@dataclass(frozen=True)
+class Profile:
+    # Only what the host controls: the Xvfb screen and xfwm/GTK effects.
+    # Codec, image quality and FPS are display settings of the connecting
+    # RustDesk client, so setting them on the controlled side does nothing.
+    name: str
+    width: int
+    height: int
+    # RustDesk's X11 capture expects 24/32-bit visuals, so bandwidth is saved
+    # through resolution and fewer repaints rather than colour depth.
+    depth: int
+    compositing: bool
+    animations: bool
+
+    @property
+    def screen(self) -> str:
+        return f"{self.width}x{self.height}x{self.depth}"
+
+
+PROFILES = {
+    "low-bandwidth": Profile("low-bandwidth", 1280, 720, 24, compositing=False, animations=False),
+    "balanced": Profile("balanced", 1366, 768, 24, compositing=False, animations=False),
+    "high-fidelity": Profile("high-fidelity", 1920, 1080, 24, compositing=True, animations=True),
+}
+
+# Mbit/s measured from the runner; below the first bound is low-bandwidth.
+AUTO_THRESHOLDS = ((8.0, "low-bandwidth"), (40.0, "balanced"))
+
+
+def normalize_profile(name: str | None) -> str:
+    name = (name or "").strip().lower().replace("_", "-")
+    return name if name in PROFILE_NAMES else DEFAULT_PROFILE
+
+
+def measure_throughput(url: str, seconds: float = 3.0, max_bytes: int = 8_000_000) -> float | None:
+    # Streams from url for at most `seconds`; returns Mbit/s over the body
+    # (connection setup excluded) or None when nothing could be measured.
+    try:
+        resp = get_transport().get(url, endpoint="throughput", timeout=(3, seconds), stream=True)
+    except Exception as exc:
+        print(f"throughput probe failed: {exc}")
+        return None
+    received = 0
+    start = time.monotonic()
+    try:
+        for chunk in resp.iter_content(chunk_size=64 * 1024):
+            received += len(chunk)
+            if received >= max_bytes or time.monotonic() - start >= seconds:
+                break
+    except Exception as exc:
+        print(f"throughput probe interrupted: {exc}")
+    finally:
+        resp.close()
+    elapsed = time.monotonic() - start
+    if received < 64 * 1024 or elapsed <= 0:
+        return None
+    return received * 8 / elapsed / 1_000_000
+
+
+def pick_profile(mbps: float | None) -> str:
+    if mbps is None:
+        return DEFAULT_PROFILE
+    for bound, name in AUTO_THRESHOLDS:
+        if mbps < bound:
+            return name
+    return "high-fidelity"
+
+
+def resolve(name: str | None) -> tuple[Profile, dict]:
+    # Returns the profile to apply plus a small report for the session trace
+    # and the chat ("auto" says what it measured and why it chose).
+    requested = normalize_profile(name)
+    if requested != "auto":
+        return PROFILES[requested], {"requested": requested, "profile": requested}
+    with tracing.span("profile.measure") as sp:
+        url = os.getenv("PROFILE_PROBE_URL") or DEFAULT_PROBE_URL
+        mbps = measure_throughput(url)
+        chosen = pick_profile(mbps)
+        sp.set(mbps=None if mbps is None else round(mbps, 1), profile=chosen)
+    report = {"requested": "auto", "profile": chosen, "mbps": None if mbps is None else round(mbps, 1)}
+    print(f"profile: auto -> {chosen} ({report['mbps']} Mbit/s)")
+    return PROFILES[chosen], report
+
+
+def describe(profile: Profile) -> dict:
+    return {**asdict(profile), "screen": profile.screen}
+
+
+def _xfconf_dir() -> str:
+    return os.path.expanduser("~/.config/xfce4/xfconf/xfce-perchannel-xml")
+
+
+def write_xfce_settings(profile: Profile) -> None:
+    # Written before startxfce4 so xfwm4/xfsettingsd start with the profile
+    # instead of toggling compositing on a live session.
+    directory = _xfconf_dir()
+    os.makedirs(directory, exist_ok=True)
+    flag = lambda value: "true" if value else "false"
+    files = {
+        "xfwm4.xml": (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<channel name="xfwm4" version="1.0">\n'
+            '  <property name="general" type="empty">\n'
+            f'    <property name="use_compositing" type="bool" value="{flag(profile.compositing)}"/>\n'
+            f'    <property name="box_move" type="bool" value="{flag(not profile.animations)}"/>\n'
+            f'    <property name="box_resize" type="bool" value="{flag(not profile.animations)}"/>\n'
+            '  </property>\n'
+            '</channel>\n'
+        ),
+        "xsettings.xml": (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<channel name="xsettings" version="1.0">\n'
+            '  <property name="Gtk" type="empty">\n'
+            f'    <property name="EnableAnimations" type="bool" value="{flag(profile.animations)}"/>\n'
+            '  </property>\n'
+            '</channel>\n'
+        ),
+    }
+    for name, text in files.items():
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as fh:
+            fh.write(text)
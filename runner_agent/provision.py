@@ -0,0 +1,473 @@
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import shlex
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from . import executor
+from .mode import agent_mode
+
+# Stdlib only: this runs before `pip install` has put requests/psutil on the
+# runner, and it is the step that installs them.
+
+# x11-utils provides xdpyinfo/xprop/xwininfo for the desktop readiness probes.
+APT_PACKAGES = ("xfce4", "xfce4-goodies", "xvfb", "dbus-x11", "x11-utils", "xprintidle", "curl", "wget", "tmate")
+PIP_PACKAGES = ("psutil", "requests")
+RUSTDESK_API = "https://api.github.com/repos/rustdesk/rustdesk/releases"
+RUSTDESK_ASSET_SUFFIX = "x86_64.deb"
+USER_AGENT = "gibrunner-provision"
+
+
+def default_cache_dir() -> str:
+    return os.getenv("PROVISION_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "gibrunner")
+
+
+@dataclass
+class Artifact:
+    url: str
+    filename: str
+    size: int | None = None
+    # "<algo>:<hex>" when the source publishes it (apt indexes, GitHub asset
+    # digests); otherwise learned on first download and kept in the index.
+    digest: str | None = None
+
+
+@dataclass
+class StepResult:
+    name: str
+    status: str = "pending"  # ran | cached | skipped | failed
+    seconds: float = 0.0
+    baseline_s: float | None = None
+    saved_s: float | None = None
+    detail: dict = field(default_factory=dict)
+    started: float = 0.0
+
+
+class ContentCache:
+    # Blobs live under blobs/<algo>/<hex>; index.json remembers which digest a
+    # URL resolved to so artifacts without a published checksum are still
+    # found without touching the network.
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self._index = self._load("index.json", {})
+
+    def _load(self, name: str, default):
+        try:
+            with open(os.path.join(self.root, name), encoding="utf-8") as fh:
+                data = json.load(fh)
+            return data if isinstance(data, type(default)) else default
+        except (OSError, ValueError):
+            return default
+
+    def load(self, name: str, default):
+        with self._lock:
+            return self._load(name, default)
+
+    def save(self, name: str, data) -> None:
+        path = os.path.join(self.root, name)
+        tmp = f"{path}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(data, fh, indent=1, sort_keys=True)
+            os.replace(tmp, path)
+
+    def blob_path(self, digest: str) -> str:
+        algo, _, hexdigest = digest.partition(":")
+        return os.path.join(self.root, "blobs", algo.lower(), hexdigest.lower())
+
+    def known_digest(self, url: str) -> str | None:
+        with self._lock:
+            return self._index.get(url)
+
+    def lookup(self, artifact: Artifact) -> str | None:
+        digest = artifact.digest or self.known_digest(artifact.url)
+        if not digest:
+            return None
+        path = self.blob_path(digest)
+        return path if os.path.exists(path) else None
+
+    def fingerprint(self) -> str:
+        # Changes whenever a run adds something worth saving (a blob, pip
+        # wheel or a new pin); timings alone don't warrant a new CI cache.
+        hasher = hashlib.sha256()
+        for rel in sorted(_listing(self.root)):
+            if rel == "timings.json" or rel.endswith(".tmp") or ".part-" in rel:
+                continue
+            hasher.update(rel.encode())
+            path = os.path.join(self.root, rel)
+            if rel.endswith(".json"):
+                with open(path, "rb") as fh:
+                    hasher.update(fh.read())
+            else:
+                hasher.update(str(os.path.getsize(path)).encode())
+        return hasher.hexdigest()[:16]
+
+    def remember(self, url: str, digest: str) -> None:
+        with self._lock:
+            self._index[url] = digest
+        self.save("index.json", dict(self._index))
+
+    def fetch(self, artifact: Artifact, timeout: float = 120) -> tuple[str, bool]:
+        # Returns (blob path, came_from_cache). The download is hashed while
+        # it streams and only becomes a blob once the checksum matches.
+        cached = self.lookup(artifact)
+        if cached:
+            artifact.digest = artifact.digest or self.known_digest(artifact.url)
+            return cached, True
+        algo = (artifact.digest or "sha256:").partition(":")[0].lower()
+        hasher = hashlib.new(algo)
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.root, "blobs"), prefix=".part-")
+        try:
+            req = urllib.request.Request(artifact.url, headers={"User-Agent": USER_AGENT})
+            with os.fdopen(fd, "wb") as out, urllib.request.urlopen(req, timeout=timeout) as resp:
+                while True:
+                    chunk = resp.read(1 << 16)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+            digest = f"{algo}:{hasher.hexdigest()}"
+            if artifact.digest and digest != artifact.digest.lower():
+                raise ValueError(f"checksum mismatch for {artifact.filename}: got {digest}, expected {artifact.digest}")
+            path = self.blob_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self.remember(artifact.url, digest)
+        artifact.digest = digest
+        return path, False
+
+
+def fetch_all(cache: ContentCache, artifacts: list[Artifact], workers: int = 8) -> dict:
+    results = {"fetched": 0, "cached": 0, "bytes_fetched": 0, "paths": {}}
+    if not artifacts:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(artifacts))), thread_name_prefix="fetch") as pool:
+        futures = {pool.submit(cache.fetch, a): a for a in artifacts}
+        for future, artifact in futures.items():
+            path, hit = future.result()
+            results["paths"][artifact.filename] = path
+            if hit:
+                results["cached"] += 1
+            else:
+                results["fetched"] += 1
+                results["bytes_fetched"] += os.path.getsize(path)
+    return results
+
+
+def _listing(root: str) -> set[str]:
+    files = set()
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            files.add(os.path.relpath(os.path.join(dirpath, name), root))
+    return files
+
+
+def _sudo(cmd: list[str]) -> list[str]:
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        return cmd
+    return ["sudo", "-n", *cmd]
+
+
+def installed_packages(names) -> set[str]:
+    proc = executor.run(["dpkg-query", "-W", "-f=${Package} ${Status}\n", *names], timeout=30, label="dpkg-query")
+    installed = set()
+    for line in proc.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 4 and parts[1:4] == ["install", "ok", "installed"]:
+            installed.add(parts[0])
+    return installed
+
+
+def installed_version(name: str) -> str | None:
+    proc = executor.run(["dpkg-query", "-W", "-f=${Status}|${Version}", name], timeout=30, label="dpkg-query")
+    status, _, version = proc.stdout.partition("|")
+    if proc.returncode != 0 or not status.endswith("installed"):
+        return None
+    return version.strip() or None
+
+
+def parse_print_uris(text: str) -> list[Artifact]:
+    # apt-get --print-uris: 'URL' filename size SHA256:hex
+    artifacts = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith("'"):
+            continue
+        try:
+            url, filename, size, checksum = shlex.split(line)[:4]
+        except ValueError:
+            continue
+        algo, _, hexdigest = checksum.partition(":")
+        digest = f"{algo.lower()}:{hexdigest.lower()}" if hexdigest and algo.lower() in hashlib.algorithms_available else None
+        artifacts.append(Artifact(url, filename, int(size) if size.isdigit() else None, digest))
+    return artifacts
+
+
+def _github_json(url: str, timeout: float = 30):
+    headers = {"User-Agent": USER_AGENT, "Accept": "application/vnd.github+json"}
+    token = os.getenv("GITHUB_TOKEN")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as resp:
+        return json.load(resp)
+
+
+def resolve_rustdesk(cache: ContentCache, requested: str, refresh: bool = False) -> tuple[dict, bool]:
+    # The resolved release is pinned in the cache: "latest" is looked up once
+    # and reused until RUSTDESK_REFRESH=1 or the cache is dropped.
+    pinned = cache.load("rustdesk.json", {})
+    if pinned.get("requested") == requested and pinned.get("url") and not refresh:
+        return pinned, True
+    if requested == "latest":
+        release = _github_json(f"{RUSTDESK_API}/latest")
+    else:
+        release = _github_json(f"{RUSTDESK_API}/tags/{requested}")
+    asset = next(
+        (a for a in release.get("assets", []) if str(a.get("name", "")).endswith(RUSTDESK_ASSET_SUFFIX)),
+        None,
+    )
+    if asset is None:
+        raise RuntimeError(f"no {RUSTDESK_ASSET_SUFFIX} asset in RustDesk release {release.get('tag_name')}")
+    pinned = {
+        "requested": requested,
+        "version": str(release.get("tag_name", "")).lstrip("v"),
+        "url": asset["browser_download_url"],
+        "filename": asset["name"],
+        "size": asset.get("size"),
+        "digest": asset.get("digest") or cache.known_digest(asset["browser_download_url"]),
+        "resolved_at": round(time.time()),
+    }
+    cache.save("rustdesk.json", pinned)
+    return pinned, False
+
+
+class Provisioner:
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        rustdesk_version: str = "latest",
+        refresh: bool = False,
+        phases_file: str | None = None,
+        workers: int = 8,
+    ):
+        self.cache = ContentCache(cache_dir or default_cache_dir())
+        self.rustdesk_version = rustdesk_version or "latest"
+        self.refresh = refresh
+        self.phases_file = phases_file
+        self.workers = workers
+        self.linux = platform.system() == "Linux"
+        self.steps: dict[str, StepResult] = {}
+        self._baselines = self.cache.load("timings.json", {})
+        self._lock = threading.Lock()
+
+    def _step(self, name: str) -> StepResult:
+        step = StepResult(name, started=time.time())
+        with self._lock:
+            self.steps[name] = step
+        return step
+
+    def _finish(self, step: StepResult, status: str, **detail) -> StepResult:
+        step.status = status
+        step.seconds = round(time.time() - step.started, 2)
+        step.detail.update(detail)
+        baseline = self._baselines.get(step.name)
+        if status == "ran":
+            # A full run is the cost the cache and skip checks are saving.
+            with self._lock:
+                self._baselines[step.name] = step.seconds
+        elif baseline is not None and status in ("cached", "skipped"):
+            step.baseline_s = baseline
+            step.saved_s = round(max(0.0, baseline - step.seconds), 2)
+        if self.phases_file:
+            try:
+                with open(self.phases_file, "a", encoding="utf-8") as fh:
+                    fh.write(f"provision.{step.name} {step.started:.3f} {step.started + step.seconds:.3f}\n")
+            except OSError:
+                pass
+        print(f"[provision] {step.name}: {status} in {step.seconds}s" + (f" (saved ~{step.saved_s}s)" if step.saved_s else ""))
+        return step
+
+    def pip_install(self) -> StepResult:
+        step = self._step("pip")
+        if agent_mode() == "lite":
+            # The lite agent runs on the bare interpreter.
+            return self._finish(step, "skipped", packages=[], reason="AGENT_MODE=lite")
+        missing = [name for name in PIP_PACKAGES if importlib.util.find_spec(name) is None]
+        if not missing:
+            return self._finish(step, "skipped", packages=[])
+        pip_cache = os.path.join(self.cache.root, "pip")
+        before = _listing(pip_cache)
+        cmd = [sys.executable, "-m", "pip", "install", "--cache-dir", pip_cache, *missing]
+        proc = executor.run(cmd, timeout=600, label="pip install")
+        if proc.returncode != 0:
+            return self._finish(step, "failed", error=proc.stderr[-500:])
+        # Anything pip had to download (or build) lands in its cache dir, so
+        # an unchanged listing means every wheel came from the cache. pip's
+        # version self-check also writes there and says nothing about wheels.
+        added = len([f for f in _listing(pip_cache) - before if not f.startswith("selfcheck")])
+        return self._finish(step, "cached" if before and not added else "ran", packages=missing, cache_files_added=added)
+
+    def apt_update(self) -> StepResult:
+        step = self._step("apt_update")
+        proc = executor.run(_sudo(["apt-get", "update", "-qq"]), timeout=600, label="apt-get update", retries=1)
+        return self._finish(step, "ran" if proc.returncode == 0 else "failed")
+
+    def rustdesk_fetch(self) -> tuple[dict | None, str | None]:
+        step = self._step("rustdesk_download")
+        try:
+            pin, from_pin = resolve_rustdesk(self.cache, self.rustdesk_version, self.refresh)
+            step.detail["version"] = pin["version"]
+            step.detail["pinned"] = from_pin
+            installed = installed_version("rustdesk")
+            if installed and installed.split("-")[0] == pin["version"]:
+                self._finish(step, "skipped", installed=installed)
+                return pin, None
+            artifact = Artifact(pin["url"], pin["filename"], pin.get("size"), pin.get("digest"))
+            path, hit = self.cache.fetch(artifact)
+            if not pin.get("digest"):
+                pin["digest"] = artifact.digest
+                self.cache.save("rustdesk.json", pin)
+            self._finish(step, "cached" if hit else "ran", digest=artifact.digest)
+            return pin, path
+        except Exception as exc:
+            self._finish(step, "failed", error=str(exc))
+            return None, None
+
+    def _stage_debs(self, artifacts: list[Artifact]) -> tuple[str, dict]:
+        step = self._step("apt_download")
+        fetched = fetch_all(self.cache, artifacts, self.workers)
+        # apt only needs the files by name in its archives dir; hard links
+        # keep this free when the cache and /tmp share a filesystem.
+        stage = tempfile.mkdtemp(prefix="gibrunner-apt-")
+        os.makedirs(os.path.join(stage, "partial"), exist_ok=True)
+        for filename, blob in fetched["paths"].items():
+            target = os.path.join(stage, filename)
+            try:
+                os.link(blob, target)
+            except OSError:
+                shutil.copyfile(blob, target)
+        status = "cached" if fetched["fetched"] == 0 else "ran"
+        self._finish(
+            step, status,
+            packages=len(artifacts), fetched=fetched["fetched"], from_cache=fetched["cached"],
+            mb_fetched=round(fetched["bytes_fetched"] / 1024 / 1024, 1),
+        )
+        return stage, fetched
+
+    def apt_install(self, rustdesk_deb: str | None, rustdesk_pin: dict | None) -> StepResult:
+        missing = sorted(set(APT_PACKAGES) - installed_packages(APT_PACKAGES))
+        targets = list(missing)
+        local_deb = None
+        if rustdesk_deb:
+            # apt wants a .deb name it can recognise next to the package list.
+            local_deb = os.path.join(tempfile.gettempdir(), rustdesk_pin["filename"])
+            shutil.copyfile(rustdesk_deb, local_deb)
+            targets.append(local_deb)
+        if not targets:
+            step = self._step("apt_install")
+            return self._finish(step, "skipped", packages=[])
+
+        plan = executor.run(
+            _sudo(["apt-get", "install", "-y", "-qq", "--print-uris", *targets]),
+            timeout=120, label="apt-get --print-uris",
+        )
+        artifacts = parse_print_uris(plan.stdout) if plan.returncode == 0 else []
+        options = ["-o", "APT::Keep-Downloaded-Packages=true"]
+        if artifacts:
+            try:
+                stage, _ = self._stage_debs(artifacts)
+                options += ["-o", f"Dir::Cache::archives={stage}"]
+            except Exception as exc:
+                # apt can still download whatever we failed to prefetch.
+                print(f"[provision] prefetch failed, letting apt download: {exc}")
+
+        step = self._step("apt_install")
+        proc = executor.run(
+            _sudo(["env", "DEBIAN_FRONTEND=noninteractive", "apt-get", "install", "-y", "-qq", *options, *targets]),
+            timeout=1800, label="apt-get install",
+        )
+        if proc.returncode != 0:
+            return self._finish(step, "failed", packages=targets, error=proc.stderr[-500:])
+        return self._finish(step, "ran", packages=[os.path.basename(t) for t in targets])
+
+    def run(self) -> dict:
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="provision") as pool:
+            pip_future = pool.submit(self.pip_install)
+            if self.linux:
+                # apt-get update and the RustDesk download don't depend on each
+                # other; the single apt-get install at the end needs both.
+                needs_apt = set(APT_PACKAGES) - installed_packages(APT_PACKAGES)
+                rustdesk_future = pool.submit(self.rustdesk_fetch)
+                if needs_apt or installed_version("rustdesk") is None:
+                    pool.submit(self.apt_update).result()
+                else:
+                    self._finish(self._step("apt_update"), "skipped")
+                pin, deb = rustdesk_future.result()
+                self.apt_install(deb, pin)
+            pip_future.result()
+        self.cache.save("timings.json", self._baselines)
+        steps = [
+            {k: v for k, v in asdict(step).items() if k != "started"}
+            for step in sorted(self.steps.values(), key=lambda s: s.started)
+        ]
+        return {
+            "total_s": round(time.time() - started, 2),
+            "saved_s": round(sum(s["saved_s"] or 0 for s in steps), 2),
+            "failed": [s["name"] for s in steps if s["status"] == "failed"],
+            "cache_dir": self.cache.root,
+            "steps": steps,
+        }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m runner_agent.provision")
+    parser.add_argument("--cache-dir", default=default_cache_dir())
+    parser.add_argument("--rustdesk-version", default=os.getenv("RUSTDESK_VERSION") or "latest")
+    parser.add_argument("--refresh", action="store_true", default=os.getenv("RUSTDESK_REFRESH") == "1",
+                        help="re-resolve the RustDesk release instead of using the pinned one")
+    parser.add_argument("--report", default=os.getenv("PROVISION_REPORT") or os.path.join(tempfile.gettempdir(), "gibrunner-provision.json"))
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    provisioner = Provisioner(
+        cache_dir=args.cache_dir,
+        rustdesk_version=args.rustdesk_version,
+        refresh=args.refresh,
+        phases_file=os.getenv("GIBRUNNER_PHASES") or None,
+        workers=args.workers,
+    )
+    report = provisioner.run()
+    try:
+        with open(args.report, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=1)
+    except OSError as exc:
+        print(f"[provision] report write failed: {exc}")
+    print(f"[provision] done in {report['total_s']}s, saved ~{report['saved_s']}s vs uncached runs")
+    output = os.getenv("GITHUB_OUTPUT")
+    if output:
+        # The workflow saves the cache under this key, so a run that pinned a
+        # new release or fetched new blobs never collides with an older entry.
+        with open(output, "a", encoding="utf-8") as fh:
+            fh.write(f"cache_fingerprint={provisioner.cache.fingerprint()}\n")
+    if report["failed"]:
+        raise SystemExit(f"provisioning failed: {', '.join(report['failed'])}")
+
+
+if __name__ == "__main__":
+    main()
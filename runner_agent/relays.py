@@ -0,0 +1,195 @@
+import os
+import shutil
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from . import executor, tracing
+from .profiles import measure_throughput
+
+# RustDesk's built-in rendezvous server; choosing it leaves the config alone.
+BUILTIN_HOST = "rs-ny.rustdesk.com"
+RENDEZVOUS_PORT = 21116
+RELAY_PORT = 21117
+# Comma separated "host[:port][;relay=host[:port]][;key=KEY][;probe=URL]".
+# Self-hosted hbbs/hbbr need their public key; probe is an optional URL on
+# the same machine that serves a few MB for the throughput leg.
+DEFAULT_SERVERS = BUILTIN_HOST
+RTT_SAMPLES = 3
+CONNECT_TIMEOUT = 2.0
+# Relays measured below this are only picked when nothing else answers.
+MIN_RELAY_MBPS = 5.0
+
+
+@dataclass(frozen=True)
+class RelayServer:
+    host: str
+    port: int = RENDEZVOUS_PORT
+    relay_host: str = ""
+    relay_port: int = RELAY_PORT
+    key: str = ""
+    probe_url: str = ""
+
+    @property
+    def name(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def relay(self) -> str:
+        return f"{self.relay_host or self.host}:{self.relay_port}"
+
+    @property
+    def builtin(self) -> bool:
+        return self.host == BUILTIN_HOST and self.port == RENDEZVOUS_PORT and not self.key
+
+
+def _split_host(value: str, default_port: int) -> tuple[str, int]:
+    host, sep, port = value.strip().rpartition(":")
+    if sep and port.isdigit() and host and not host.endswith(":"):
+        return host.strip("[]"), int(port)
+    return value.strip().strip("[]"), default_port
+
+
+def parse_servers(spec: str | None) -> list[RelayServer]:
+    servers = []
+    for entry in (spec or "").split(","):
+        parts = [p.strip() for p in entry.split(";") if p.strip()]
+        if not parts:
+            continue
+        host, port = _split_host(parts[0], RENDEZVOUS_PORT)
+        fields = {"host": host, "port": port}
+        for part in parts[1:]:
+            key, _, value = part.partition("=")
+            key = key.strip().lower()
+            if key == "relay":
+                fields["relay_host"], fields["relay_port"] = _split_host(value, RELAY_PORT)
+            elif key == "key":
+                fields["key"] = value.strip()
+            elif key == "probe":
+                fields["probe_url"] = value.strip()
+        servers.append(RelayServer(**fields))
+    return servers
+
+
+def configured_servers() -> list[RelayServer]:
+    return parse_servers(os.getenv("RUSTDESK_SERVERS") or DEFAULT_SERVERS)
+
+
+def _connect_ms(addr: tuple, family: int) -> float:
+    start = time.perf_counter()
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(addr)
+    return (time.perf_counter() - start) * 1000
+
+
+def tcp_rtt(host: str, port: int, samples: int = RTT_SAMPLES) -> tuple[float | None, str | None]:
+    # The TCP handshake is one round trip; DNS is resolved once up front so
+    # it does not count. Median of `samples` connects, None if unreachable.
+    try:
+        family, _, _, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    except OSError as exc:
+        return None, f"dns: {exc}"
+    times = []
+    error = None
+    for _ in range(samples):
+        try:
+            times.append(_connect_ms(addr, family))
+        except OSError as exc:
+            error = str(exc) or type(exc).__name__
+    if not times:
+        return None, error
+    return round(statistics.median(times), 2), None
+
+
+def probe_server(server: RelayServer) -> dict:
+    rtt, error = tcp_rtt(server.host, server.port)
+    relay_rtt, relay_error = tcp_rtt(server.relay_host or server.host, server.relay_port) if rtt is not None else (None, None)
+    mbps = None
+    if server.probe_url and relay_rtt is not None:
+        mbps = measure_throughput(server.probe_url, seconds=2.0, max_bytes=4_000_000)
+    return {
+        "server": server.name,
+        "relay": server.relay,
+        "rtt_ms": rtt,
+        "relay_rtt_ms": relay_rtt,
+        "mbps": None if mbps is None else round(mbps, 1),
+        "reachable": rtt is not None and relay_rtt is not None,
+        "error": error or relay_error,
+    }
+
+
+def probe_all(servers: list[RelayServer]) -> list[dict]:
+    if not servers:
+        return []
+    with ThreadPoolExecutor(max_workers=min(8, len(servers)), thread_name_prefix="relay-probe") as pool:
+        # One bind per call: a bound context cannot be entered twice at once.
+        futures = [pool.submit(tracing.bind(probe_server), server) for server in servers]
+        return [future.result() for future in futures]
+
+
+def choose(servers: list[RelayServer], results: list[dict]) -> RelayServer | None:
+    # Lowest worst-leg RTT among reachable servers; a relay whose measured
+    # throughput is too low only wins when it is the only one left.
+    usable = [(s, r) for s, r in zip(servers, results) if r["reachable"]]
+    fast = [(s, r) for s, r in usable if r["mbps"] is None or r["mbps"] >= MIN_RELAY_MBPS]
+    pool = fast or usable
+    if not pool:
+        return None
+    return min(pool, key=lambda item: max(item[1]["rtt_ms"], item[1]["relay_rtt_ms"]))[0]
+
+
+def resolve(servers: list[RelayServer] | None = None) -> tuple[RelayServer | None, dict]:
+    # Returns the server to configure (None keeps RustDesk's default) plus
+    # the measurements for the session trace and summary.
+    if os.getenv("RELAY_PROBE", "1").lower() in ("0", "false", "no", "off"):
+        return None, {"skipped": True}
+    servers = configured_servers() if servers is None else servers
+    with tracing.span("relay.probe", candidates=len(servers)) as sp:
+        results = probe_all(servers)
+        best = choose(servers, results)
+        sp.set(chosen=None if best is None else best.name)
+    report = {"chosen": None if best is None else best.name, "candidates": results}
+    print(f"relay probe: {report['chosen']} from {[(r['server'], r['rtt_ms'], r['relay_rtt_ms'], r['mbps']) for r in results]}")
+    return best, report
+
+
+def rustdesk_options(server: RelayServer) -> dict[str, str]:
+    if server.builtin:
+        return {}
+    return {
+        "custom-rendezvous-server": server.name,
+        "relay-server": server.relay,
+        "key": server.key,
+    }
+
+
+def relay_port(options: dict | None) -> int:
+    # The port peers reach the relay on, from rustdesk_options() output;
+    # RustDesk's own relay port when no server was configured.
+    relay = (options or {}).get("relay-server")
+    return _split_host(relay, RELAY_PORT)[1] if relay else RELAY_PORT
+
+
+def apply_rustdesk_options(rustdesk: str, server: RelayServer | None, use_sudo: bool) -> dict[str, bool]:
+    # `rustdesk --option <key> <value>` writes the service-scope option,
+    # before the service restart that makes it register with the server.
+    applied = {}
+    if server is None:
+        return applied
+    options = rustdesk_options(server)
+    if not options:
+        return applied
+    with tracing.span("rustdesk.relay", server=server.name) as sp:
+        if not shutil.which(rustdesk) and not os.path.exists(rustdesk):
+            return applied
+        for key, value in options.items():
+            cmd = [rustdesk, "--option", key, value]
+            if use_sudo:
+                cmd = ["sudo", "-n", *cmd]
+            proc = executor.run(cmd, timeout=15, label=f"rustdesk --option {key}")
+            applied[key] = proc.returncode == 0
+        sp.set(applied=sum(applied.values()))
+    return applied
@@ -1,27 +1,266 @@
 import os
 import platform
 import shutil
+import socket
 import subprocess
+import threading
 import time
-import requests
-import psutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from . import executor, profiles, relays, sysinfo, tracing, tuning
+from .rustdesk_config import password_fingerprint, wait_for_id, wait_for_password_change
+from .transport import get_transport
 
 
 def get_server_details():
+    with tracing.span("server_details"):
+        return _get_server_details()
+
+
+def _get_server_details():
     try:
-        ip_data = requests.get("http://ip-api.com/json", timeout=5).json()
+        ip_data = get_transport().get("http://ip-api.com/json", endpoint="ip-api", timeout=5).json()
         country = ip_data.get("country", "Unknown")
         ip = ip_data.get("query", "Unknown")
-        cpu_count = psutil.cpu_count(logical=True)
-        ram_gb = round(psutil.virtual_memory().total / (1024**3), 1)
+        cpu_count = sysinfo.cpu_count()
+        ram_gb = round(sysinfo.memory()["total"] / (1024**3), 1)
         os_ver = f"{platform.system()} {platform.release()}"
         return country, ip, cpu_count, ram_gb, os_ver
     except Exception:
         return "Unknown", "Unknown", "Unknown", "Unknown", "Unknown"
 
 
-def _run_quiet(cmd, shell=False, timeout=20):
-    return subprocess.run(cmd, shell=shell, capture_output=True, text=True, timeout=timeout)
+def _wait_until(predicate, timeout: float, interval: float = 0.25, max_interval: float = 2.0) -> bool:
+    # Readiness wait with a growing interval: cheap when things come up fast,
+    # bounded when they don't.
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if predicate():
+                return True
+        except Exception:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or executor.cancelled():
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(max_interval, interval * 1.5)
+
+
+@dataclass
+class DesktopStep:
+    name: str
+    deps: tuple[str, ...] = ()
+    # start() returns False when the step cannot run at all (missing binary);
+    # probe() is the readiness signal polled afterwards.
+    start: Callable[[], bool] | None = None
+    probe: Callable[[], bool] | None = None
+    timeout: float = 20.0
+
+
+class BringUp:
+    # Tiny dependency graph: every step starts as soon as its deps have
+    # settled, so independent steps overlap. "External" names are settled by
+    # code outside the graph via mark() (e.g. the RustDesk service restart).
+    dep_timeout = 90.0
+
+    def __init__(self, steps: list[DesktopStep], external: tuple[str, ...] = ()):
+        self.steps = steps
+        self.results: dict[str, dict] = {}
+        self._settled = {name: threading.Event() for name in [*(s.name for s in steps), *external]}
+        self._failed: set[str] = set()
+        self._lock = threading.Lock()
+
+    def mark(self, name: str, ok: bool = True) -> None:
+        with self._lock:
+            if not ok:
+                self._failed.add(name)
+        self._settled[name].set()
+
+    def _finish(self, step: DesktopStep, state: str, wait_s: float = 0.0, **extra) -> None:
+        with self._lock:
+            self.results[step.name] = {"state": state, "wait_s": round(wait_s, 3), **extra}
+        print(f"desktop: {step.name} {state}" + (f" after {wait_s:.2f}s" if wait_s else ""))
+        self.mark(step.name, ok=state in ("ready", "running", "timeout"))
+
+    def _run_step(self, step: DesktopStep) -> None:
+        with tracing.span(f"desktop.{step.name}") as sp:
+            dep_start = time.monotonic()
+            for dep in step.deps:
+                self._settled[dep].wait(self.dep_timeout)
+            dep_wait = time.monotonic() - dep_start
+            sp.set(dep_wait_s=round(dep_wait, 3))
+            with self._lock:
+                blocked = [d for d in step.deps if d in self._failed or not self._settled[d].is_set()]
+            if blocked:
+                sp.set(state="skipped")
+                self._finish(step, "skipped", blocked_by=blocked)
+                return
+            if step.probe is not None and _safe_probe(step.probe):
+                sp.set(state="running")
+                self._finish(step, "running")
+                return
+            if step.start is not None and not step.start():
+                sp.set(state="failed")
+                self._finish(step, "failed")
+                return
+            start = time.monotonic()
+            ready = step.probe is None or _wait_until(step.probe, timeout=step.timeout, interval=0.05, max_interval=0.25)
+            wait_s = time.monotonic() - start
+            state = "ready" if ready else "timeout"
+            sp.set(state=state, wait_s=round(wait_s, 3))
+            self._finish(step, state, wait_s, dep_wait_s=round(dep_wait, 3))
+
+    def run(self) -> dict[str, dict]:
+        with ThreadPoolExecutor(max_workers=len(self.steps), thread_name_prefix="desktop") as pool:
+            for future in [pool.submit(tracing.bind(self._run_step), step) for step in self.steps]:
+                future.result()
+        return dict(self.results)
+
+
+def _safe_probe(probe: Callable[[], bool]) -> bool:
+    try:
+        return bool(probe())
+    except Exception:
+        return False
+
+
+DISPLAY = os.getenv("DISPLAY") or ":1"
+
+
+def _display_env() -> dict:
+    return {**os.environ, "DISPLAY": DISPLAY}
+
+
+def _x_socket(display: str = DISPLAY) -> str:
+    return f"/tmp/.X11-unix/X{display.lstrip(':').split('.')[0]}"
+
+
+def _display_ready() -> bool:
+    path = _x_socket()
+    if not os.path.exists(path):
+        return False
+    if shutil.which("xdpyinfo"):
+        return executor.run(["xdpyinfo", "-display", DISPLAY], timeout=3, label="xdpyinfo").returncode == 0
+    # Without x11-utils, a successful connect means the server is accepting.
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1)
+        sock.connect(path)
+    return True
+
+
+def _window_manager_ready() -> bool:
+    if shutil.which("xprop"):
+        out = executor.run(["xprop", "-display", DISPLAY, "-root", "_NET_SUPPORTING_WM_CHECK"], timeout=3, label="xprop")
+        return "window id #" in (out.stdout or "")
+    return _process_running(lambda name, cmdline: name == "xfwm4")
+
+
+def _rustdesk_window_mapped() -> bool:
+    if not shutil.which("xwininfo"):
+        return _process_running(lambda name, cmdline: "rustdesk" in name and "--service" not in cmdline)
+    tree = executor.run(["xwininfo", "-display", DISPLAY, "-root", "-tree"], timeout=3, label="xwininfo -tree")
+    ids = [line.split()[0] for line in (tree.stdout or "").splitlines() if "rustdesk" in line.lower() and line.strip().startswith("0x")]
+    for wid in ids[:8]:
+        info = executor.run(["xwininfo", "-display", DISPLAY, "-id", wid], timeout=3, label="xwininfo -id")
+        if "IsViewable" in (info.stdout or ""):
+            return True
+    return False
+
+
+def _process_running(match: Callable[[str, list], bool]) -> bool:
+    return any(match(name, cmdline) for name, cmdline in sysinfo.processes())
+
+
+def _spawn_logged(cmd: list[str], label: str, log_path: str) -> bool:
+    if not shutil.which(cmd[0]):
+        print(f"{cmd[0]} is not installed")
+        return False
+    with open(log_path, "ab") as log:
+        proc = executor.spawn(cmd, label=label, stdout=log, stderr=log, env=_display_env(), start_new_session=True)
+    return proc is not None
+
+
+def _start_xvfb(profile: profiles.Profile) -> bool:
+    return _spawn_logged(["Xvfb", DISPLAY, "-screen", "0", profile.screen, "-nolisten", "tcp"], "Xvfb", "/tmp/xvfb.log")
+
+
+def _start_xfce(profile: profiles.Profile) -> bool:
+    try:
+        profiles.write_xfce_settings(profile)
+    except OSError as exc:
+        print(f"xfce profile settings not written: {exc}")
+    # startxfce4 brings up its own session bus through dbus-launch (dbus-x11).
+    return _spawn_logged(["startxfce4"], "startxfce4", "/tmp/xfce.log")
+
+
+def _start_rustdesk_ui() -> bool:
+    rustdesk = shutil.which("rustdesk")
+    if not rustdesk:
+        return False
+    return _spawn_logged([rustdesk], "rustdesk ui", "/tmp/rustdesk-ui.log")
+
+
+def _default_profile() -> profiles.Profile:
+    return profiles.PROFILES[profiles.DEFAULT_PROFILE]
+
+
+def linux_desktop_bringup(get_profile: Callable[[], profiles.Profile] = _default_profile) -> BringUp:
+    # Xvfb -> xfce (with dbus) -> RustDesk UI. The UI also waits for the
+    # RustDesk service's first restart, settled by _start_rustdesk_linux, and
+    # xfce for the swap/tmpfs setup, settled by _tune_linux.
+    # get_profile may block while "auto" measures the link.
+    return BringUp(
+        [
+            DesktopStep("xvfb", start=lambda: _start_xvfb(get_profile()), probe=_display_ready, timeout=15),
+            DesktopStep("xfce", deps=("xvfb", "memory"), start=lambda: _start_xfce(get_profile()), probe=_window_manager_ready, timeout=30),
+            DesktopStep("rustdesk_ui", deps=("xfce", "rustdesk_service"), start=_start_rustdesk_ui, probe=_rustdesk_window_mapped, timeout=30),
+        ],
+        external=("rustdesk_service", "memory"),
+    )
+
+
+def _tune_linux(bringup: BringUp | None = None) -> dict:
+    # Failures here are reported, never fatal: the desktop just starts on
+    # the stock swap layout.
+    with tracing.span("tuning"):
+        try:
+            return tuning.apply()
+        except Exception as exc:
+            print(f"memory tuning failed: {exc}")
+            return {"error": str(exc)}
+        finally:
+            if bringup is not None:
+                bringup.mark("memory")
+
+
+def _bring_up_desktop(bringup: BringUp) -> dict[str, dict]:
+    with tracing.span("desktop") as sp:
+        results = bringup.run()
+        sp.set(**{name: r["state"] for name, r in results.items()})
+        return results
+
+
+def _rustdesk_service_ready() -> bool:
+    proc = executor.run(["systemctl", "is-active", "rustdesk"], timeout=5)
+    if (proc.stdout or "").strip() != "active":
+        return False
+    return _process_running(lambda name, cmdline: "rustdesk" in name and "--service" in cmdline)
+
+
+def _restart_rustdesk_service(label: str) -> None:
+    with tracing.span(f"rustdesk.service_restart.{label}") as sp:
+        svc = executor.run(["sudo", "-n", "systemctl", "restart", "rustdesk"], timeout=20, label=f"systemctl restart rustdesk ({label})")
+        _summarize_proc(f"rustdesk service restart ({label})", svc)
+        if svc.returncode != 0:
+            sp.set(ready=False)
+            return
+        ready = _wait_until(_rustdesk_service_ready, timeout=15)
+        sp.set(ready=ready)
+        if not ready:
+            print(f"rustdesk service ({label}) not ready after 15s, continuing")
 
 
 def _summarize_proc(prefix: str, proc: subprocess.CompletedProcess):
@@ -35,7 +274,22 @@ def _summarize_proc(prefix: str, proc: subprocess.CompletedProcess):
     print(f"{prefix} rc={proc.returncode} stdout={out!r} stderr={err!r}")
 
 
-def _start_rustdesk_windows(password: str):
+def _no_relay() -> relays.RelayServer | None:
+    return None
+
+
+def _start_rustdesk_windows(
+    password: str,
+    get_relay: Callable[[], relays.RelayServer | None] = _no_relay,
+):
+    with tracing.span("rustdesk"):
+        return _start_rustdesk_windows_inner(password, get_relay)
+
+
+def _start_rustdesk_windows_inner(
+    password: str,
+    get_relay: Callable[[], relays.RelayServer | None] = _no_relay,
+):
     rustdesk = shutil.which("rustdesk")
     if not rustdesk:
         likely = r"C:\Program Files\RustDesk\rustdesk.exe"
@@ -44,127 +298,367 @@ def _start_rustdesk_windows(password: str):
     if not rustdesk:
         raise RuntimeError("RustDesk executable not found")
 
-    subprocess.run([rustdesk, "--password", password], capture_output=True, text=True)
-    rid = ""
-    for _ in range(8):
-        out = subprocess.run([rustdesk, "--get-id"], capture_output=True, text=True)
-        rid = (out.stdout or "").strip().splitlines()[0] if (out.stdout or "").strip() else ""
-        if rid:
-            break
-        time.sleep(2)
-    if not rid:
-        raise RuntimeError("RustDesk ID not found")
-    subprocess.Popen([rustdesk], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with tracing.span("rustdesk.password"):
+        executor.run([rustdesk, "--password", password], timeout=30, label="rustdesk --password")
+    relays.apply_rustdesk_options(rustdesk, get_relay(), use_sudo=False)
+    with tracing.span("rustdesk.get_id") as sp:
+        detection = wait_for_id("Windows", timeout=20, cli_fallback=lambda: _cli_get_id([[rustdesk, "--get-id"]]))
+        if detection is None:
+            raise RuntimeError("RustDesk ID not found")
+        sp.set(method=detection.method)
+    rid = detection.value
+    executor.spawn([rustdesk], label="rustdesk ui")
     return rid
 
 
-def _start_rustdesk_linux(password: str):
+def _start_rustdesk_linux(
+    password: str,
+    bringup: BringUp | None = None,
+    get_relay: Callable[[], relays.RelayServer | None] = _no_relay,
+):
+    with tracing.span("rustdesk"):
+        try:
+            return _start_rustdesk_linux_inner(password, bringup, get_relay)
+        finally:
+            if bringup is not None:
+                # Never leave the UI step waiting on a branch that failed.
+                bringup.mark("rustdesk_service")
+
+
+def _start_rustdesk_linux_inner(
+    password: str,
+    bringup: BringUp | None = None,
+    get_relay: Callable[[], relays.RelayServer | None] = _no_relay,
+):
     rustdesk = shutil.which("rustdesk")
     if not rustdesk:
         raise RuntimeError("rustdesk is not installed")
 
     # RustDesk Linux package installs a system service. Configure password via
     # sudo first (service scope), then fallback to user scope for compatibility.
-    try:
-        svc = _run_quiet(["sudo", "-n", "systemctl", "restart", "rustdesk"], timeout=20)
-        _summarize_proc("rustdesk service restart (pre)", svc)
-    except Exception as exc:
-        print(f"rustdesk service restart (pre) exception={exc}")
+    _restart_rustdesk_service("pre")
+
+    # The desktop graph starts the UI once the display is up; nothing below
+    # depends on the UI, so it comes up while we configure.
+    if bringup is not None:
+        bringup.mark("rustdesk_service")
+    else:
+        executor.spawn([rustdesk], label="rustdesk ui", env=_display_env())
+
+    _set_rustdesk_password_linux(rustdesk, password)
+    # The rendezvous/relay choice lands before the restart that activates it.
+    relays.apply_rustdesk_options(rustdesk, get_relay(), use_sudo=True)
+
+    _restart_rustdesk_service("post")
+
+    get_id_cmds = [
+        ["sudo", "-n", rustdesk, "--get-id"],
+        [rustdesk, "--get-id"],
+    ]
+    with tracing.span("rustdesk.get_id") as sp:
+        detection = wait_for_id("Linux", timeout=40, cli_fallback=lambda: _cli_get_id(get_id_cmds))
+        if detection is None:
+            raise RuntimeError("RustDesk ID not found")
+        sp.set(method=detection.method)
+    return detection.value
 
-    # Start desktop app so a UI session is available on the virtual display.
-    subprocess.Popen([rustdesk], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    time.sleep(3)
 
-    pw_set = False
+def _set_rustdesk_password_linux(rustdesk: str, password: str) -> None:
+    with tracing.span("rustdesk.password") as sp:
+        _set_rustdesk_password_linux_attempts(rustdesk, password, sp)
+
+
+def _set_rustdesk_password_linux_attempts(rustdesk: str, password: str, sp) -> None:
     last_proc = None
     password_cmds = [
         ["sudo", "-n", rustdesk, "--password", password],
         [rustdesk, "--password", password],
     ]
     for idx, cmd in enumerate(password_cmds, start=1):
-        for attempt in range(1, 5):
-            proc = subprocess.run(cmd, capture_output=True, text=True)
-            last_proc = proc
-            _summarize_proc(f"rustdesk password cmd#{idx} attempt#{attempt}", proc)
-            if proc.returncode == 0:
-                pw_set = True
-                break
-            time.sleep(2)
-        if pw_set:
-            break
-    if not pw_set:
-        if last_proc is not None:
-            _summarize_proc("rustdesk password final", last_proc)
-        raise RuntimeError("Failed to set RustDesk password on Linux")
+        scope = "sudo" if cmd[0] == "sudo" else "user"
+        outcome = {"attempts": 0, "ok": False}
+        baseline = password_fingerprint("Linux")
 
-    try:
-        svc = _run_quiet(["sudo", "-n", "systemctl", "restart", "rustdesk"], timeout=20)
-        _summarize_proc("rustdesk service restart (post)", svc)
-    except Exception as exc:
-        print(f"rustdesk service restart (post) exception={exc}")
+        def stored(proc, idx=idx, outcome=outcome, baseline=baseline) -> bool:
+            outcome["attempts"] += 1
+            _summarize_proc(f"rustdesk password cmd#{idx} attempt#{outcome['attempts']}", proc)
+            if proc.returncode != 0:
+                # Some RustDesk builds exit non-zero even though the service
+                # stored the password, so a change on disk counts as success.
+                # The field is encrypted: this only shows that *a* new password
+                # was written around our call, not that it is ours.
+                if not wait_for_password_change("Linux", baseline, timeout=0.5):
+                    return False
+                outcome["confirmed_by"] = "config"
+            outcome["ok"] = True
+            return True
 
-    rid = ""
-    get_id_cmds = [
-        ["sudo", "-n", rustdesk, "--get-id"],
-        [rustdesk, "--get-id"],
-    ]
-    for cmd in get_id_cmds:
-        for _ in range(8):
-            out = subprocess.run(cmd, capture_output=True, text=True)
-            rid = (out.stdout or "").strip().splitlines()[0] if (out.stdout or "").strip() else ""
-            if rid:
-                print(f"rustdesk get-id via {'sudo' if cmd[0] == 'sudo' else 'user'} success")
-                break
-            time.sleep(2)
+        last_proc = executor.run(cmd, timeout=30, label=f"rustdesk --password ({scope})", retries=3, ok=stored)
+        if outcome["ok"]:
+            sp.set(attempts=outcome["attempts"], scope=scope, **({"confirmed_by": "config"} if "confirmed_by" in outcome else {}))
+            return
+    if last_proc is not None:
+        _summarize_proc("rustdesk password final", last_proc)
+    raise RuntimeError("Failed to set RustDesk password on Linux")
+
+
+def _first_line(proc) -> str:
+    out = (proc.stdout or "").strip()
+    return out.splitlines()[0] if out else ""
+
+
+def _cli_get_id(cmds) -> str:
+    # Fallback only: each probe starts a full RustDesk process. A service
+    # that is still starting prints nothing, so each scope gets one retry.
+    for cmd in cmds:
+        scope = "sudo" if cmd[0] == "sudo" else "user"
+        out = executor.run(cmd, timeout=15, label=f"rustdesk --get-id ({scope})", retries=1, ok=lambda p: bool(_first_line(p)))
+        rid = _first_line(out)
         if rid:
-            break
-    if not rid:
-        raise RuntimeError("RustDesk ID not found")
-    return rid
+            print(f"rustdesk get-id via {scope} success")
+            return rid
+    return ""
+
+
+TMATE_SOCKET = "/tmp/tmate-gibrunner.sock"
+# One display call returns both endpoints; a tab cannot occur in either value.
+TMATE_ENDPOINTS_FORMAT = "#{tmate_ssh}\t#{tmate_web}"
+
+
+def _query_tmate_endpoints(sock: str) -> tuple[str | None, str | None]:
+    out = executor.run(["tmate", "-S", sock, "display", "-p", TMATE_ENDPOINTS_FORMAT], timeout=10, label="tmate display")
+    ssh_cmd, _, web_url = (out.stdout or "").strip("\n").partition("\t")
+    return ssh_cmd.strip() or None, web_url.strip() or None
 
 
 def _start_tmate_linux():
+    with tracing.span("tmate") as sp:
+        ssh_cmd, web_url = _start_tmate_linux_inner()
+        sp.set(ready=bool(ssh_cmd))
+        return ssh_cmd, web_url
+
+
+def _start_tmate_linux_inner():
     if not shutil.which("tmate"):
         return None, None
 
-    sock = "/tmp/tmate-gibrunner.sock"
-    try:
-        subprocess.run(["tmate", "-S", sock, "kill-server"], capture_output=True, text=True, timeout=5)
-    except Exception:
-        pass
-    subprocess.Popen(["tmate", "-S", sock, "new-session", "-d"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    ssh_cmd = None
-    web_url = None
-    for _ in range(20):
-        ssh_out = _run_quiet(["tmate", "-S", sock, "display", "-p", "#{tmate_ssh}"], timeout=10)
-        web_out = _run_quiet(["tmate", "-S", sock, "display", "-p", "#{tmate_web}"], timeout=10)
-        ssh_cmd = (ssh_out.stdout or "").strip() or None
-        web_url = (web_out.stdout or "").strip() or None
+    sock = TMATE_SOCKET
+    executor.run(["tmate", "-S", sock, "kill-server"], timeout=5)
+    executor.spawn(["tmate", "-S", sock, "new-session", "-d"], label="tmate new-session")
+
+    # `wait tmate-ready` blocks until the session is registered with the tmate
+    # server; older builds without it fall through to polling below.
+    ready = executor.run(["tmate", "-S", sock, "wait", "tmate-ready"], timeout=30, label="tmate wait tmate-ready")
+    ssh_cmd, web_url = _query_tmate_endpoints(sock)
+    if ssh_cmd or ready.returncode == 0:
+        return ssh_cmd, web_url
+
+    deadline = time.monotonic() + 40
+    delay = 0.5
+    while time.monotonic() < deadline and not executor.cancelled():
+        ssh_cmd, web_url = _query_tmate_endpoints(sock)
         if ssh_cmd:
             break
-        time.sleep(2)
+        time.sleep(delay)
+        delay = min(2.0, delay * 1.5)
     return ssh_cmd, web_url
 
 
-def start_remote_access(system_os: str, rustdesk_password: str):
-    if system_os == "Windows":
-        rustdesk_id = _start_rustdesk_windows(rustdesk_password)
-        tmate_ssh, tmate_web = None, None
-    else:
-        rustdesk_id = _start_rustdesk_linux(rustdesk_password)
-        tmate_ssh, tmate_web = _start_tmate_linux()
-    return {
+def _resolve_relay() -> tuple[relays.RelayServer | None, dict]:
+    try:
+        return relays.resolve()
+    except Exception as exc:
+        print(f"relay probe failed: {exc}")
+        return None, {"chosen": None, "error": str(exc)}
+
+
+def _resolve_profile(name: str) -> tuple[profiles.Profile, dict]:
+    try:
+        return profiles.resolve(name)
+    except Exception as exc:
+        print(f"profile resolution failed: {exc}")
+        return _default_profile(), {"requested": name, "profile": profiles.DEFAULT_PROFILE, "error": str(exc)}
+
+
+def start_remote_access(
+    system_os: str,
+    rustdesk_password: str,
+    on_update: Callable[[dict], None] | None = None,
+    profile: str = profiles.DEFAULT_PROFILE,
+    cancel: threading.Event | None = None,
+):
+    # RustDesk is the critical path. tmate and the ip/spec lookup run next to
+    # it; whatever is not finished when RustDesk is ready is handed to
+    # on_update later instead of holding the session back. The performance
+    # profile resolves alongside ("auto" measures the link); only the steps
+    # that need it (Xvfb, xfce) wait for it, and RustDesk waits for the
+    # rendezvous/relay probe only right before its restart. Setting `cancel`
+    # kills the commands in flight and fails the startup.
+    pool = ThreadPoolExecutor(max_workers=7, thread_name_prefix="startup")
+    try:
+        # Entered before the submits: tracing.bind carries the scope along.
+        with executor.cancel_scope(cancel):
+            profile_future = pool.submit(tracing.bind(_resolve_profile), profile)
+            get_profile = lambda: profile_future.result()[0]
+            relay_future = pool.submit(tracing.bind(_resolve_relay))
+            get_relay = lambda: relay_future.result()[0]
+            details_future = pool.submit(tracing.bind(get_server_details))
+            if system_os == "Windows":
+                rustdesk_future = pool.submit(tracing.bind(_start_rustdesk_windows), rustdesk_password, get_relay)
+                tmate_future = desktop_future = tuning_future = None
+            else:
+                bringup = linux_desktop_bringup(get_profile)
+                tuning_future = pool.submit(tracing.bind(_tune_linux), bringup)
+                desktop_future = pool.submit(tracing.bind(_bring_up_desktop), bringup)
+                rustdesk_future = pool.submit(tracing.bind(_start_rustdesk_linux), rustdesk_password, bringup, get_relay)
+                tmate_future = pool.submit(tracing.bind(_start_tmate_linux))
+        rustdesk_id = rustdesk_future.result()
+        chosen, profile_report = profile_future.result()
+        server, relay_report = relay_future.result()
+    finally:
+        pool.shutdown(wait=False)
+    if cancel is not None and cancel.is_set():
+        raise RuntimeError("startup cancelled")
+
+    result = {
         "rustdesk_id": rustdesk_id,
         "rustdesk_password": rustdesk_password,
-        "tmate_ssh": tmate_ssh,
-        "tmate_web": tmate_web,
+        "tmate_ssh": None,
+        "tmate_web": None,
+        "profile": {**profile_report, "screen": chosen.screen, "compositing": chosen.compositing},
+        "relay": relay_report,
+        "rustdesk_server": relays.rustdesk_options(server) if server is not None else {},
+        "pending": [],
     }
+    _collect_or_defer("tmate", tmate_future, result, _tmate_update, on_update)
+    _collect_or_defer("server_details", details_future, result, _details_update, on_update)
+    _collect_or_defer("desktop", desktop_future, result, _desktop_update, on_update)
+    _collect_or_defer("tuning", tuning_future, result, _tuning_update, on_update)
+    return result
+
+
+def cancel_remote_access(system_os: str) -> None:
+    # Tear down what a cancelled warm-up left running, so no tmate endpoint
+    # stays reachable without ever having been announced. RustDesk and the
+    # desktop go with the runner shutdown that follows.
+    if system_os == "Windows" or not shutil.which("tmate"):
+        return
+    executor.run(["tmate", "-S", TMATE_SOCKET, "kill-server"], timeout=5, label="tmate kill-server")
+
+
+def check_remote_access(system_os: str, endpoints: dict) -> dict:
+    # Used when the agent restarts mid-session: RustDesk, the desktop and tmate
+    # run detached from the agent, so they normally outlive it.
+    if system_os == "Windows":
+        rustdesk = _process_running(lambda name, _cmd: name.lower().startswith("rustdesk"))
+        return {"rustdesk": rustdesk, "tmate": False}
+    rustdesk = _safe_probe(_rustdesk_service_ready) and _safe_probe(_display_ready)
+    tmate = False
+    if endpoints.get("tmate_ssh") and shutil.which("tmate"):
+        tmate = _query_tmate_endpoints(TMATE_SOCKET)[0] == endpoints["tmate_ssh"]
+    return {"rustdesk": rustdesk, "tmate": tmate}
+
+
+RUSTDESK_DIRECT_PORT = 21118
+
+
+def _rustdesk_peer_connections(relay_port: int) -> int:
+    # Peers come in through the relay (hbbr, 21117 unless the chosen server
+    # says otherwise) or straight to the direct listener (21118); the
+    # rendezvous registration (21115/21116) is always open and does not
+    # count. Ports only, so no root is needed for the service's sockets.
+    count = 0
+    for established, local_port, remote_port in sysinfo.tcp_connections():
+        if not established or remote_port is None:
+            continue
+        if remote_port == relay_port or local_port == RUSTDESK_DIRECT_PORT:
+            count += 1
+    if not count and _process_running(lambda name, cmdline: "rustdesk" in name and "--cm" in cmdline):
+        # The connection manager window only runs while someone is connected.
+        count = 1
+    return count
+
+
+def _tmate_clients() -> int:
+    if not shutil.which("tmate") or not os.path.exists(TMATE_SOCKET):
+        return 0
+    out = executor.run(["tmate", "-S", TMATE_SOCKET, "display", "-p", "#{tmate_num_clients}"], timeout=5, label="tmate clients")
+    value = (out.stdout or "").strip()
+    if value.isdigit():
+        return int(value)
+    # Builds without the tmate_num_clients format: count attached clients.
+    out = executor.run(["tmate", "-S", TMATE_SOCKET, "list-clients"], timeout=5, label="tmate list-clients")
+    return len([line for line in (out.stdout or "").splitlines() if line.strip()])
+
+
+def _input_idle_seconds() -> float | None:
+    # RustDesk injects input through XTest, so remote use resets this too.
+    if not shutil.which("xprintidle"):
+        return None
+    out = executor.run(["xprintidle"], timeout=3, label="xprintidle", env=_display_env())
+    value = (out.stdout or "").strip()
+    return int(value) / 1000 if out.returncode == 0 and value.isdigit() else None
+
+
+def session_activity(system_os: str, relay_port: int = relays.RELAY_PORT) -> dict:
+    activity = {"rustdesk_peers": 0, "tmate_clients": 0, "input_idle_s": None}
+    try:
+        activity["rustdesk_peers"] = _rustdesk_peer_connections(relay_port)
+    except Exception as exc:
+        print(f"rustdesk peer check failed: {exc}")
+    if system_os != "Windows":
+        activity["tmate_clients"] = _tmate_clients()
+        activity["input_idle_s"] = _input_idle_seconds()
+    return activity
+
+
+def _tmate_update(future: Future) -> dict:
+    try:
+        tmate_ssh, tmate_web = future.result()
+    except Exception as exc:
+        print(f"tmate startup failed: {exc}")
+        tmate_ssh, tmate_web = None, None
+    return {"tmate_ssh": tmate_ssh, "tmate_web": tmate_web}
+
+
+def _details_update(future: Future) -> dict:
+    return {"server_details": future.result()}
+
+
+def _desktop_update(future: Future) -> dict:
+    try:
+        return {"desktop": future.result()}
+    except Exception as exc:
+        print(f"desktop bring-up failed: {exc}")
+        return {"desktop": {}}
+
+
+def _tuning_update(future: Future) -> dict:
+    return {"tuning": future.result()}
+
+
+def _collect_or_defer(branch: str, future: Future | None, result: dict, to_update, on_update) -> None:
+    # Deferred branches are listed in result["pending"]; each later update
+    # names its branch so the caller knows when startup has fully settled.
+    if future is None:
+        return
+    if future.done() or on_update is None:
+        result.update(to_update(future))
+        return
+    result["pending"].append(branch)
+
+    def _deliver(done: Future) -> None:
+        try:
+            on_update({"branch": branch, **to_update(done)})
+        except Exception as exc:
+            print(f"startup update failed: {exc}")
+
+    future.add_done_callback(_deliver)
 
 
 def perform_system_shutdown(system_os: str):
     if system_os == "Windows":
-        os.system("shutdown /s /t 0")
+        executor.run(["shutdown", "/s", "/t", "0"], timeout=30, label="shutdown")
     else:
         # GitHub Ubuntu runners run as sudo-enabled user.
-        os.system("sudo shutdown now")
+        executor.run(["sudo", "shutdown", "now"], timeout=30, label="shutdown")
@@ -0,0 +1,244 @@
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from . import executor
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_KEY_RE = re.compile(r"""^\s*([A-Za-z0-9_-]+)\s*=\s*(?:'([^']*)'|"([^"]*)"|([^#\s]+))""")
+
+
+@dataclass
+class Detection:
+    what: str
+    value: str
+    method: str
+    seconds: float
+    path: str | None = None
+
+
+_detections: list[Detection] = []
+_detections_lock = threading.Lock()
+
+
+def detection_timings() -> list[dict]:
+    with _detections_lock:
+        return [{k: v for k, v in asdict(d).items() if k != "value"} for d in _detections]
+
+
+def _record(detection: Detection) -> Detection:
+    with _detections_lock:
+        _detections.append(detection)
+    print(f"rustdesk {detection.what} via {detection.method} in {detection.seconds:.2f}s")
+    return detection
+
+
+def config_dirs(system_os: str) -> list[tuple[str, bool]]:
+    # (directory, needs_sudo). The service-scope config comes first because
+    # that is the ID peers connect to.
+    if system_os == "Windows":
+        dirs = [(r"C:\Windows\ServiceProfiles\LocalService\AppData\Roaming\RustDesk\config", False)]
+        appdata = os.getenv("APPDATA")
+        if appdata:
+            dirs.append((os.path.join(appdata, "RustDesk", "config"), False))
+        return dirs
+    dirs = []
+    root_dir = "/root/.config/rustdesk"
+    if os.geteuid() == 0:
+        dirs.append((root_dir, False))
+    else:
+        dirs.append((root_dir, not os.access(root_dir, os.R_OK)))
+        dirs.append((os.path.expanduser("~/.config/rustdesk"), False))
+    return dirs
+
+
+def parse_top_level(text: str) -> dict[str, str]:
+    # RustDesk.toml keeps id/password as flat top-level keys; a full TOML
+    # parser (tomllib is 3.11+) is not needed for those.
+    values: dict[str, str] = {}
+    for line in text.splitlines():
+        if line.lstrip().startswith("["):
+            break
+        match = _KEY_RE.match(line)
+        if match:
+            values[match.group(1)] = next(g for g in match.groups()[1:] if g is not None)
+    return values
+
+
+def _read_file(path: str, needs_sudo: bool) -> str | None:
+    try:
+        if needs_sudo:
+            proc = executor.run(["sudo", "-n", "cat", path], timeout=5, label="sudo cat rustdesk config")
+            return proc.stdout if proc.returncode == 0 else None
+        with open(path, encoding="utf-8", errors="replace") as fh:
+            return fh.read()
+    except Exception:
+        return None
+
+
+def read_config(system_os: str, name: str = "RustDesk.toml", include_sudo: bool = True) -> list[tuple[str, dict]]:
+    found = []
+    for directory, needs_sudo in config_dirs(system_os):
+        if needs_sudo and not include_sudo:
+            continue
+        path = os.path.join(directory, name)
+        text = _read_file(path, needs_sudo)
+        if text:
+            found.append((path, parse_top_level(text)))
+    return found
+
+
+def _scan_id(system_os: str, include_sudo: bool) -> tuple[tuple[str, str] | None, bool]:
+    # Only the service-scope config counts: that is the ID peers connect to,
+    # and the user-scope file may hold a different, stale one. Newer builds
+    # may keep only `enc_id`, which is encrypted with a machine key; the
+    # second value reports that so callers go to the CLI instead.
+    directory, needs_sudo = config_dirs(system_os)[0]
+    if needs_sudo and not include_sudo:
+        return None, False
+    path = os.path.join(directory, "RustDesk.toml")
+    text = _read_file(path, needs_sudo)
+    values = parse_top_level(text) if text else {}
+    rid = (values.get("id") or "").strip()
+    if rid:
+        return (path, rid), False
+    return None, bool((values.get("enc_id") or "").strip())
+
+
+def read_config_id(system_os: str, include_sudo: bool = True) -> tuple[str, str] | None:
+    return _scan_id(system_os, include_sudo)[0]
+
+
+def password_fingerprint(system_os: str) -> dict[str, str]:
+    # The stored password is encrypted, so compare what is on disk before and
+    # after `--password` rather than the plaintext.
+    return {path: values.get("password", "") for path, values in read_config(system_os)}
+
+
+class _Inotify:
+    def __init__(self, directories: list[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        watched = 0
+        for directory in directories:
+            if libc.inotify_add_watch(self.fd, directory.encode(), mask) >= 0:
+                watched += 1
+        if not watched:
+            os.close(self.fd)
+            raise OSError("no watchable config directory")
+
+    def wait(self, timeout: float) -> bool:
+        ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def _open_watcher(system_os: str):
+    if system_os != "Linux" or not hasattr(select, "select"):
+        return None
+    dirs = [d for d, needs_sudo in config_dirs(system_os) if not needs_sudo and os.path.isdir(d)]
+    if not dirs:
+        return None
+    try:
+        return _Inotify(dirs)
+    except Exception:
+        return None
+
+
+def wait_for_id(
+    system_os: str,
+    timeout: float = 40.0,
+    cli_fallback: Callable[[], str] | None = None,
+    cli_grace: float = 6.0,
+) -> Detection | None:
+    # Readable config dirs are watched (inotify on Linux, stat polling
+    # elsewhere). A service config that needs sudo is read on a slower
+    # cadence, and the RustDesk CLI is only tried after cli_grace, or as
+    # soon as the config turns up with only an encrypted `enc_id`.
+    start = time.monotonic()
+    deadline = start + timeout
+    watcher = _open_watcher(system_os)
+    needs_sudo = config_dirs(system_os)[0][1]
+    method = "sudo-read" if needs_sudo else "inotify" if watcher else "stat"
+    next_read = start
+    next_cli = start + cli_grace
+    cli_delay = 2.0
+    try:
+        while True:
+            now = time.monotonic()
+            encrypted = False
+            if now >= next_read:
+                found, encrypted = _scan_id(system_os, include_sudo=True)
+                if found:
+                    return _record(Detection("id", found[1], method, time.monotonic() - start, found[0]))
+                if needs_sudo:
+                    next_read = now + 1.0
+            if encrypted and next_cli > now:
+                next_cli = now
+            if cli_fallback is not None and now >= next_cli:
+                rid = ""
+                try:
+                    rid = cli_fallback()
+                except Exception:
+                    pass
+                if rid:
+                    return _record(Detection("id", rid, "cli", time.monotonic() - start))
+                next_cli = time.monotonic() + cli_delay
+            if time.monotonic() >= deadline or executor.cancelled():
+                return None
+            wait = min(0.25 if watcher is None else 1.0, max(0.0, deadline - time.monotonic()))
+            if watcher is not None:
+                watcher.wait(wait)
+            else:
+                time.sleep(wait)
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def wait_for_password_change(system_os: str, baseline: dict[str, str], timeout: float = 3.0) -> Detection | None:
+    start = time.monotonic()
+    watcher = _open_watcher(system_os)
+    method = "inotify" if watcher else "stat"
+    try:
+        while True:
+            for path, value in password_fingerprint(system_os).items():
+                if value and value != baseline.get(path, ""):
+                    return _record(Detection("password", "", method, time.monotonic() - start, path))
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                return None
+            if watcher is not None:
+                watcher.wait(min(0.5, remaining))
+            else:
+                time.sleep(min(0.25, remaining))
+    finally:
+        if watcher is not None:
+            watcher.close()
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from array import array
+
+from . import sysinfo
+
+METRICS = (
+    "cpu",
+    "cpu_max_core",
+    "ram",
+    "swap",
+    "disk_read_kbps",
+    "disk_write_kbps",
+    "net_rx_kbps",
+    "net_tx_kbps",
+)
+WINDOWS = (("1m", 60), ("5m", 300), ("15m", 900))
+
+
+class RingBuffer:
+    # Fixed-size float32 storage: 15 minutes at a 5 s cadence is 180 slots
+    # per metric, a few KB for the whole history.
+    def __init__(self, capacity: int, typecode: str = "f"):
+        self.capacity = max(1, capacity)
+        self._data = array(typecode, [0] * self.capacity)
+        self._next = 0
+        self._size = 0
+
+    def append(self, value: float) -> None:
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def latest(self, count: int | None = None) -> list[float]:
+        count = self._size if count is None else max(0, min(count, self._size))
+        start = (self._next - count) % self.capacity
+        if start + count <= self.capacity:
+            return list(self._data[start:start + count])
+        return list(self._data[start:]) + list(self._data[:self._next])
+
+
+class ResourceSampler:
+    def __init__(self, interval: float = 5.0, history_seconds: int = 900):
+        self.interval = max(0.5, interval)
+        capacity = int(history_seconds / self.interval) + 1
+        self._lock = threading.Lock()
+        self._times = RingBuffer(capacity, "d")
+        self._series = {name: RingBuffer(capacity) for name in METRICS}
+        self._per_core: list[float] = []
+        self._last_io: tuple[float, object, object] | None = None
+        # The meter primes its counters so the first real sample covers one
+        # interval instead of "since boot".
+        self._cpu = sysinfo.CpuMeter()
+
+    def _io_rates(self, now: float) -> dict[str, float]:
+        try:
+            disk = sysinfo.disk_io()
+        except Exception:
+            disk = None
+        try:
+            net = sysinfo.net_io()
+        except Exception:
+            net = None
+        rates = {"disk_read_kbps": 0.0, "disk_write_kbps": 0.0, "net_rx_kbps": 0.0, "net_tx_kbps": 0.0}
+        if self._last_io is not None:
+            last_time, last_disk, last_net = self._last_io
+            dt = max(1e-6, now - last_time)
+            if disk is not None and last_disk is not None:
+                rates["disk_read_kbps"] = max(0, disk[0] - last_disk[0]) / 1024 / dt
+                rates["disk_write_kbps"] = max(0, disk[1] - last_disk[1]) / 1024 / dt
+            if net is not None and last_net is not None:
+                rates["net_rx_kbps"] = max(0, net[0] - last_net[0]) / 1024 / dt
+                rates["net_tx_kbps"] = max(0, net[1] - last_net[1]) / 1024 / dt
+        self._last_io = (now, disk, net)
+        return rates
+
+    def sample(self) -> dict[str, float]:
+        now = time.monotonic()
+        cpu, per_core = self._cpu.sample()
+        values = {
+            "cpu": cpu,
+            "cpu_max_core": max(per_core) if per_core else 0.0,
+            "ram": sysinfo.memory()["percent"],
+            "swap": sysinfo.swap_percent(),
+            **self._io_rates(now),
+        }
+        with self._lock:
+            self._times.append(now)
+            for name in METRICS:
+                self._series[name].append(values[name])
+            self._per_core = list(per_core)
+        return values
+
+    def has_data(self) -> bool:
+        with self._lock:
+            return len(self._times) > 0
+
+    def current(self) -> dict:
+        with self._lock:
+            if not len(self._times):
+                return {}
+            current = {name: round(series.latest(1)[0], 1) for name, series in self._series.items()}
+            current["per_core"] = [round(v, 1) for v in self._per_core]
+            current["age_s"] = round(time.monotonic() - self._times.latest(1)[0], 1)
+        return current
+
+    def aggregates(self) -> dict[str, dict[str, dict[str, float]]]:
+        now = time.monotonic()
+        with self._lock:
+            times = self._times.latest()
+            series = {name: buf.latest() for name, buf in self._series.items()}
+        result = {}
+        for label, seconds in WINDOWS:
+            count = sum(1 for ts in times if now - ts <= seconds)
+            window = {}
+            for name, values in series.items():
+                tail = values[len(values) - count:] if count else []
+                if tail:
+                    window[name] = {"avg": round(sum(tail) / len(tail), 1), "max": round(max(tail), 1)}
+            result[label] = window
+        return result
+
+    def summary(self) -> dict:
+        # Compact form for the heartbeat: per metric [avg1m, avg5m, avg15m]
+        # plus the 15 minute peak.
+        aggs = self.aggregates()
+        summary = {}
+        for name in METRICS:
+            avgs = [aggs[label].get(name, {}).get("avg") for label, _ in WINDOWS]
+            peak = aggs["15m"].get(name, {}).get("max")
+            if any(v is not None for v in avgs):
+                summary[name] = [*avgs, peak]
+        return summary
+
+    async def run(self) -> None:
+        next_at = time.monotonic()
+        while True:
+            try:
+                self.sample()
+            except Exception as exc:
+                print(f"sampler error: {exc}")
+            next_at += self.interval
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
@@ -1,6 +1,12 @@
+import json
+import os
+import tempfile
 import threading
 import time
 from dataclasses import dataclass, field
+from typing import Callable
+
+SNAPSHOT_VERSION = 1
 
 
 @dataclass
@@ -14,18 +20,53 @@ class SessionState:
     rustdesk_password: str | None = None
     tmate_ssh: str | None = None
     tmate_web: str | None = None
+    # Rendezvous/relay/key RustDesk registered with when a self-hosted
+    # server won the probe; clients need the same settings to connect.
+    rustdesk_server: dict = field(default_factory=dict)
+    extensions: int = 0
+    # none | pending | delivered | failed, for the latest /session-endpoint.
+    endpoint_delivery: str = "none"
+    # Telegram mode starts remote access while the duration menu is open:
+    # none | running | ready | failed | cancelled. A ready result waits in
+    # warm_result until the duration pick claims it.
+    warmup: str = "none"
+    warm_result: dict | None = field(default=None, repr=False)
     error: str | None = None
     lock: threading.RLock = field(default_factory=threading.RLock)
+    listeners: list[Callable[[], None]] = field(default_factory=list, repr=False)
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        # Listeners run on the thread that changed the state, so they must not
+        # block; the agent uses them to wake its event loop timers.
+        with self.lock:
+            self.listeners.append(callback)
+
+    def _notify(self) -> None:
+        for callback in list(self.listeners):
+            try:
+                callback()
+            except Exception:
+                pass
 
     def set_duration(self, minutes: int) -> None:
         with self.lock:
             self.duration = minutes
             self.start_time = time.time()
+        self._notify()
 
     def extend(self, minutes: int) -> int:
         with self.lock:
             self.duration += minutes
-            return self.duration
+            self.extensions += 1
+            duration = self.duration
+        self._notify()
+        return duration
+
+    def deadline(self) -> float | None:
+        with self.lock:
+            if self.start_time is None or self.duration <= 0:
+                return None
+            return self.start_time + self.duration * 60
 
     def remaining_minutes(self) -> int | None:
         with self.lock:
@@ -37,6 +78,7 @@ class SessionState:
     def mark_started(self) -> None:
         with self.lock:
             self.session_started = True
+        self._notify()
 
     def set_endpoints(self, rustdesk_id: str, rustdesk_password: str, tmate_ssh: str | None, tmate_web: str | None) -> None:
         with self.lock:
@@ -45,7 +87,115 @@ class SessionState:
             self.tmate_ssh = tmate_ssh
             self.tmate_web = tmate_web
             self.endpoints_sent = True
+        self._notify()
+
+    def set_rustdesk_server(self, options: dict | None) -> None:
+        with self.lock:
+            self.rustdesk_server = dict(options or {})
+        self._notify()
+
+    def set_endpoint_delivery(self, status: str) -> None:
+        with self.lock:
+            self.endpoint_delivery = status
+        self._notify()
+
+    def set_warmup(self, status: str, result: dict | None = None) -> None:
+        with self.lock:
+            self.warmup = status
+            self.warm_result = result
+        self._notify()
+
+    def take_warm_result(self) -> dict | None:
+        with self.lock:
+            result, self.warm_result = self.warm_result, None
+            return result
+
+    def endpoints(self) -> dict:
+        with self.lock:
+            return {
+                "rustdesk_id": self.rustdesk_id,
+                "rustdesk_password": self.rustdesk_password,
+                "tmate_ssh": self.tmate_ssh,
+                "tmate_web": self.tmate_web,
+                "rustdesk_server": dict(self.rustdesk_server),
+            }
 
     def stop(self) -> None:
         with self.lock:
             self.active = False
+        self._notify()
+
+    def snapshot(self, run_id: str | None) -> dict:
+        with self.lock:
+            return {
+                "v": SNAPSHOT_VERSION,
+                "run_id": run_id,
+                "saved_at": round(time.time(), 3),
+                "active": self.active,
+                "started": self.session_started,
+                "start_time": self.start_time,
+                "duration": self.duration,
+                "extensions": self.extensions,
+                "endpoints": {
+                    "rustdesk_id": self.rustdesk_id,
+                    "rustdesk_password": self.rustdesk_password,
+                    "tmate_ssh": self.tmate_ssh,
+                    "tmate_web": self.tmate_web,
+                    "rustdesk_server": dict(self.rustdesk_server),
+                },
+                "endpoint_delivery": self.endpoint_delivery,
+            }
+
+    def restore(self, snap: dict) -> None:
+        endpoints = snap.get("endpoints") or {}
+        with self.lock:
+            self.start_time = snap.get("start_time")
+            self.duration = int(snap.get("duration") or 0)
+            self.extensions = int(snap.get("extensions") or 0)
+            self.session_started = bool(snap.get("started"))
+            self.endpoints_sent = bool(endpoints.get("rustdesk_id"))
+            self.rustdesk_id = endpoints.get("rustdesk_id")
+            self.rustdesk_password = endpoints.get("rustdesk_password")
+            self.tmate_ssh = endpoints.get("tmate_ssh")
+            self.tmate_web = endpoints.get("tmate_web")
+            self.rustdesk_server = dict(endpoints.get("rustdesk_server") or {})
+            self.endpoint_delivery = snap.get("endpoint_delivery") or "none"
+        self._notify()
+
+
+_write_lock = threading.Lock()
+
+
+def write_snapshot(path: str, snap: dict) -> bool:
+    # Atomic replace so a crash mid-write leaves the previous snapshot; the
+    # file holds the RustDesk password, so it is private to the user.
+    directory = os.path.dirname(path) or "."
+    with _write_lock:
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".gibrunner-state-")
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(snap, fh, separators=(",", ":"))
+            os.replace(tmp, path)
+            return True
+        except OSError as exc:
+            print(f"state snapshot failed: {exc}")
+            return False
+
+
+def load_snapshot(path: str, run_id: str | None) -> dict | None:
+    # Only a snapshot of this very run (same GITHUB_RUN_ID) that is still
+    # active and inside its deadline is worth resuming.
+    if not run_id:
+        return None
+    try:
+        with open(path, encoding="utf-8") as fh:
+            snap = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snap, dict) or snap.get("v") != SNAPSHOT_VERSION or snap.get("run_id") != run_id:
+        return None
+    if not snap.get("active") or not snap.get("start_time") or not snap.get("duration"):
+        return None
+    if snap["start_time"] + snap["duration"] * 60 <= time.time():
+        return None
+    return snap
@@ -0,0 +1,252 @@
+import os
+import time
+from typing import Iterator
+
+from .mode import metrics_backend
+
+# Host metrics for the sampler and the runtime probes. On Linux these come
+# straight from /proc when running lite (or without psutil); elsewhere psutil
+# is used when it is installed and the values degrade to "unknown" otherwise.
+
+_backend = metrics_backend()
+
+
+def backend() -> str:
+    return _backend
+
+
+def _psutil():
+    import psutil
+
+    return psutil
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        return fh.read()
+
+
+def _proc_cpu_times() -> list[tuple[float, float]]:
+    # (busy, total) jiffies for the aggregate line followed by every core.
+    # guest/guest_nice are already part of user/nice and are not re-added.
+    times = []
+    for line in _read("/proc/stat").splitlines():
+        if not line.startswith("cpu"):
+            break
+        fields = [float(v) for v in line.split()[1:9]]
+        fields += [0.0] * (8 - len(fields))
+        total = sum(fields)
+        idle = fields[3] + fields[4]
+        times.append((total - idle, total))
+    return times
+
+
+class CpuMeter:
+    # Same contract as psutil.cpu_percent(interval=None): each call reports
+    # usage since the previous one, and the first call only sets the baseline.
+    def __init__(self):
+        self._last: list[tuple[float, float]] | None = None
+        self.sample()
+
+    def sample(self) -> tuple[float, list[float]]:
+        if _backend == "psutil":
+            ps = _psutil()
+            per_core = ps.cpu_percent(interval=None, percpu=True)
+            return ps.cpu_percent(interval=None), per_core
+        if _backend != "proc":
+            return 0.0, []
+        current = _proc_cpu_times()
+        last, self._last = self._last, current
+        if last is None or len(last) != len(current):
+            return 0.0, [0.0] * (len(current) - 1)
+        percents = []
+        for (busy, total), (last_busy, last_total) in zip(current, last):
+            d_total = total - last_total
+            percents.append(round(max(0.0, min(100.0, (busy - last_busy) * 100 / d_total)), 1) if d_total > 0 else 0.0)
+        return percents[0], percents[1:]
+
+
+def _meminfo() -> dict[str, int]:
+    values = {}
+    for line in _read("/proc/meminfo").splitlines():
+        key, _, rest = line.partition(":")
+        parts = rest.split()
+        if parts and parts[0].isdigit():
+            values[key] = int(parts[0]) * 1024
+    return values
+
+
+def memory() -> dict[str, float]:
+    # total/available in bytes, percent like psutil.virtual_memory().percent.
+    if _backend == "psutil":
+        vm = _psutil().virtual_memory()
+        return {"total": vm.total, "available": vm.available, "percent": vm.percent}
+    if _backend != "proc":
+        return {"total": 0, "available": 0, "percent": 0.0}
+    info = _meminfo()
+    total = info.get("MemTotal", 0)
+    available = info.get("MemAvailable", info.get("MemFree", 0))
+    percent = round((total - available) * 100 / total, 1) if total else 0.0
+    return {"total": total, "available": available, "percent": percent}
+
+
+def swap_percent() -> float:
+    if _backend == "psutil":
+        return _psutil().swap_memory().percent
+    if _backend != "proc":
+        return 0.0
+    info = _meminfo()
+    total = info.get("SwapTotal", 0)
+    return round((total - info.get("SwapFree", 0)) * 100 / total, 1) if total else 0.0
+
+
+def swap_total() -> int:
+    if _backend == "psutil":
+        return _psutil().swap_memory().total
+    if _backend != "proc":
+        return 0
+    return _meminfo().get("SwapTotal", 0)
+
+
+def pressure(resource: str) -> dict[str, float] | None:
+    # Linux PSI (/proc/pressure/{cpu,memory,io}): share of wall time some /
+    # all runnable tasks were stalled on the resource. psutil has no
+    # equivalent, so this reads /proc whatever the backend; None without PSI.
+    try:
+        text = _read(f"/proc/pressure/{resource}")
+    except OSError:
+        return None
+    values = {}
+    for line in text.splitlines():
+        kind, _, rest = line.partition(" ")
+        for field in rest.split():
+            key, _, value = field.partition("=")
+            if key in ("avg10", "avg60"):
+                values[f"{kind}_{key}"] = float(value)
+    return values
+
+
+def _block_devices() -> set[str]:
+    # Whole disks only (partitions would double count); loop/ram are noise.
+    try:
+        names = os.listdir("/sys/block")
+    except OSError:
+        return set()
+    return {name for name in names if not name.startswith(("loop", "ram", "zram"))}
+
+
+def disk_io() -> tuple[int, int] | None:
+    # (read_bytes, write_bytes) since boot.
+    if _backend == "psutil":
+        counters = _psutil().disk_io_counters()
+        return None if counters is None else (counters.read_bytes, counters.write_bytes)
+    if _backend != "proc":
+        return None
+    disks = _block_devices()
+    read = write = 0
+    for line in _read("/proc/diskstats").splitlines():
+        fields = line.split()
+        if len(fields) < 10 or (disks and fields[2] not in disks):
+            continue
+        # Sectors are always 512 bytes in diskstats, whatever the device uses.
+        read += int(fields[5]) * 512
+        write += int(fields[9]) * 512
+    return read, write
+
+
+def net_io() -> tuple[int, int] | None:
+    # (bytes_recv, bytes_sent) over every interface, loopback included as
+    # psutil does.
+    if _backend == "psutil":
+        counters = _psutil().net_io_counters()
+        return None if counters is None else (counters.bytes_recv, counters.bytes_sent)
+    if _backend != "proc":
+        return None
+    recv = sent = 0
+    for line in _read("/proc/net/dev").splitlines()[2:]:
+        _, _, data = line.partition(":")
+        fields = data.split()
+        if len(fields) >= 9:
+            recv += int(fields[0])
+            sent += int(fields[8])
+    return recv, sent
+
+
+def cpu_count() -> int:
+    return os.cpu_count() or 1
+
+
+def processes() -> Iterator[tuple[str, list[str]]]:
+    # (name, cmdline) for every process we can see; vanished or foreign
+    # processes are skipped.
+    if _backend == "psutil":
+        for p in _psutil().process_iter(["name", "cmdline"]):
+            yield p.info.get("name") or "", p.info.get("cmdline") or []
+        return
+    if _backend != "proc":
+        return
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            name = _read(f"/proc/{pid}/comm").strip()
+            with open(f"/proc/{pid}/cmdline", "rb") as fh:
+                raw = fh.read()
+        except OSError:
+            continue
+        cmdline = [part.decode(errors="replace") for part in raw.split(b"\0") if part]
+        # comm is cut at 15 characters; psutil widens it from argv[0].
+        if len(name) >= 15 and cmdline:
+            base = os.path.basename(cmdline[0])
+            if base.startswith(name):
+                name = base
+        yield name, cmdline
+
+
+TCP_ESTABLISHED = "01"
+
+
+def tcp_connections() -> list[tuple[bool, int, int | None]]:
+    # (established, local_port, remote_port) for IPv4 and IPv6 sockets.
+    if _backend == "psutil":
+        ps = _psutil()
+        return [
+            (conn.status == ps.CONN_ESTABLISHED, conn.laddr.port if conn.laddr else 0, conn.raddr.port if conn.raddr else None)
+            for conn in ps.net_connections(kind="tcp")
+        ]
+    if _backend != "proc":
+        return []
+    conns = []
+    for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            lines = _read(path).splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            local_port = int(fields[1].rsplit(":", 1)[1], 16)
+            remote_port = int(fields[2].rsplit(":", 1)[1], 16)
+            conns.append((fields[3] == TCP_ESTABLISHED, local_port, remote_port or None))
+    return conns
+
+
+def process_start_time() -> float | None:
+    # Wall-clock start of this interpreter, for startup measurements.
+    if _backend == "psutil":
+        return _psutil().Process().create_time()
+    if _backend != "proc":
+        return None
+    try:
+        stat = _read("/proc/self/stat")
+        ticks = int(stat.rsplit(")", 1)[1].split()[19])
+        btime = next(int(line.split()[1]) for line in _read("/proc/stat").splitlines() if line.startswith("btime"))
+        return btime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, StopIteration, IndexError):
+        return None
+
+
+def process_age() -> float | None:
+    started = process_start_time()
+    return None if started is None else max(0.0, time.time() - started)
@@ -0,0 +1,192 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from . import executor
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: int
+    parent_id: int | None
+    start: float
+    end: float | None = None
+    attrs: dict = field(default_factory=dict)
+    thread: str = ""
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("gibrunner_span", default=None)
+
+
+class Tracer:
+    # Spans use time.monotonic(); origin_unix anchors them to wall-clock time
+    # so traces from many runners can be lined up afterwards.
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.origin_unix = time.time()
+        self._spans: list[Span] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _new_span(self, name: str, start: float, parent: Span | None, attrs: dict) -> Span:
+        span = Span(
+            name=name,
+            span_id=next(self._ids),
+            parent_id=parent.span_id if parent else None,
+            start=start,
+            attrs=dict(attrs),
+            thread=threading.current_thread().name,
+        )
+        with self._lock:
+            self._spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        span = self._new_span(name, time.monotonic(), _current.get(), attrs)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.set(error=f"{type(exc).__name__}: {exc}")
+            raise
+        finally:
+            span.end = time.monotonic()
+            _current.reset(token)
+
+    def record(self, name: str, start: float, end: float, **attrs) -> Span:
+        span = self._new_span(name, start, _current.get(), attrs)
+        span.end = end
+        return span
+
+    def add_external(self, name: str, start_unix: float, end_unix: float, **attrs) -> Span:
+        # Phases measured outside the process (workflow steps) on the wall clock.
+        offset = self.origin - self.origin_unix
+        return self.record(name, start_unix + offset, end_unix + offset, **attrs)
+
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def to_payload(self) -> dict:
+        spans = []
+        phases: dict[str, float] = {}
+        end = self.origin
+        for span in self.spans():
+            span_end = span.end if span.end is not None else time.monotonic()
+            end = max(end, span_end)
+            duration_ms = round((span_end - span.start) * 1000, 1)
+            phases[span.name] = round(phases.get(span.name, 0.0) + duration_ms, 1)
+            spans.append({
+                "name": span.name,
+                "id": span.span_id,
+                "parent": span.parent_id,
+                "start_ms": round((span.start - self.origin) * 1000, 1),
+                "duration_ms": duration_ms,
+                "open": span.end is None,
+                "thread": span.thread,
+                "attrs": span.attrs,
+            })
+        return {
+            "origin_unix": round(self.origin_unix, 3),
+            "total_ms": round((end - self.origin) * 1000, 1),
+            "phases": phases,
+            "spans": spans,
+        }
+
+    def write_json(self, path: str, extra: dict | None = None) -> bool:
+        payload = {**(extra or {}), "trace": self.to_payload()}
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(payload, fh, indent=1)
+            os.replace(tmp, path)
+            return True
+        except OSError as exc:
+            print(f"trace write failed: {exc}")
+            return False
+
+
+_tracer: Tracer | None = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+def reset_tracer() -> Tracer:
+    global _tracer
+    with _tracer_lock:
+        _tracer = Tracer()
+        return _tracer
+
+
+def span(name: str, **attrs):
+    return get_tracer().span(name, **attrs)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def bind(fn):
+    # Thread pools don't inherit contextvars; bind the caller's context so
+    # spans opened in the worker thread nest under the submitting span.
+    ctx = contextvars.copy_context()
+
+    def _run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+
+    return _run
+
+
+def import_phase_file(path: str | None, tracer: Tracer | None = None) -> int:
+    # Lines of "<name> <start_unix> <end_unix>", appended by workflow steps.
+    if not path or not os.path.exists(path):
+        return 0
+    tracer = tracer or get_tracer()
+    count = 0
+    try:
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                parts = line.split()
+                if len(parts) != 3:
+                    continue
+                try:
+                    tracer.add_external(f"workflow.{parts[0]}", float(parts[1]), float(parts[2]))
+                    count += 1
+                except ValueError:
+                    continue
+    except OSError:
+        return count
+    return count
+
+
+def _on_command(record: executor.CommandRecord) -> None:
+    if _current.get() is None:
+        return
+    get_tracer().record(
+        f"cmd {record.label}",
+        record.started_mono,
+        record.started_mono + record.duration,
+        rc=record.returncode,
+        retries=record.retries,
+        timed_out=record.timed_out,
+    )
+
+
+executor.add_listener(_on_command)
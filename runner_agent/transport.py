@@ -0,0 +1,317 @@
+import http.client
+import json as jsonlib
+import select
+import ssl
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from .mode import http_backend
+
+
+@dataclass
+class EndpointStats:
+    count: int = 0
+    errors: int = 0
+    first_ms: float | None = None
+    last_ms: float = 0.0
+    max_ms: float = 0.0
+    total_ms: float = 0.0
+
+    def record(self, elapsed_ms: float, ok: bool) -> None:
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        if self.first_ms is None:
+            self.first_ms = elapsed_ms
+        self.last_ms = elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.total_ms += elapsed_ms
+
+    def as_dict(self) -> dict:
+        avg = self.total_ms / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "first_ms": round(self.first_ms or 0.0, 1),
+            "last_ms": round(self.last_ms, 1),
+            "avg_ms": round(avg, 1),
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class BaseTransport:
+    # Timing per endpoint around whatever actually sends the request; the
+    # subclasses only provide _send/connections_opened/close.
+    backend = "base"
+
+    def __init__(self, pool_size: int = 4):
+        self.pool_size = max(1, pool_size)
+        self._stats: dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _send(self, method: str, url: str, **kwargs):
+        raise NotImplementedError
+
+    def request(self, method: str, url: str, endpoint: str | None = None, **kwargs):
+        name = endpoint or urlsplit(url).path or "/"
+        start = time.perf_counter()
+        ok = False
+        try:
+            resp = self._send(method, url, **kwargs)
+            ok = resp.status_code < 500
+            return resp
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._stats.setdefault(name, EndpointStats()).record(elapsed_ms, ok)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def connections_opened(self) -> int:
+        return 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {name: st.as_dict() for name, st in sorted(self._stats.items())}
+        return {
+            "backend": self.backend,
+            "pool_size": self.pool_size,
+            "connections_opened": self.connections_opened(),
+            "endpoints": endpoints,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class HttpTransport(BaseTransport):
+    # One keep-alive session for every worker call. The first request per host
+    # pays for TCP+TLS; afterwards connections are reused from the pool, which
+    # shows up as avg_ms dropping well below first_ms in stats().
+    backend = "requests"
+
+    def __init__(self, pool_size: int = 4):
+        super().__init__(pool_size)
+        # Imported here so lite mode never pays for (or needs) requests.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, pool_block=False)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Connection"] = "keep-alive"
+        self._adapter = adapter
+
+    def _send(self, method: str, url: str, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def connections_opened(self) -> int:
+        total = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                total += getattr(pool, "num_connections", 0)
+        return total
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class StdlibResponse:
+    # The subset of requests.Response the agent uses. Non-streamed bodies are
+    # read up front so the connection can go straight back to the pool.
+    def __init__(self, transport: "StdlibTransport", key: tuple, conn, resp: http.client.HTTPResponse, stream: bool):
+        self.status_code = resp.status
+        self.headers = {k.lower(): v for k, v in resp.getheaders()}
+        self._transport = transport
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self._content: bytes | None = None
+        if not stream:
+            self._content = resp.read()
+            self._release()
+
+    def _release(self) -> None:
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._transport._release(self._key, conn, reusable=self._resp.isclosed() and not self._resp.will_close)
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = self._resp.read()
+            self._release()
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return jsonlib.loads(self.content)
+
+    def iter_content(self, chunk_size: int = 65536):
+        while True:
+            chunk = self._resp.read1(chunk_size)
+            if not chunk:
+                self._release()
+                return
+            yield chunk
+
+    def iter_lines(self, decode_unicode: bool = False):
+        while True:
+            line = self._resp.readline()
+            if not line:
+                self._release()
+                return
+            line = line.rstrip(b"\r\n")
+            yield line.decode("utf-8", errors="replace") if decode_unicode else line
+
+    def close(self) -> None:
+        if self._conn is not None:
+            # Abandoned mid-body: the connection cannot be reused.
+            conn, self._conn = self._conn, None
+            self._transport._release(self._key, conn, reusable=False)
+        self._resp.close()
+
+
+class StdlibTransport(BaseTransport):
+    # Keep-alive pool on http.client for running on a bare interpreter. Idle
+    # connections are kept per (scheme, host, port); one that the server has
+    # closed in the meantime is dropped before use, and a request that fails
+    # on a reused connection is retried once on a fresh one.
+    backend = "stdlib"
+
+    def __init__(self, pool_size: int = 4):
+        super().__init__(pool_size)
+        self._idle: dict[tuple, list] = {}
+        self._opened = 0
+        self._ssl = None
+
+    def _connect(self, key: tuple, connect_timeout: float | None):
+        scheme, host, port = key
+        if scheme == "https":
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            conn = http.client.HTTPSConnection(host, port, timeout=connect_timeout, context=self._ssl)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=connect_timeout)
+        conn.connect()
+        with self._lock:
+            self._opened += 1
+        return conn
+
+    @staticmethod
+    def _dropped(conn) -> bool:
+        # An idle keep-alive socket that is readable has been closed (or sent
+        # garbage) by the server.
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _acquire(self, key: tuple):
+        with self._lock:
+            idle = self._idle.get(key) or []
+            while idle:
+                conn = idle.pop()
+                if not self._dropped(conn):
+                    return conn
+                conn.close()
+        return None
+
+    def _release(self, key: tuple, conn, reusable: bool) -> None:
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.pool_size:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def _send(self, method: str, url: str, **kwargs):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        timeout = kwargs.get("timeout")
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        headers = {"Connection": "keep-alive", "Accept-Encoding": "identity", **(kwargs.get("headers") or {})}
+        body = kwargs.get("data")
+        if kwargs.get("json") is not None:
+            body = jsonlib.dumps(kwargs["json"]).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+
+        conn = self._acquire(key)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect(key, connect_timeout)
+            conn.sock.settimeout(read_timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError, BrokenPipeError):
+                conn.close()
+                if not reused:
+                    raise
+                reused, conn = False, None
+                continue
+            except Exception:
+                conn.close()
+                raise
+            return StdlibResponse(self, key, conn, resp, stream=bool(kwargs.get("stream")))
+
+    def connections_opened(self) -> int:
+        return self._opened
+
+    def close(self) -> None:
+        with self._lock:
+            pools, self._idle = self._idle, {}
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+
+_shared: BaseTransport | None = None
+_shared_lock = threading.Lock()
+
+
+def make_transport(pool_size: int = 4) -> BaseTransport:
+    if http_backend() == "stdlib":
+        return StdlibTransport(pool_size)
+    return HttpTransport(pool_size)
+
+
+def get_transport(pool_size: int | None = None) -> BaseTransport:
+    # The first caller decides the pool size; everyone after shares the session.
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = make_transport(pool_size or 4)
+        return _shared
+
+
+def format_stats(stats: dict) -> str:
+    parts = [f"{stats.get('backend', 'requests')} conns={stats.get('connections_opened', 0)}"]
+    for name, st in stats.get("endpoints", {}).items():
+        parts.append(f"{name} n={st['count']} err={st['errors']} first={st['first_ms']}ms avg={st['avg_ms']}ms max={st['max_ms']}ms")
+    return " | ".join(parts)
@@ -0,0 +1,201 @@
+import os
+import shutil
+import time
+
+from . import executor, sysinfo, tracing
+
+# Memory/storage setup for Linux sessions, applied before xfce starts:
+#   MEMORY_TUNING    auto (zram, else swapfile) | zram | swapfile | off
+#   WORKSPACE_TMPFS  size of a RAM-backed scratch dir ("4G", "25%"); empty = none
+#   WORKSPACE_DIR    where it is mounted (default ~/scratch)
+#   AGENT_OOM_SCORE_ADJ  oom_score_adj for the agent (default -900)
+TUNING_MODES = ("auto", "zram", "swapfile", "off")
+GIB = 1024 ** 3
+# Compressed swap in RAM, sized like Fedora's zram-generator: min(RAM, 8G).
+MAX_SWAP = 8 * GIB
+# A swapfile must leave this much of the disk to the user.
+DISK_RESERVE = 10 * GIB
+ZRAM_PRIORITY = 100
+SWAPFILE_PRIORITY = 10
+DEFAULT_OOM_SCORE_ADJ = -900
+
+
+def tuning_mode() -> str:
+    value = (os.getenv("MEMORY_TUNING") or "auto").strip().lower()
+    return value if value in TUNING_MODES else "auto"
+
+
+def snapshot() -> dict:
+    # What the status message compares against later: memory, swap and PSI
+    # (share of time tasks stalled on memory / io), plus cumulative disk io.
+    mem = sysinfo.memory()
+    psi_mem = sysinfo.pressure("memory") or {}
+    psi_io = sysinfo.pressure("io") or {}
+    disk = sysinfo.disk_io()
+    return {
+        "mem_total_mb": round(mem["total"] / 1024 ** 2),
+        "mem_available_mb": round(mem["available"] / 1024 ** 2),
+        "swap_total_mb": round(sysinfo.swap_total() / 1024 ** 2),
+        "swap_percent": sysinfo.swap_percent(),
+        "psi_memory_some_avg60": psi_mem.get("some_avg60"),
+        "psi_memory_full_avg60": psi_mem.get("full_avg60"),
+        "psi_io_some_avg60": psi_io.get("some_avg60"),
+        "disk_read_mb": None if disk is None else round(disk[0] / 1024 ** 2),
+        "disk_write_mb": None if disk is None else round(disk[1] / 1024 ** 2),
+    }
+
+
+def _active_swaps() -> list[str]:
+    try:
+        with open("/proc/swaps", encoding="utf-8") as fh:
+            return [line.split()[0] for line in fh.read().splitlines()[1:] if line.strip()]
+    except OSError:
+        return []
+
+
+def _sudo(*cmd: str, timeout: float = 20, label: str | None = None):
+    return executor.run(["sudo", "-n", *cmd], timeout=timeout, label=label)
+
+
+def _setup_zram(size: int) -> dict:
+    if any(name.startswith("/dev/zram") for name in _active_swaps()):
+        return {"kind": "zram", "state": "present"}
+    if not shutil.which("zramctl"):
+        return {"kind": "zram", "state": "unavailable", "error": "zramctl not installed"}
+    _sudo("modprobe", "zram", label="modprobe zram")
+    for algorithm in ("zstd", "lz4"):
+        proc = _sudo("zramctl", "--find", "--size", str(size), "--algorithm", algorithm, label="zramctl --find")
+        device = (proc.stdout or "").strip()
+        if proc.returncode == 0 and device.startswith("/dev/zram"):
+            break
+    else:
+        return {"kind": "zram", "state": "unavailable", "error": (proc.stderr or "").strip()[:160]}
+    if _sudo("mkswap", device, label="mkswap zram").returncode != 0 or \
+            _sudo("swapon", "--priority", str(ZRAM_PRIORITY), device, label="swapon zram").returncode != 0:
+        _sudo("zramctl", "--reset", device, label="zramctl --reset")
+        return {"kind": "zram", "state": "failed", "device": device}
+    # Swapping to RAM is cheap: favour it over dropping page cache, and skip
+    # readahead, which only helps on disks.
+    _sudo("sysctl", "-q", "vm.swappiness=100", "vm.page-cluster=0", label="sysctl vm")
+    return {"kind": "zram", "state": "enabled", "device": device, "size_mb": size // 1024 ** 2, "algorithm": algorithm}
+
+
+def _swapfile_path() -> str:
+    # Azure runners mount the larger temporary disk on /mnt.
+    return "/mnt/gibrunner.swap" if os.path.ismount("/mnt") else "/gibrunner.swap"
+
+
+def _setup_swapfile(size: int) -> dict:
+    path = _swapfile_path()
+    if path in _active_swaps():
+        return {"kind": "swapfile", "state": "present", "path": path}
+    try:
+        free = shutil.disk_usage(os.path.dirname(path)).free
+    except OSError:
+        free = 0
+    size = min(size, free - DISK_RESERVE)
+    if size < GIB:
+        return {"kind": "swapfile", "state": "skipped", "error": "not enough free disk"}
+    steps = (
+        ("fallocate", "-l", str(size), path),
+        ("chmod", "600", path),
+        ("mkswap", path),
+        ("swapon", "--priority", str(SWAPFILE_PRIORITY), path),
+    )
+    for cmd in steps:
+        if _sudo(*cmd, timeout=60, label=f"{cmd[0]} swapfile").returncode != 0:
+            _sudo("rm", "-f", path, label="rm swapfile")
+            return {"kind": "swapfile", "state": "failed", "step": cmd[0]}
+    return {"kind": "swapfile", "state": "enabled", "path": path, "size_mb": size // 1024 ** 2}
+
+
+def setup_swap(mode: str, mem_total: int) -> dict:
+    # Tops total swap up to min(RAM, 8G); runners already ship a small
+    # swapfile, so only the difference is added.
+    target = min(mem_total, MAX_SWAP)
+    existing = sysinfo.swap_total()
+    fallback = {}
+    if mode == "zram" or mode == "auto":
+        # zram is sized on its own: it becomes the first tier in front of
+        # whatever disk swap exists.
+        result = _setup_zram(target)
+        if result["state"] in ("enabled", "present") or mode == "zram":
+            return result
+        fallback = {"zram": result["state"]}
+    if existing >= target:
+        return {"kind": "swapfile", "state": "sufficient", "size_mb": existing // 1024 ** 2, **fallback}
+    return {**_setup_swapfile(target - existing), **fallback}
+
+
+def _parse_size(value: str, mem_total: int) -> str | None:
+    value = value.strip()
+    if value.endswith("%") and value[:-1].isdigit():
+        return f"{mem_total * int(value[:-1]) // 100 // 1024 ** 2}M"
+    if value[:-1].isdigit() and value[-1:].upper() in ("K", "M", "G"):
+        return value.upper()
+    return value if value.isdigit() else None
+
+
+def mount_workspace(size_spec: str, path: str, mem_total: int) -> dict:
+    size = _parse_size(size_spec, mem_total)
+    if size is None:
+        return {"state": "invalid", "size": size_spec}
+    if os.path.ismount(path):
+        return {"state": "present", "path": path}
+    os.makedirs(path, exist_ok=True)
+    proc = _sudo("mount", "-t", "tmpfs", "-o", f"size={size},mode=1777,noatime", "tmpfs", path, label="mount tmpfs")
+    if proc.returncode != 0:
+        return {"state": "failed", "path": path, "error": (proc.stderr or "").strip()[:160]}
+    return {"state": "mounted", "path": path, "size": size}
+
+
+def _read_oom_score_adj(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/oom_score_adj", encoding="utf-8") as fh:
+            return int(fh.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def protect_process(pid: int, score: int) -> int | None:
+    # Lowering the score needs CAP_SYS_RESOURCE, so an unprivileged write
+    # is tried first (enough when running as root) and then choom via sudo.
+    try:
+        with open(f"/proc/{pid}/oom_score_adj", "w", encoding="utf-8") as fh:
+            fh.write(str(score))
+    except OSError:
+        if shutil.which("choom"):
+            _sudo("choom", "-p", str(pid), "-n", str(score), timeout=5, label="choom")
+    return _read_oom_score_adj(pid)
+
+
+def apply() -> dict:
+    mode = tuning_mode()
+    started = time.monotonic()
+    before = snapshot()
+    report = {"mode": mode, "before": before}
+    if mode == "off":
+        return report
+    mem_total = sysinfo.memory()["total"]
+    with tracing.span("tuning.swap", mode=mode) as sp:
+        report["swap"] = setup_swap(mode, mem_total) if mem_total else {"state": "unknown memory"}
+        sp.set(kind=report["swap"].get("kind"), state=report["swap"].get("state"))
+    workspace = os.getenv("WORKSPACE_TMPFS", "").strip()
+    if workspace:
+        with tracing.span("tuning.workspace"):
+            path = os.path.expanduser(os.getenv("WORKSPACE_DIR") or "~/scratch")
+            report["workspace"] = mount_workspace(workspace, path, mem_total)
+    try:
+        score = int(os.getenv("AGENT_OOM_SCORE_ADJ", str(DEFAULT_OOM_SCORE_ADJ)))
+    except ValueError:
+        score = DEFAULT_OOM_SCORE_ADJ
+    # Only the agent is protected: xfce, RustDesk, tmate and the user's own
+    # programs get the score the agent started with. Set before lowering so
+    # no child spawned meanwhile slips through.
+    inherited = _read_oom_score_adj(os.getpid())
+    executor.set_child_oom_score_adj(0 if inherited is None else inherited)
+    report["oom_score_adj"] = protect_process(os.getpid(), max(-1000, min(1000, score)))
+    report["after"] = snapshot()
+    report["ms"] = round((time.monotonic() - started) * 1000, 1)
+    print(f"tuning: swap={report['swap']} workspace={report.get('workspace')} oom_score_adj={report['oom_score_adj']}")
+    return report
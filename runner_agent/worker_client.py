@@ -1,59 +1,60 @@
-import time
-import requests
+from .transport import BaseTransport, get_transport
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
 
 
 class WorkerClient:
-    def __init__(self, worker_url: str, bot_secret: str, chat_id: str, run_id: str | None):
+    def __init__(self, worker_url: str, bot_secret: str, chat_id: str, run_id: str | None, transport: BaseTransport | None = None):
         self.worker_url = worker_url.rstrip('/') if worker_url else ''
         self.bot_secret = bot_secret
         self.chat_id = chat_id
         self.run_id = run_id
-        self._last_heartbeat = 0.0
+        self.http = transport or get_transport()
+        self._caps: dict | None = None
 
-    def register_session(self) -> None:
+    def transport_stats(self) -> dict:
+        return self.http.stats()
+
+    def register_body(self) -> dict | None:
         if not (self.worker_url and self.run_id):
-            return
-        payload = {"chat_id": self.chat_id, "run_id": self.run_id, "secret": self.bot_secret}
-        requests.post(f"{self.worker_url}/register-session", json=payload, timeout=10)
+            return None
+        return {"chat_id": self.chat_id, "run_id": self.run_id, "secret": self.bot_secret}
 
-    def heartbeat(self, force: bool = False) -> None:
+    def heartbeat_body(self, metrics: dict | None = None, idle: dict | None = None) -> dict | None:
         if not (self.worker_url and self.run_id):
-            return
-        now = time.time()
-        if not force and now - self._last_heartbeat < 60:
-            return
-        requests.post(
-            f"{self.worker_url}/heartbeat",
-            json={"run_id": self.run_id, "secret": self.bot_secret},
-            timeout=5,
-        )
-        self._last_heartbeat = now
+            return None
+        body = {"run_id": self.run_id, "secret": self.bot_secret}
+        if metrics:
+            body["metrics"] = metrics
+        if idle:
+            body["idle"] = idle
+        return body
 
-    def stop_session(self) -> None:
+    def stop_body(self, summary: dict | None = None) -> dict | None:
         if not self.worker_url:
-            return
-        payload = {"chat_id": self.chat_id, "secret": self.bot_secret}
-        requests.post(f"{self.worker_url}/end-session", json=payload, timeout=5)
+            return None
+        body = {"chat_id": self.chat_id, "secret": self.bot_secret}
+        if summary:
+            body["summary"] = summary
+        return body
 
-    def poll_updates(self) -> dict:
+    def endpoint_body(self, payload: dict) -> dict | None:
         if not self.worker_url:
-            return {}
-        headers = {"X-Bot-Secret": self.bot_secret}
-        resp = requests.get(f"{self.worker_url}/get-updates?chat_id={self.chat_id}", headers=headers, timeout=10)
-        try:
-            return resp.json()
-        except Exception:
-            return {}
+            return None
+        return {"chat_id": self.chat_id, "run_id": self.run_id, "secret": self.bot_secret, **payload}
 
-    def send_session_endpoint(self, payload: dict) -> None:
+    def trace_body(self, trace: dict) -> dict | None:
         if not self.worker_url:
-            return
-        body = {"chat_id": self.chat_id, "run_id": self.run_id, "secret": self.bot_secret, **payload}
-        requests.post(f"{self.worker_url}/session-endpoint", json=body, timeout=10)
+            return None
+        return {"chat_id": self.chat_id, "run_id": self.run_id, "secret": self.bot_secret, "trace": trace}
 
-    def send_bot_message(self, text: str, reply_markup: dict | None = None) -> None:
+    def message_body(self, text: str, reply_markup: dict | None = None) -> dict | None:
         if not self.worker_url:
-            return
+            return None
         body = {
             "chat_id": self.chat_id,
             "run_id": self.run_id,
@@ -62,4 +63,83 @@ class WorkerClient:
         }
         if reply_markup:
             body["reply_markup"] = reply_markup
-        requests.post(f"{self.worker_url}/runner-message", json=body, timeout=10)
+        return body
+
+    def post_json(self, path: str, body: dict, idempotency_key: str | None = None, timeout: float = 10):
+        # Raises DeliveryError so queued senders can tell transient failures
+        # (network, 5xx, 429) from ones that retrying will never fix.
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        try:
+            resp = self.http.post(f"{self.worker_url}{path}", json=body, headers=headers, timeout=timeout, endpoint=path)
+        except Exception as exc:
+            raise DeliveryError(f"{path}: {exc}") from exc
+        if resp.status_code >= 500 or resp.status_code in (408, 429):
+            raise DeliveryError(f"{path}: HTTP {resp.status_code}")
+        if resp.status_code >= 400:
+            raise DeliveryError(f"{path}: HTTP {resp.status_code}", retryable=False)
+        return resp
+
+    def capabilities(self) -> dict:
+        if not self.worker_url:
+            return {}
+        headers = {"X-Bot-Secret": self.bot_secret}
+        resp = self.http.get(f"{self.worker_url}/capabilities?chat_id={self.chat_id}", headers=headers, timeout=5)
+        if resp.status_code != 200:
+            self._caps = {}
+            return {}
+        try:
+            data = resp.json()
+        except Exception:
+            data = {}
+        self._caps = data if isinstance(data, dict) else {}
+        return self._caps
+
+    def supports(self, feature: str) -> bool:
+        if self._caps is None:
+            try:
+                self.capabilities()
+            except Exception:
+                return False
+        return feature in (self._caps or {}).get("features", [])
+
+    def poll_updates(self, wait: int | None = None, ack: int | None = None) -> dict:
+        if not self.worker_url:
+            return {}
+        headers = {"X-Bot-Secret": self.bot_secret}
+        url = f"{self.worker_url}/get-updates?chat_id={self.chat_id}"
+        if ack is not None:
+            # Everything up to `ack` has been handled; the worker may drop it
+            # and re-sends anything newer that was not acknowledged yet.
+            url += f"&ack={int(ack)}"
+        timeout = 10
+        if wait:
+            # Long-poll: the worker holds the request until a command arrives
+            # or `wait` seconds pass, so the read timeout must outlast the hold.
+            url += f"&wait={int(wait)}"
+            timeout = wait + 10
+        resp = self.http.get(url, headers=headers, timeout=timeout)
+        try:
+            return resp.json()
+        except Exception:
+            return {}
+
+    def open_update_stream(self, idle_timeout: int, last_event_id: int | None = None):
+        if not self.worker_url:
+            return None
+        headers = {"X-Bot-Secret": self.bot_secret, "Accept": "text/event-stream"}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = str(last_event_id)
+        resp = self.http.get(
+            f"{self.worker_url}/updates-stream?chat_id={self.chat_id}",
+            headers=headers,
+            stream=True,
+            timeout=(10, idle_timeout),
+        )
+        if resp.status_code != 200:
+            resp.close()
+            raise RuntimeError(f"update stream rejected: HTTP {resp.status_code}")
+        return resp
+
+    def send_message_batch(self, messages: list[dict], idempotency_key: str | None = None) -> None:
+        body = {"chat_id": self.chat_id, "run_id": self.run_id, "secret": self.bot_secret, "messages": messages}
+        self.post_json("/runner-messages", body, idempotency_key=idempotency_key)
@@ -0,0 +1,196 @@
+import time
+import types
+
+import pytest
+
+from runner_agent import channel
+from runner_agent.bench.fake_worker import FakeWorker, FakeWorkerConfig
+from runner_agent.channel import CommandCursor, normalize_updates, open_channel
+from runner_agent.transport import StdlibTransport
+from runner_agent.worker_client import WorkerClient
+
+CHAT = "chat-1"
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    # NegotiatedChannel backs off 2s, 4s, ... between failures; the tests
+    # only care about the order of events, not the waiting.
+    monkeypatch.setattr(channel, "time", types.SimpleNamespace(monotonic=time.monotonic, sleep=lambda s: None))
+
+
+def make_worker(**config) -> FakeWorker:
+    config.setdefault("sse_ping_seconds", 0.2)
+    config.setdefault("max_hold_seconds", 1)
+    return FakeWorker(FakeWorkerConfig(**config)).start()
+
+
+def client_for(worker: FakeWorker) -> WorkerClient:
+    return WorkerClient(worker.url, "secret", CHAT, "run-1", transport=StdlibTransport())
+
+
+def drain(chan, want: int, timeout: float = 15.0) -> list[dict]:
+    got = []
+    deadline = time.monotonic() + timeout
+    while len(got) < want and time.monotonic() < deadline:
+        for item in chan.next_commands():
+            got.append(item)
+            chan.ack(item)
+    return got
+
+
+@pytest.mark.parametrize("channels,expected", [
+    ((), ["poll"]),
+    (("longpoll",), ["longpoll", "poll"]),
+    (("sse",), ["sse", "poll"]),
+    (("sse", "longpoll"), ["sse", "longpoll", "poll"]),
+])
+def test_open_channel_follows_advertised_channels(channels, expected):
+    worker = make_worker(channels=channels)
+    try:
+        chan = open_channel(client_for(worker), "auto", poll_seconds=0, hold_seconds=1)
+        assert [c.name for c in chan.channels] == expected
+        chan.close()
+    finally:
+        worker.stop()
+
+
+def test_forced_mode_is_limited_to_what_the_worker_offers():
+    worker = make_worker(channels=("longpoll",))
+    try:
+        assert open_channel(client_for(worker), "sse", 0, 1).name == "poll"
+        assert open_channel(client_for(worker), "longpoll", 0, 1).name == "longpoll"
+        assert [c.name for c in open_channel(client_for(worker), "poll", 0, 1).channels] == ["poll"]
+    finally:
+        worker.stop()
+
+
+@pytest.mark.parametrize("channels", [(), ("longpoll",), ("sse",), ("sse", "longpoll")])
+def test_every_command_arrives_once_despite_errors(channels, no_backoff):
+    worker = make_worker(channels=channels, error_rate=0.3, seed=7)
+    try:
+        chan = open_channel(client_for(worker), "auto", poll_seconds=0, hold_seconds=1)
+        for i in range(12):
+            worker.push_command(CHAT, "callback", f"cmd-{i}")
+        got = drain(chan, 12)
+        chan.close()
+    finally:
+        worker.stop()
+    assert [c["payload"] for c in got] == [f"cmd-{i}" for i in range(12)]
+    assert sum(worker.errors(CHAT).values()) > 0
+
+
+def test_falls_back_sse_then_longpoll_then_poll(no_backoff):
+    # The stream always answers 503 while polling works, so SSE is given up
+    # after max_failures; once the worker is unreachable long-poll fails too.
+    worker = make_worker(channels=("sse", "longpoll"), error_rate=1.0,
+                         error_exempt=("/capabilities", "/get-updates"))
+    client = client_for(worker)
+    chan = open_channel(client, "auto", poll_seconds=0, hold_seconds=1)
+    try:
+        assert chan.name == "sse"
+        for _ in range(chan.max_failures):
+            assert chan.next_commands() == []
+        assert chan.name == "longpoll"
+
+        worker.push_command(CHAT, "callback", "after-fallback")
+        assert [c["payload"] for c in drain(chan, 1)] == ["after-fallback"]
+    finally:
+        worker.stop()
+    # Pooled keep-alive connections would outlive the stopped server.
+    client.worker_url = "http://127.0.0.1:1"
+    for _ in range(chan.max_failures):
+        assert chan.next_commands() == []
+    assert chan.name == "poll"
+    # Short polling swallows its own errors: nothing left to fall back to.
+    assert chan.next_commands() == []
+    assert chan.name == "poll"
+
+
+def test_single_and_batched_response_shapes():
+    worker = make_worker(channels=("longpoll",))
+    client = client_for(worker)
+    try:
+        worker.push_command(CHAT, "callback", "one")
+        single = client.poll_updates(wait=1, ack=0)
+        assert "commands" not in single and single["payload"] == "one"
+
+        worker.push_command(CHAT, "callback", "two")
+        batch = client.poll_updates(wait=1, ack=0)
+        assert [c["payload"] for c in batch["commands"]] == ["one", "two"]
+
+        chan = open_channel(client, "auto", poll_seconds=0, hold_seconds=1)
+        assert [c["payload"] for c in drain(chan, 2)] == ["one", "two"]
+    finally:
+        worker.stop()
+
+
+def test_normalize_updates_shapes():
+    cmd = {"seq": 1, "command_type": "text", "payload": "/menu"}
+    assert normalize_updates(cmd) == [cmd]
+    assert normalize_updates({"commands": [cmd, {"seq": 2}]}) == [cmd]
+    assert normalize_updates([cmd, "junk"]) == [cmd]
+    assert normalize_updates({}) == []
+    assert normalize_updates({"error": "injected"}) == []
+    assert normalize_updates(None) == []
+
+
+def test_cursor_drops_redelivered_commands():
+    cursor = CommandCursor()
+    first = [{"seq": 2, "payload": "b"}, {"seq": 1, "payload": "a"}, {"seq": 1, "payload": "a"}]
+    fresh = cursor.fresh(first)
+    assert [c["seq"] for c in fresh] == [1, 2]
+    assert cursor.duplicates == 1
+    cursor.done(fresh[0])
+    assert [c["seq"] for c in cursor.fresh([{"seq": 1, "payload": "a"}, {"seq": 2, "payload": "b"}])] == [2]
+    legacy = [{"command_type": "text", "payload": "x"}]
+    assert cursor.fresh(legacy) == legacy
+
+
+def test_longpoll_ack_resends_unacknowledged():
+    worker = make_worker(channels=("longpoll",))
+    try:
+        chan = open_channel(client_for(worker), "auto", poll_seconds=0, hold_seconds=1)
+        worker.push_command(CHAT, "callback", "a")
+        # Nothing handled yet, so no ack: the worker treats this request
+        # like a legacy client and drops what it hands out.
+        first = chan.next_commands()
+        assert [c["payload"] for c in first] == ["a"]
+        chan.ack(first[0])
+
+        worker.push_command(CHAT, "callback", "b")
+        worker.push_command(CHAT, "callback", "c")
+        batch = chan.next_commands()
+        assert [c["payload"] for c in batch] == ["b", "c"]
+        chan.ack(batch[0])
+        # "c" was never acked, so the worker sends it again and the cursor
+        # passes it on because it was not handled yet.
+        again = chan.next_commands()
+        assert [c["payload"] for c in again] == ["c"]
+        chan.ack(again[0])
+        worker.push_command(CHAT, "callback", "d")
+        assert [c["payload"] for c in chan.next_commands()] == ["d"]
+        assert chan.cursor.duplicates == 0
+    finally:
+        worker.stop()
+
+
+def test_sse_reconnect_resumes_after_last_event_id():
+    worker = make_worker(channels=("sse",))
+    try:
+        chan = open_channel(client_for(worker), "auto", poll_seconds=0, hold_seconds=1)
+        assert chan.name == "sse"
+        worker.push_command(CHAT, "callback", "a")
+        worker.push_command(CHAT, "callback", "b")
+        got = drain(chan, 2)
+        assert [c["payload"] for c in got] == ["a", "b"]
+
+        # Drop the stream as a network blip would; the reconnect sends
+        # Last-Event-ID and must not replay "a" or "b".
+        chan.active.close()
+        worker.push_command(CHAT, "callback", "c")
+        assert [c["payload"] for c in drain(chan, 1)] == ["c"]
+        assert chan.cursor.duplicates == 0
+        chan.close()
+    finally:
+        worker.stop()
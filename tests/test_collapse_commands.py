@@ -0,0 +1,65 @@
+import pytest
+
+from runner_agent.app import RunnerAgentApp
+from runner_agent.bench.fake_runtime import FakeRuntime
+from runner_agent.config import Config
+from runner_agent.transport import StdlibTransport
+
+
+@pytest.fixture
+def app(tmp_path):
+    cfg = Config(
+        chat_id="chat-1",
+        worker_url="",
+        user_lang="en",
+        system_os="Linux",
+        run_id=None,
+        rustdesk_password="test1234",
+        runner_secret="secret",
+        requested_duration_minutes=60,
+        trace_path=str(tmp_path / "trace.json"),
+        state_path=None,
+        control_socket=None,
+    )
+    return RunnerAgentApp(cfg, runtime=FakeRuntime(), transport=StdlibTransport())
+
+
+def cb(payload: str) -> dict:
+    return {"command_type": "callback", "payload": payload}
+
+
+def payloads(commands: list[dict]) -> list[str]:
+    return [c["payload"] for c in commands]
+
+
+def test_single_command_passes_through(app):
+    assert app.collapse_commands([cb("info")]) == [cb("info")]
+
+
+def test_only_first_duration_pick_is_kept(app):
+    kept = app.collapse_commands([cb("time_60"), cb("time_120"), cb("time_360")])
+    assert payloads(kept) == ["time_60"]
+
+
+def test_extends_are_capped_by_remaining_room(app):
+    # 300 of 360 minutes picked: two 30m extends fit, a third reports the
+    # limit and the rest are dropped.
+    kept = app.collapse_commands([cb("time_300")] + [cb("extend")] * 5)
+    assert payloads(kept) == ["time_300", "extend", "extend", "extend"]
+
+
+def test_extend_room_follows_the_running_session(app):
+    app.state.set_duration(330)
+    kept = app.collapse_commands([cb("extend")] * 3)
+    assert payloads(kept) == ["extend", "extend"]
+
+
+def test_info_is_answered_once_at_the_end(app):
+    kept = app.collapse_commands([cb("info"), cb("time_60"), cb("info"), {"command_type": "text", "payload": "/menu"}])
+    assert payloads(kept) == ["time_60", "/menu", "info"]
+
+
+def test_kill_ends_the_batch_and_drops_info(app):
+    kept = app.collapse_commands([cb("info"), cb("extend"), cb("kill"), cb("extend")])
+    assert payloads(kept) == ["extend", "kill"]
+    assert app._command_stats == {"received": 4, "dropped_stale": 2}
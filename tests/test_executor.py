@@ -0,0 +1,38 @@
+import threading
+
+from runner_agent import executor
+from runner_agent.executor import default_label
+
+
+def test_default_label_hides_arguments():
+    assert default_label(["/usr/bin/rustdesk", "--password", "hunter2"]) == "rustdesk --password"
+    assert default_label(["sudo", "-n", "rustdesk", "--option", "key", "v"]) == "rustdesk --option"
+
+
+def test_default_label_skips_tmate_socket_flag():
+    assert default_label(["tmate", "-S", "/tmp/sock", "display", "-p", "x"]) == "tmate -p"
+
+
+def test_default_label_edge_cases():
+    assert default_label("xdpyinfo -display :1") == "xdpyinfo"
+    assert default_label(["sudo", "-n"]) == "?"
+    assert default_label(["Xvfb", ":1"]) == "Xvfb"
+
+
+def test_unrunnable_binary_is_a_127_record(tmp_path):
+    script = tmp_path / "not-executable"
+    script.write_text("#!/bin/sh\necho hi\n")
+    proc = executor.run([str(script)], timeout=5)
+    assert proc.returncode == executor.NOT_FOUND_RC
+    assert executor.run([str(tmp_path / "missing")], timeout=5).returncode == executor.NOT_FOUND_RC
+    with executor.cancel_scope(threading.Event()):
+        assert executor.run([str(script)], timeout=5).returncode == executor.NOT_FOUND_RC
+
+
+def test_retries_until_ok(tmp_path):
+    counter = tmp_path / "count"
+    cmd = ["sh", "-c", f'echo x >> "{counter}"; wc -l < "{counter}"']
+    proc = executor.run(cmd, timeout=5, retries=5, retry_delay=0.01, ok=lambda p: p.stdout.strip() == "3")
+    assert proc.stdout.strip() == "3"
+    proc = executor.run(cmd, timeout=5, retries=1, retry_delay=0.01, ok=lambda p: False)
+    assert proc.stdout.strip() == "5"
@@ -0,0 +1,59 @@
+from runner_agent import runtime
+from runner_agent.config import Config
+from runner_agent.idle import IdleMonitor
+
+
+def make_monitor(**kwargs) -> IdleMonitor:
+    monitor = IdleMonitor(idle_seconds=600, warn_seconds=120, **kwargs)
+    monitor._last_active = 0.0
+    return monitor
+
+
+def test_warns_once_then_shuts_down():
+    monitor = make_monitor()
+    assert monitor.observe({}, now=100) is None
+    assert monitor.observe({}, now=480) == "warn"
+    assert monitor.observe({}, now=500) is None
+    assert monitor.observe({}, now=600) == "shutdown"
+    assert monitor.warnings == 1
+
+
+def test_activity_after_warning_resumes():
+    monitor = make_monitor()
+    assert monitor.observe({}, now=500) == "warn"
+    assert monitor.observe({"rustdesk_peers": 1}, now=510) == "resumed"
+    assert monitor.idle_for(now=520) == 10
+    assert monitor.observe({"tmate_clients": 1}, now=530) is None
+
+
+def test_input_idle_counts_from_last_input():
+    monitor = make_monitor()
+    # Last keypress 100s before now=300: active at 200, not at 300.
+    assert monitor.observe({"input_idle_s": 100}, now=300) is None
+    assert monitor.idle_for(now=300) == 100
+    # An input time older than the last activity changes nothing.
+    assert monitor.observe({"input_idle_s": 250}, now=310) is None
+    assert monitor.idle_for(now=310) == 110
+
+
+def test_cpu_only_counts_with_a_threshold():
+    assert make_monitor().observe({"cpu": 95}, now=590) == "warn"
+    busy = make_monitor(cpu_percent=50)
+    assert busy.observe({"cpu": 95}, now=590) is None
+    assert busy.observe({"cpu": 10}, now=700) is None
+    assert busy.observe({"cpu": 10}, now=1190) == "shutdown"
+
+
+def test_peers_on_a_custom_relay_port_count(monkeypatch):
+    connections = [(True, 40000, 31117), (True, 40001, 21116), (False, 40002, 21117)]
+    monkeypatch.setattr(runtime.sysinfo, "tcp_connections", lambda: connections)
+    monkeypatch.setattr(runtime, "_process_running", lambda match: False)
+    assert runtime._rustdesk_peer_connections(31117) == 1
+    assert runtime._rustdesk_peer_connections(21117) == 0
+
+
+def test_idle_shutdown_is_opt_in(monkeypatch):
+    for name in ("IDLE_MINUTES", "IDLE_CPU_PERCENT"):
+        monkeypatch.delenv(name, raising=False)
+    cfg = Config.from_env()
+    assert cfg.idle_minutes == 0 and cfg.idle_cpu_percent > 0
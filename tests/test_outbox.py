@@ -0,0 +1,225 @@
+import asyncio
+import time
+
+from runner_agent.outbox import (
+    MAX_ATTEMPTS,
+    PRIORITY_CHAT,
+    PRIORITY_CONTROL,
+    PRIORITY_CRITICAL,
+    PRIORITY_HEARTBEAT,
+    Outbox,
+)
+from runner_agent.worker_client import DeliveryError
+
+
+class RecordingWorker:
+    # Duck-typed WorkerClient: records deliveries and fails the next
+    # `fail` calls with the given retryability.
+    def __init__(self, batch: bool = False):
+        self.batch = batch
+        self.posts: list[tuple[str, dict, str]] = []
+        self.batches: list[list[dict]] = []
+        self.fail = 0
+        self.retryable = True
+
+    def supports(self, feature: str) -> bool:
+        return self.batch and feature == "batch"
+
+    def _maybe_fail(self, path: str) -> None:
+        if self.fail:
+            self.fail -= 1
+            raise DeliveryError(f"{path}: HTTP 503", retryable=self.retryable)
+
+    def post_json(self, path, body, idempotency_key=None, timeout=10):
+        self._maybe_fail(path)
+        self.posts.append((path, body, idempotency_key))
+
+    def send_message_batch(self, messages, idempotency_key=None):
+        self._maybe_fail("/runner-messages")
+        self.batches.append(messages)
+
+
+def make_outbox(worker=None, **kwargs) -> Outbox:
+    kwargs.setdefault("base_backoff", 0.001)
+    kwargs.setdefault("max_backoff", 0.001)
+    return Outbox(worker or RecordingWorker(), **kwargs)
+
+
+def test_delivers_by_priority_then_fifo():
+    worker = RecordingWorker()
+    outbox = make_outbox(worker)
+    outbox.put("heartbeat", "/heartbeat", {"n": 0}, PRIORITY_HEARTBEAT)
+    outbox.put("message", "/runner-message", {"n": 1}, PRIORITY_CHAT)
+    outbox.put("message", "/runner-message", {"n": 2}, PRIORITY_CHAT)
+    outbox.put("endpoint", "/session-endpoint", {"n": 3}, PRIORITY_CRITICAL)
+    assert outbox.flush_sync(timeout=2)
+    assert [body["n"] for _, body, _ in worker.posts] == [3, 1, 2, 0]
+
+
+def test_consecutive_messages_share_one_batch():
+    worker = RecordingWorker(batch=True)
+    outbox = make_outbox(worker)
+    for n in range(3):
+        outbox.put("message", "/runner-message", {"n": n}, PRIORITY_CHAT)
+    outbox.send_pending()
+    assert [[m["n"] for m in batch] for batch in worker.batches] == [[0, 1, 2]]
+    assert all(m["idempotency_key"] for m in worker.batches[0])
+    assert outbox.metrics()["batches"] == 1
+
+
+def test_full_queue_evicts_newest_least_important():
+    outbox = make_outbox(max_items=3)
+    assert outbox.put("message", "/runner-message", {"n": 1}, PRIORITY_CHAT)
+    assert outbox.put("message", "/runner-message", {"n": 2}, PRIORITY_CHAT)
+    assert outbox.put("trace", "/session-trace", {"n": 3}, PRIORITY_CONTROL)
+    # Nothing less important than a chat message is queued: rejected.
+    assert not outbox.put("message", "/runner-message", {"n": 4}, PRIORITY_CHAT)
+    # A control item pushes out the newest chat message instead.
+    assert outbox.put("register", "/register-session", {"n": 5}, PRIORITY_CONTROL)
+    assert sorted(item.body["n"] for item in outbox._heap) == [1, 3, 5]
+    assert outbox.metrics()["dropped"] == 2
+
+
+def test_evicted_and_rejected_items_report_failure():
+    done = []
+    outbox = make_outbox(max_items=2)
+    outbox.put("endpoint", "/session-endpoint", {"n": 1}, PRIORITY_CRITICAL, on_done=lambda ok: done.append((1, ok)))
+    outbox.put("message", "/runner-message", {"n": 2}, PRIORITY_CHAT, on_done=lambda ok: done.append((2, ok)))
+    assert not outbox.put("message", "/runner-message", {"n": 3}, PRIORITY_CHAT, on_done=lambda ok: done.append((3, ok)))
+    outbox.put("endpoint", "/session-endpoint", {"n": 4}, PRIORITY_CRITICAL)
+    outbox.put("endpoint", "/session-endpoint", {"n": 5}, PRIORITY_CRITICAL)
+    assert done == [(3, False), (2, False), (1, False)]
+    assert outbox.metrics()["failed"] == 0
+
+
+def test_batch_key_covers_every_message():
+    worker = RecordingWorker(batch=True)
+    worker.fail = 1
+    outbox = make_outbox(worker)
+    keys = []
+    send = worker.send_message_batch
+    worker.send_message_batch = lambda messages, idempotency_key=None: (keys.append(idempotency_key), send(messages, idempotency_key))
+    for n in range(2):
+        outbox.put("message", "/runner-message", {"n": n}, PRIORITY_CHAT)
+    outbox.send_pending()
+    outbox.put("message", "/runner-message", {"n": 2}, PRIORITY_CHAT)
+    assert outbox.flush_sync(timeout=2)
+    # The retry carries a third message, so it must not reuse the first key.
+    assert [[m["n"] for m in batch] for batch in worker.batches] == [[0, 1, 2]]
+    assert len(set(keys)) == 2
+
+
+def test_critical_items_are_capped_too():
+    outbox = make_outbox(max_items=2)
+    assert outbox.put("message", "/runner-message", {"n": 1}, PRIORITY_CHAT)
+    assert outbox.put("endpoint", "/session-endpoint", {"n": 2}, PRIORITY_CRITICAL)
+    # The chat message makes room first, then the oldest critical item.
+    assert outbox.put("endpoint", "/session-endpoint", {"n": 3}, PRIORITY_CRITICAL)
+    assert outbox.put("stop", "/end-session", {"n": 4}, PRIORITY_CRITICAL)
+    assert sorted(item.body["n"] for item in outbox._heap) == [3, 4]
+    assert outbox.metrics()["dropped"] == 2
+
+
+def run_outbox(outbox: Outbox, feed) -> None:
+    async def main():
+        task = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0)
+        await feed()
+        assert await outbox.flush(timeout=5)
+        task.cancel()
+
+    asyncio.run(main())
+
+
+def test_lone_message_is_not_held_for_coalescing():
+    worker = RecordingWorker(batch=True)
+    outbox = make_outbox(worker, coalesce_seconds=1.0)
+
+    async def feed():
+        outbox.put("message", "/runner-message", {"n": 1}, PRIORITY_CHAT)
+
+    started = time.monotonic()
+    run_outbox(outbox, feed)
+    assert time.monotonic() - started < 0.5
+    assert [body["n"] for _, body, _ in worker.posts] == [1]
+
+
+def test_back_to_back_messages_are_coalesced():
+    worker = RecordingWorker(batch=True)
+    outbox = make_outbox(worker, coalesce_seconds=0.2)
+
+    async def feed():
+        for n in range(2):
+            outbox.put("message", "/runner-message", {"n": n}, PRIORITY_CHAT)
+        await asyncio.sleep(0.05)
+        outbox.put("message", "/runner-message", {"n": 2}, PRIORITY_CHAT)
+
+    run_outbox(outbox, feed)
+    assert [[m["n"] for m in batch] for batch in worker.batches] == [[0, 1, 2]]
+    assert worker.posts == []
+
+
+def test_replace_keeps_only_newest_of_a_kind():
+    worker = RecordingWorker()
+    outbox = make_outbox(worker)
+    for n in range(3):
+        outbox.put("heartbeat", "/heartbeat", {"n": n}, PRIORITY_HEARTBEAT, replace=True)
+    assert outbox.depth() == 1
+    assert outbox.flush_sync(timeout=2)
+    assert [body["n"] for _, body, _ in worker.posts] == [2]
+
+
+def test_retry_reuses_idempotency_key():
+    worker = RecordingWorker()
+    worker.fail = 2
+    done = []
+    outbox = make_outbox(worker)
+    outbox.put("endpoint", "/session-endpoint", {"id": "1"}, PRIORITY_CRITICAL, on_done=done.append)
+    key = outbox._heap[0].idempotency_key
+    assert outbox.flush_sync(timeout=2)
+    assert worker.posts == [("/session-endpoint", {"id": "1"}, key)]
+    assert done == [True]
+    metrics = outbox.metrics()
+    assert metrics["retries"] == 2 and metrics["delivered"] == 1
+
+
+def test_gives_up_after_max_attempts():
+    worker = RecordingWorker()
+    worker.fail = 100
+    done = []
+    outbox = make_outbox(worker)
+    outbox.put("message", "/runner-message", {"n": 1}, PRIORITY_CHAT, on_done=done.append)
+    assert outbox.flush_sync(timeout=2)
+    assert done == [False]
+    assert worker.fail == 100 - MAX_ATTEMPTS[PRIORITY_CHAT]
+
+
+def test_non_retryable_error_fails_at_once():
+    worker = RecordingWorker()
+    worker.fail, worker.retryable = 1, False
+    done = []
+    outbox = make_outbox(worker)
+    outbox.put("message", "/runner-message", {"n": 1}, PRIORITY_CHAT, on_done=done.append)
+    assert outbox.flush_sync(timeout=2)
+    assert done == [False]
+    assert outbox.metrics()["failed"] == 1
+
+
+def test_backing_off_message_holds_back_later_ones():
+    worker = RecordingWorker()
+    worker.fail = 1
+    outbox = make_outbox(worker, base_backoff=60, max_backoff=60)
+    outbox.put("message", "/runner-message", {"n": 1}, PRIORITY_CHAT)
+    outbox.send_pending()
+    outbox.put("message", "/runner-message", {"n": 2}, PRIORITY_CHAT)
+    outbox.send_pending()
+    # n=2 must not overtake n=1 while it waits out its backoff.
+    assert worker.posts == []
+    assert outbox.depth() == 2
+
+
+def test_rejects_missing_body():
+    # Body builders return None when the worker URL or run id is missing.
+    outbox = make_outbox()
+    assert not outbox.put("message", "/runner-message", None)
+    assert outbox.depth() == 0
@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+import pytest
+
+from runner_agent.provision import Artifact, ContentCache, parse_print_uris
+
+
+def test_parse_print_uris():
+    text = """Reading package lists...
+'http://archive.ubuntu.com/ubuntu/pool/main/x/xvfb_21.1_amd64.deb' xvfb_21.1_amd64.deb 861234 SHA256:ABCDEF0123
+'http://archive.ubuntu.com/ubuntu/pool/main/c/curl_8.5_amd64.deb' curl_8.5_amd64.deb 226000 MD5Sum:0a1b
+'file:/tmp/broken' only-two
+"""
+    assert parse_print_uris(text) == [
+        Artifact("http://archive.ubuntu.com/ubuntu/pool/main/x/xvfb_21.1_amd64.deb", "xvfb_21.1_amd64.deb", 861234, "sha256:abcdef0123"),
+        # "MD5Sum" is not a hashlib name, so the digest is learned on download.
+        Artifact("http://archive.ubuntu.com/ubuntu/pool/main/c/curl_8.5_amd64.deb", "curl_8.5_amd64.deb", 226000, None),
+    ]
+
+
+def test_parse_print_uris_nothing_to_fetch():
+    assert parse_print_uris("") == []
+    assert parse_print_uris("0 upgraded, 0 newly installed\n") == []
+
+
+def test_fetch_hits_the_cache_without_the_network(tmp_path):
+    source = tmp_path / "xvfb.deb"
+    source.write_bytes(b"deb payload")
+    url = source.as_uri()
+    cache = ContentCache(str(tmp_path / "cache"))
+    path, hit = cache.fetch(Artifact(url, "xvfb.deb"))
+    assert not hit and open(path, "rb").read() == b"deb payload"
+
+    # The source is gone: a fresh cache over the same directory (the next CI
+    # run) still finds the blob through the URL index.
+    source.unlink()
+    artifact = Artifact(url, "xvfb.deb")
+    again, hit = ContentCache(str(tmp_path / "cache")).fetch(artifact)
+    assert hit and again == path
+    assert artifact.digest == "sha256:" + hashlib.sha256(b"deb payload").hexdigest()
+
+
+def test_fetch_rejects_checksum_mismatch(tmp_path):
+    source = tmp_path / "curl.deb"
+    source.write_bytes(b"tampered")
+    cache = ContentCache(str(tmp_path / "cache"))
+    with pytest.raises(ValueError):
+        cache.fetch(Artifact(source.as_uri(), "curl.deb", digest="sha256:" + "0" * 64))
+    assert os.listdir(tmp_path / "cache" / "blobs") == []
+    assert cache.known_digest(source.as_uri()) is None
+
+
+def test_fingerprint_ignores_timings(tmp_path):
+    source = tmp_path / "a.deb"
+    source.write_bytes(b"a")
+    cache = ContentCache(str(tmp_path / "cache"))
+    empty = cache.fingerprint()
+    cache.save("timings.json", {"apt": 1.5})
+    assert cache.fingerprint() == empty
+    cache.fetch(Artifact(source.as_uri(), "a.deb"))
+    assert cache.fingerprint() != empty
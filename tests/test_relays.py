@@ -0,0 +1,51 @@
+from runner_agent.relays import BUILTIN_HOST, RelayServer, choose, parse_servers, relay_port, rustdesk_options
+
+
+def test_parse_servers():
+    servers = parse_servers(
+        f"{BUILTIN_HOST}, hbbs.example.org:21200;relay=hbbr.example.org;key=ABC=;probe=http://hbbs.example.org/4mb,"
+        " [2001:db8::1]:21116 ; relay=[2001:db8::2]:21300 ,,"
+    )
+    assert servers == [
+        RelayServer(BUILTIN_HOST),
+        RelayServer("hbbs.example.org", 21200, "hbbr.example.org", 21117, "ABC=", "http://hbbs.example.org/4mb"),
+        RelayServer("2001:db8::1", 21116, "2001:db8::2", 21300),
+    ]
+    assert servers[0].builtin and not servers[1].builtin
+    assert servers[1].relay == "hbbr.example.org:21117"
+
+
+def test_parse_servers_empty():
+    assert parse_servers("") == [] and parse_servers(None) == []
+
+
+def result(rtt, relay_rtt, mbps=None, reachable=True):
+    return {"rtt_ms": rtt, "relay_rtt_ms": relay_rtt, "mbps": mbps, "reachable": reachable}
+
+
+def test_choose_lowest_worst_leg():
+    a, b, c = RelayServer("a"), RelayServer("b"), RelayServer("c")
+    # b has the best rendezvous RTT but a slow relay leg.
+    assert choose([a, b, c], [result(20, 25), result(5, 60), result(None, None, reachable=False)]) is a
+
+
+def test_choose_prefers_fast_relays_but_keeps_slow_as_last_resort():
+    a, b = RelayServer("a"), RelayServer("b")
+    assert choose([a, b], [result(5, 5, mbps=1.0), result(30, 30, mbps=50.0)]) is b
+    assert choose([a, b], [result(5, 5, mbps=1.0), result(None, None, reachable=False)]) is a
+    assert choose([a], [result(None, None, reachable=False)]) is None
+
+
+def test_rustdesk_options():
+    assert rustdesk_options(RelayServer(BUILTIN_HOST)) == {}
+    assert rustdesk_options(RelayServer("hbbs.example.org", key="K")) == {
+        "custom-rendezvous-server": "hbbs.example.org:21116",
+        "relay-server": "hbbs.example.org:21117",
+        "key": "K",
+    }
+
+
+def test_relay_port_follows_the_chosen_server():
+    assert relay_port({}) == 21117
+    assert relay_port(None) == 21117
+    assert relay_port(rustdesk_options(RelayServer("hbbs.example.org", relay_port=31117, key="K"))) == 31117
@@ -0,0 +1,59 @@
+from runner_agent import rustdesk_config
+from runner_agent.rustdesk_config import parse_top_level
+
+
+def test_parse_top_level_stops_at_first_table():
+    text = """
+id = '123456789'
+password = "00abc=="
+salt = plain   # trailing comment
+enc_id = ''
+
+[options]
+id = 'not-this-one'
+"""
+    assert parse_top_level(text) == {"id": "123456789", "password": "00abc==", "salt": "plain", "enc_id": ""}
+
+
+def test_parse_top_level_ignores_noise():
+    assert parse_top_level("# comment\n\nnot a key\nkey_name = 42\n") == {"key_name": "42"}
+
+
+def scopes(tmp_path, monkeypatch, service_text: str, user_text: str, service_sudo: bool = False):
+    service, user = tmp_path / "service", tmp_path / "user"
+    service.mkdir()
+    user.mkdir()
+    (service / "RustDesk.toml").write_text(service_text)
+    (user / "RustDesk.toml").write_text(user_text)
+    monkeypatch.setattr(rustdesk_config, "config_dirs", lambda system_os: [(str(service), service_sudo), (str(user), False)])
+    return service / "RustDesk.toml"
+
+
+def test_user_scope_id_is_never_taken_for_the_service_one(tmp_path, monkeypatch):
+    scopes(tmp_path, monkeypatch, "enc_id = '00xyz'\n", "id = '987654321'\n")
+    assert rustdesk_config.read_config_id("Linux") is None
+    detection = rustdesk_config.wait_for_id("Linux", timeout=5, cli_fallback=lambda: "111222333", cli_grace=30)
+    assert detection.method == "cli" and detection.value == "111222333"
+
+
+def test_service_config_is_read_through_sudo_first(tmp_path, monkeypatch):
+    service = scopes(tmp_path, monkeypatch, "id = '123456789'\n", "id = '987654321'\n", service_sudo=True)
+    reads = []
+
+    def read_file(path, needs_sudo):
+        reads.append((path, needs_sudo))
+        return open(path).read()
+
+    monkeypatch.setattr(rustdesk_config, "_read_file", read_file)
+    assert rustdesk_config.read_config_id("Linux", include_sudo=False) is None
+    detection = rustdesk_config.wait_for_id("Linux", timeout=5)
+    assert (detection.method, detection.value, detection.path) == ("sudo-read", "123456789", str(service))
+    assert reads == [(str(service), True)]
+
+
+def test_wait_for_id_asks_cli_at_once_for_enc_id(tmp_path, monkeypatch):
+    (tmp_path / "RustDesk.toml").write_text("enc_id = '00xyz'\n")
+    monkeypatch.setattr(rustdesk_config, "config_dirs", lambda system_os: [(str(tmp_path), False)])
+    detection = rustdesk_config.wait_for_id("Linux", timeout=5, cli_fallback=lambda: "111222333", cli_grace=30)
+    assert detection.method == "cli" and detection.value == "111222333"
+    assert detection.seconds < 1
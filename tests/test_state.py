@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import time
+
+from runner_agent.app import RunnerAgentApp
+from runner_agent.bench.fake_runtime import FakeRuntime
+from runner_agent.config import Config
+from runner_agent.state import SNAPSHOT_VERSION, SessionState, load_snapshot, write_snapshot
+from runner_agent.transport import StdlibTransport
+
+
+def snapshot(**overrides) -> dict:
+    snap = {
+        "v": SNAPSHOT_VERSION,
+        "run_id": "42",
+        "active": True,
+        "started": True,
+        "start_time": time.time() - 600,
+        "duration": 60,
+        "endpoints": {"rustdesk_id": "123"},
+    }
+    snap.update(overrides)
+    return snap
+
+
+def test_round_trip(tmp_path):
+    state = SessionState()
+    state.set_duration(60)
+    state.mark_started()
+    state.set_endpoints("123", "pw", None, None)
+    path = str(tmp_path / "state.json")
+    assert write_snapshot(path, state.snapshot("42"))
+    restored = SessionState()
+    restored.restore(load_snapshot(path, "42"))
+    assert restored.endpoints() == state.endpoints()
+    assert restored.remaining_minutes() == state.remaining_minutes()
+
+
+def test_only_this_run_and_live_sessions_resume(tmp_path):
+    path = tmp_path / "state.json"
+    cases = [
+        (snapshot(), "42", True),
+        (snapshot(), "43", False),
+        (snapshot(), None, False),
+        (snapshot(v=SNAPSHOT_VERSION + 1), "42", False),
+        (snapshot(active=False), "42", False),
+        (snapshot(duration=0), "42", False),
+        (snapshot(start_time=time.time() - 3601), "42", False),
+    ]
+    for snap, run_id, resumable in cases:
+        path.write_text(json.dumps(snap))
+        assert (load_snapshot(str(path), run_id) is not None) is resumable, (snap, run_id)
+
+
+def test_unreadable_snapshot(tmp_path):
+    path = tmp_path / "state.json"
+    assert load_snapshot(str(path), "42") is None
+    path.write_text("{not json")
+    assert load_snapshot(str(path), "42") is None
+    path.write_text("[]")
+    assert load_snapshot(str(path), "42") is None
+
+
+def resume(tmp_path, runtime: FakeRuntime, snap: dict) -> tuple[RunnerAgentApp, bool]:
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps(snap))
+    cfg = Config(
+        chat_id="chat-1",
+        worker_url="",
+        user_lang="en",
+        system_os="Linux",
+        run_id="42",
+        rustdesk_password="test1234",
+        runner_secret="secret",
+        requested_duration_minutes=60,
+        trace_path=str(tmp_path / "trace.json"),
+        state_path=str(path),
+        control_socket=None,
+    )
+    app = RunnerAgentApp(cfg, runtime=runtime, transport=StdlibTransport())
+    return app, asyncio.run(app.resume_from_snapshot())
+
+
+def test_resume_probes_remote_access_off_the_loop(tmp_path):
+    runtime = FakeRuntime()
+    probes = []
+    check = runtime.check_remote_access
+    runtime.check_remote_access = lambda *args: (probes.append(threading.current_thread()), check(*args))[1]
+    app, resumed = resume(tmp_path, runtime, snapshot(endpoint_delivery="delivered"))
+    assert resumed
+    assert probes and probes[0] is not threading.main_thread()
+    assert app.state.endpoints()["rustdesk_id"] == "123"
+    assert app.state.session_started
+
+
+def test_resume_starts_fresh_without_rustdesk(tmp_path):
+    app, resumed = resume(tmp_path, FakeRuntime(alive=False), snapshot())
+    assert not resumed
+    assert not app.state.session_started
@@ -0,0 +1,60 @@
+import pytest
+
+from runner_agent import sysinfo
+
+PROC = {
+    "/proc/meminfo": "MemTotal:       16000000 kB\nMemFree:         1000000 kB\nMemAvailable:    4000000 kB\n"
+                     "SwapTotal:       2000000 kB\nSwapFree:        1500000 kB\nHugePages_Total:       0\n",
+    "/proc/stat": "cpu  100 0 100 700 100 0 0 0 0 0\ncpu0 50 0 50 350 50 0 0 0 0 0\n"
+                  "cpu1 50 0 50 350 50 0 0 0 0 0\nintr 12345\nbtime 1700000000\n",
+    "/proc/pressure/memory": "some avg10=1.50 avg60=0.75 avg300=0.10 total=12345\n"
+                             "full avg10=0.50 avg60=0.25 avg300=0.00 total=2345\n",
+    "/proc/diskstats": "   8       0 sda 100 0 2048 10 50 0 4096 20 0 30 30\n"
+                       "   8       1 sda1 100 0 2048 10 50 0 4096 20 0 30 30\n"
+                       "   7       0 loop0 9 0 999 0 0 0 0 0 0 0 0\n",
+    "/proc/net/dev": "Inter-|   Receive |  Transmit\n face |bytes packets|bytes packets\n"
+                     "    lo:  1000 10 0 0 0 0 0 0  1000 10 0 0 0 0 0 0\n"
+                     "  eth0: 50000 40 0 0 0 0 0 0 20000 30 0 0 0 0 0 0\n",
+    "/proc/net/tcp": "  sl  local_address rem_address   st\n"
+                     "   0: 0100007F:5274 00000000:0000 0A 00000000\n"
+                     "   1: 0100007F:5275 0100007F:D431 01 00000000\n",
+}
+
+
+@pytest.fixture
+def proc(monkeypatch):
+    def read(path):
+        if path not in PROC:
+            raise OSError(path)
+        return PROC[path]
+
+    monkeypatch.setattr(sysinfo, "_backend", "proc")
+    monkeypatch.setattr(sysinfo, "_read", read)
+    monkeypatch.setattr(sysinfo, "_block_devices", lambda: {"sda"})
+
+
+def test_memory_and_swap(proc):
+    assert sysinfo.memory() == {"total": 16000000 * 1024, "available": 4000000 * 1024, "percent": 75.0}
+    assert sysinfo.swap_total() == 2000000 * 1024
+    assert sysinfo.swap_percent() == 25.0
+
+
+def test_cpu_times(proc):
+    assert sysinfo._proc_cpu_times() == [(200.0, 1000.0), (100.0, 500.0), (100.0, 500.0)]
+
+
+def test_pressure(proc):
+    assert sysinfo.pressure("memory") == {"some_avg10": 1.5, "some_avg60": 0.75, "full_avg10": 0.5, "full_avg60": 0.25}
+    assert sysinfo.pressure("io") is None
+
+
+def test_disk_io_counts_whole_disks_only(proc):
+    assert sysinfo.disk_io() == (2048 * 512, 4096 * 512)
+
+
+def test_net_io(proc):
+    assert sysinfo.net_io() == (51000, 21000)
+
+
+def test_tcp_connections(proc):
+    assert sysinfo.tcp_connections() == [(False, 0x5274, None), (True, 0x5275, 0xD431)]
@@ -0,0 +1,78 @@
+import os
+import subprocess
+
+import pytest
+
+from runner_agent import executor, tuning
+from runner_agent.tuning import GIB, _parse_size
+
+
+@pytest.mark.parametrize("spec,expected", [
+    ("4G", "4G"),
+    ("512m", "512M"),
+    (" 100k ", "100K"),
+    ("1048576", "1048576"),
+    ("25%", "4096M"),
+    ("0%", "0M"),
+    ("", None),
+    ("4GB", None),
+    ("G", None),
+    ("x%", None),
+])
+def test_parse_size(spec, expected):
+    assert _parse_size(spec, 16 * GIB) == expected
+
+
+@pytest.fixture
+def own_score():
+    path = "/proc/self/oom_score_adj"
+    if not os.path.exists(path):
+        pytest.skip("no /proc oom_score_adj")
+    original = tuning._read_oom_score_adj(os.getpid())
+    yield original
+    executor.set_child_oom_score_adj(None)
+    with open(path, "w") as fh:
+        fh.write(str(original))
+
+
+def test_protection_reaches_the_agent_not_its_children(own_score, monkeypatch):
+    # A raised score works without privileges, so the test can run anywhere;
+    # what matters is that children get the original score back.
+    target = min(1000, own_score + 100)
+    monkeypatch.setenv("MEMORY_TUNING", "swapfile")
+    monkeypatch.setenv("AGENT_OOM_SCORE_ADJ", str(target))
+    monkeypatch.delenv("WORKSPACE_TMPFS", raising=False)
+    monkeypatch.setattr(tuning, "snapshot", lambda: {})
+    monkeypatch.setattr(tuning, "setup_swap", lambda mode, total: {"kind": "swapfile", "state": "sufficient"})
+    report = tuning.apply()
+    assert report["oom_score_adj"] == target
+    child = executor.run(["cat", "/proc/self/oom_score_adj"], timeout=5)
+    assert int(child.stdout) == own_score
+    spawned = executor.spawn(["sh", "-c", "cat /proc/self/oom_score_adj"], stdout=subprocess.PIPE, text=True)
+    assert int(spawned.communicate(timeout=5)[0]) == own_score
+
+
+def swap_env(monkeypatch, existing: int, zram: dict):
+    monkeypatch.setattr(tuning.sysinfo, "swap_total", lambda: existing)
+    monkeypatch.setattr(tuning, "_setup_zram", lambda size: {**zram, "size": size})
+    monkeypatch.setattr(tuning, "_setup_swapfile", lambda size: {"kind": "swapfile", "state": "enabled", "size": size})
+
+
+def test_auto_prefers_zram_sized_to_ram(monkeypatch):
+    swap_env(monkeypatch, existing=4 * GIB, zram={"kind": "zram", "state": "enabled"})
+    assert tuning.setup_swap("auto", 16 * GIB) == {"kind": "zram", "state": "enabled", "size": tuning.MAX_SWAP}
+
+
+def test_auto_falls_back_to_topping_up_the_swapfile(monkeypatch):
+    swap_env(monkeypatch, existing=4 * GIB, zram={"kind": "zram", "state": "unavailable"})
+    assert tuning.setup_swap("auto", 7 * GIB) == {"kind": "swapfile", "state": "enabled", "size": 3 * GIB, "zram": "unavailable"}
+
+
+def test_forced_zram_does_not_fall_back(monkeypatch):
+    swap_env(monkeypatch, existing=0, zram={"kind": "zram", "state": "failed"})
+    assert tuning.setup_swap("zram", 16 * GIB)["kind"] == "zram"
+
+
+def test_enough_swap_is_left_alone(monkeypatch):
+    swap_env(monkeypatch, existing=8 * GIB, zram={"kind": "zram", "state": "unavailable"})
+    assert tuning.setup_swap("swapfile", 16 * GIB) == {"kind": "swapfile", "state": "sufficient", "size_mb": 8192}
@@ -0,0 +1,50 @@
+import pytest
+
+from runner_agent.app import RunnerAgentApp
+from runner_agent.bench.fake_runtime import FakeRuntime
+from runner_agent.config import Config
+from runner_agent.transport import StdlibTransport
+
+
+@pytest.fixture
+def app(tmp_path):
+    cfg = Config(
+        chat_id="chat-1",
+        worker_url="",
+        user_lang="en",
+        system_os="Linux",
+        run_id=None,
+        rustdesk_password="test1234",
+        runner_secret="secret",
+        requested_duration_minutes=60,
+        trace_path=str(tmp_path / "trace.json"),
+        state_path=None,
+        control_socket=None,
+    )
+    return RunnerAgentApp(cfg, runtime=FakeRuntime(), transport=StdlibTransport())
+
+
+def tmate(ssh: str) -> dict:
+    return {"branch": "tmate", "tmate_ssh": ssh, "tmate_web": None}
+
+
+def test_abandoned_startup_updates_are_dropped(app):
+    warm = app._next_startup_generation()
+    app._on_startup_update(tmate("ssh warm-early"), warm)
+    assert len(app._early_updates) == 1
+
+    # The warm-up timed out: the fresh start discards what it buffered...
+    fresh = app._next_startup_generation()
+    assert app._early_updates == []
+    app.state.mark_started()
+    app.state.set_endpoints("123", "pw", None, None)
+    app._on_startup_update(tmate("ssh fresh"), fresh)
+    # ...and whatever it reports later.
+    app._on_startup_update(tmate("ssh warm-late"), warm)
+    assert app.state.endpoints()["tmate_ssh"] == "ssh fresh"
+
+
+def test_claimed_warmup_keeps_its_updates(app):
+    warm = app._next_startup_generation()
+    app._on_startup_update(tmate("ssh warm"), warm)
+    assert app._early_updates == [tmate("ssh warm")]